@@ -11,10 +11,14 @@ import logging.config as _logging_config
 import os as _os
 import sys as _sys
 import PIL as _pil
-from .ap_map_flow import DataField, FractureImageStack
+from .ap_map_flow import DataField, FractureImageStack, PackedImageStack
 from .ap_map_flow import _get_logger, set_main_logger_level
-from .ap_map_flow import files_from_directory, load_infile_list
+from .ap_map_flow import files_from_directory, load_infile_list, parallel_map
+from .ap_map_flow import iter_infile_list
 from .ap_map_flow import calc_percentile, calc_percentile_num, get_data_vect
+from .ap_map_flow import PercentileEngine
+from .map_io import enable_map_cache, disable_map_cache
+from .tiled_data_field import TiledDataField
 from . import data_processing
 from . import run_model
 from .run_model import DEFAULT_MODEL_PATH, DEFAULT_MODEL_NAME
@@ -10,15 +10,20 @@ Last Modifed: 2017/03/03
 #
 ########################################################################
 #
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import json
 import logging
 import os
 import re
-import subprocess
 import scipy as sp
 import numpy as np
 from PIL import Image
 from PIL.TiffImagePlugin import AppendingTiffWriter
 from scipy import sparse as sprs
+from .image_io import memmap_raw, memmap_tiff
+from .map_io import load_data_map, save_data_map, set_num_workers
 #
 ########################################################################
 #  Basic classes
@@ -30,22 +35,43 @@ class DataField(object):
     Base class to store raw data from a 2-D field data file and
     the output data generated by the different processing routines. Properties
     are used to easily maintain data integrity with the main _data_map
+
+    Derived data (cell interfaces, point data and the adjacency matrix) is
+    only calculated when first accessed and then cached. Assigning a new
+    _data_map or calling threshold_data clears the cache, if the data map is
+    modified in place clear_cache must be called manually.
     """
+    # class level defaults allow the cache to be cleared before __init__ runs
+    _data = None
+    _point_data = None
+    _point_data_derived = False
+    _cell_interfaces = None
+    _adjacency_matrix = None
 
     def __init__(self, field_data, **kwargs):
         super().__init__()
         self.infile = None
         self._data_map = None
-        self.point_data = None
-        self._cell_interfaces = None
         self.output_data = dict()
         self.field_name = kwargs.get('field_name', 'data')
         #
         if isinstance(field_data, str):
-            self._init_from_file(field_data, kwargs.get('delim', 'auto'))
+            self._init_from_file(field_data, kwargs.get('delim', 'auto'),
+                                 kwargs.get('num_threads'))
         elif field_data is not None:
             self._init_from_data(field_data)
 
+    @property
+    def _data_map(self):
+        r"""returns the raw data map"""
+        return self._data
+
+    @_data_map.setter
+    def _data_map(self, data_map):
+        r"""sets the raw data map and clears any derived data"""
+        self._data = data_map
+        self.clear_cache()
+
     @property
     def data_vector(self):
         r"""returns unraveled version of the data map"""
@@ -56,6 +82,37 @@ class DataField(object):
         r"""returns the data map"""
         return self._data_map
 
+    @property
+    def point_data(self):
+        r"""returns the point data, creating it from the data map if needed"""
+        if self._point_data is None and self._data_map is not None:
+            self.create_point_data()
+        return self._point_data
+
+    @point_data.setter
+    def point_data(self, point_data):
+        r"""
+        sets the point data, explicitly set point data is kept when the
+        cache is cleared
+        """
+        self._point_data = point_data
+        self._point_data_derived = False
+
+    @property
+    def cell_interfaces(self):
+        r"""returns the cell interface array used in the adjacency matrix"""
+        if self._cell_interfaces is None:
+            self._define_cell_interfaces()
+        return self._cell_interfaces
+
+    @property
+    def adjacency_matrix(self):
+        r"""returns the adjacency matrix weighted by the data map"""
+        if self._adjacency_matrix is None:
+            data = self.data_vector
+            self._adjacency_matrix = self.create_adjacency_matrix(data)
+        return self._adjacency_matrix
+
     @property
     def nx(self):
         r"""returns number of columns"""
@@ -66,87 +123,117 @@ class DataField(object):
         r"""returns number of rows"""
         return self._data_map.shape[0]
 
-    def _init_from_file(self, infile, delim):
+    def _init_from_file(self, infile, delim, num_threads=None):
         r"""
         Reads the field's infile data and then passes the data_map off
-        to the int_from_data method
+        to the int_from_data method. If the map cache is enabled the data map
+        may be a memory map of a previously parsed copy of the file.
         """
         #
-        if delim == 'auto':
-            with open(infile, 'r') as file:
-                line = file.readline()
-                #
-                pat = r'[-0-9.+eE]+([^-0-9.+eE]+)[-0-9.+eE]+'
-                match = re.search(pat, line)
-                delim = match.group(1).strip()
-                delim = None if not delim else delim
-        #
-        data_map = np.loadtxt(infile, delimiter=delim)
+        data_map = load_data_map(infile, delim=delim, num_threads=num_threads)
         #
         self.infile = infile
-        self._init_from_data(data_map)
+        self._init_from_data(data_map, copy=False)
 
-    def _init_from_data(self, data_map):
+    def _init_from_data(self, data_map, copy=True):
         r"""
         Populates the DataField attributes based on the supplied data_map
         """
-        self._data_map = np.copy(data_map)
-        #
-        # defining cell interfaces used in adjacency matrix
-        self._define_cell_interfaces()
+        self._data_map = np.copy(data_map) if copy else data_map
+
+    def clear_cache(self):
+        r"""
+        Removes derived data so it is recalculated from the current data map
+        the next time it is accessed.
+        """
+        self._cell_interfaces = None
+        self._adjacency_matrix = None
+        if self._point_data_derived:
+            self._point_data = None
+            self._point_data_derived = False
 
     def copy_data(self, obj):
         r"""
-        Copies data properites of the field onto another object. This method
-        can not be used to copy data to another DataField instance. Directly
-        instantiate the class using the data_map instead, for example:
+        Copies data properites of the field onto another object as read only
+        views, no data is copied so objects that need to modify the arrays
+        must copy them first, e.g. sp.sort(obj.data_vector) instead of
+        obj.data_vector.sort(). Views reflect later changes to the field's
+        data map. This method can not be used to copy data to another
+        DataField instance. Directly instantiate the class using the data_map
+        instead, for example:
             new_field = DataField(old_field.data_map)
         """
         obj.nx = self.nx
         obj.nz = self.nz
-        obj.data_map = np.copy(self.data_map)
-        obj.data_vector = np.copy(self.data_vector)
-        obj.point_data = np.copy(self.point_data)
+        obj.data_map = self._read_only_view(self.data_map)
+        obj.data_vector = self._read_only_view(sp.ravel(obj.data_map))
+        #
+        # point data is only shared if it already exists
+        point_data = self._point_data
+        if point_data is not None:
+            point_data = self._read_only_view(point_data)
+        obj.point_data = point_data
+
+    @staticmethod
+    def _read_only_view(array):
+        r"""
+        Returns a view of the array that can not be written to
+        """
+        view = array.view()
+        view.flags.writeable = False
+        return view
 
     def _define_cell_interfaces(self):
         r"""
-        Populates the cell_interfaces array
+        Populates the cell_interfaces array. Interfaces are ordered as the
+        right column, then each interior cell's right and top neighbors
+        and finally the top row.
         """
+        nx, nz = self.nx, self.nz
+        num_right = nz - 1
+        num_interior = (nz - 1) * (nx - 1)
+        num_top = nx - 1
+        #
+        # filling a single preallocated array avoids any temporary copies
+        num_ifaces = num_right + 2*num_interior + num_top
+        self._cell_interfaces = np.empty((num_ifaces, 2), dtype=int)
+        #
         # covering right column
-        self._cell_interfaces = []
-        for iz in range(self.nx-1, (self.nz-1)*self.nx, self.nx):
-            self._cell_interfaces.append([iz, iz+self.nx])
-
-        # covering interior cells
-        for iz in range(0, self.nz-1):
-            for ix in range(0, self.nx-1):
-                ib = iz*self.nx + ix
-                self._cell_interfaces.append([ib, ib+1])
-                self._cell_interfaces.append([ib, ib+self.nx])
-
-        # covering top row
-        for ix in range((self.nz-1)*self.nx, self.nz*self.nx-1):
-            self._cell_interfaces.append([ix, ix+1])
+        right = self._cell_interfaces[:num_right]
+        right[:, 0] = np.arange(nx-1, (nz-1)*nx, nx, dtype=int)
+        right[:, 1] = right[:, 0] + nx
         #
-        self._cell_interfaces = np.array(self._cell_interfaces,
-                                         ndmin=2,
-                                         dtype=int)
+        # covering interior cells, right and top neighbors are interleaved
+        end = num_right + 2*num_interior
+        interior = self._cell_interfaces[num_right:end].reshape(-1, 2, 2)
+        ib = interior[:, :, 0].reshape(nz-1, nx-1, 2)
+        ib[...] = np.arange(nz-1, dtype=int)[:, None, None] * nx
+        ib += np.arange(nx-1, dtype=int)[None, :, None]
+        interior[:, 0, 1] = interior[:, 0, 0] + 1
+        interior[:, 1, 1] = interior[:, 1, 0] + nx
+        #
+        # covering top row
+        top = self._cell_interfaces[end:]
+        top[:, 0] = np.arange((nz-1)*nx, nz*nx-1, dtype=int)
+        top[:, 1] = top[:, 0] + 1
 
     def create_adjacency_matrix(self, data=None):
         r"""
         Returns a weighted adjacency matrix, in CSR format based on the
-        product of weight values sharing an interface.
+        product of weight values sharing an interface. If data is not
+        supplied the cached adjacency_matrix of the data map is returned.
         """
         #
         if data is None:
-            data = self.data_vector
+            return self.adjacency_matrix
         #
-        weights = data[self._cell_interfaces[:, 0]]
-        weights = 2*weights * data[self._cell_interfaces[:, 1]]
+        cell_interfaces = self.cell_interfaces
+        weights = data[cell_interfaces[:, 0]]
+        weights = 2*weights * data[cell_interfaces[:, 1]]
         #
         # clearing any zero-weighted connections
         indices = weights > 0
-        interfaces = self._cell_interfaces[indices]
+        interfaces = cell_interfaces[indices]
         weights = weights[indices]
         #
         # getting cell connectivity info
@@ -164,61 +251,63 @@ class DataField(object):
         #
         return matrix.tocsr()
 
-    def create_point_data(self):
+    def create_point_data(self, dtype=float):
         r"""
-        The data_map attribute stores the cell data read in from file.
+        The data_map attribute stores the cell data read in from file. Point
+        data is stored as a 3-D array, see _cell_to_point_data for the
+        layout. Using dtype=np.float32 halves the memory required.
         """
         #
-        point_data = self._cell_to_point_data(self.data_map, self.nx, self.nz)
-        self.point_data = point_data
+        point_data = self._cell_to_point_data(self.data_map, self.nx, self.nz,
+                                              dtype=dtype)
+        self._point_data = point_data
+        self._point_data_derived = True
 
     @staticmethod
-    def _cell_to_point_data(data_map, nx, nz):
+    def _cell_to_point_data(data_map, nx, nz, out=None, dtype=None):
         r"""
         This function takes a cell data map and calculates average values
         at the corners to make a point data map. The Created array is 3-D with
         the final index corresponding to corners.
         Index Locations: 0 = BLC, 1 = BRC, 2 = TRC, 3 = TLC
+
+        Each corner value is the average of the cells sharing that vertex,
+        i.e. four in the interior, two along the edges and one at the corners.
+        An existing (nz, nx, 4) array can be supplied using the out argument
+        and dtype defaults to float unless out is supplied.
         """
         #
-        point_data = sp.zeros((nz+1, nx+1, 4))
-        #
-        # setting corners of map first
-        point_data[0, 0, 0] = data_map[0, 0]
-        point_data[0, -1, 1] = data_map[0, -1]
-        point_data[-1, -1, 2] = data_map[-1, -1]
-        point_data[-1, 0, 3] = data_map[-1, 0]
-        #
-        # calculating point values for the map interior
-        for iz in range(nz):
-            for ix in range(nx):
-                val = sp.average(data_map[iz:iz+2, ix:ix+2])
-                point_data[iz, ix, 2] = val
-                point_data[iz+1, ix+1, 0] = val
-                point_data[iz+1, ix, 1] = val
-                point_data[iz, ix+1, 3] = val
-        #
-        # handling left and right edges
-        for iz in range(nz):
-            val = sp.average(data_map[iz:iz+2, 0])
-            point_data[iz, 0, 3] = val
-            point_data[iz+1, 0, 0] = val
-            #
-            val = sp.average(data_map[iz:iz+2, -1])
-            point_data[iz, -1, 2] = val
-            point_data[iz+1, -1, 1] = val
-        #
-        # handling top and bottom edges
-        for ix in range(nx):
-            val = sp.average(data_map[0, ix:ix+2])
-            point_data[0, ix, 1] = val
-            point_data[0, ix+1, 0] = val
-            #
-            val = sp.average(data_map[-1, ix:ix+2])
-            point_data[-1, ix, 2] = val
-            point_data[-1, ix+1, 3] = val
-        #
-        return point_data[0:nz, 0:nx, :]
+        if out is None:
+            dtype = float if dtype is None else dtype
+            out = np.empty((nz, nx, 4), dtype=dtype)
+        elif out.shape != (nz, nx, 4):
+            msg = 'out array has shape {} but {} is required'
+            raise ValueError(msg.format(out.shape, (nz, nx, 4)))
+        dtype = out.dtype
+        #
+        # summing the four cells around each vertex of a zero padded map
+        padded = np.zeros((nz+2, nx+2), dtype=dtype)
+        padded[1:-1, 1:-1] = data_map
+        vertices = padded[:-1, :-1] + padded[:-1, 1:]
+        vertices += padded[1:, :-1]
+        vertices += padded[1:, 1:]
+        del padded
+        #
+        # dividing by the number of cells that touch each vertex
+        z_count = np.full(nz+1, 2, dtype=dtype)
+        z_count[[0, -1]] = 1
+        x_count = np.full(nx+1, 2, dtype=dtype)
+        x_count[[0, -1]] = 1
+        vertices /= z_count[:, None]
+        vertices /= x_count[None, :]
+        #
+        # mapping the vertices onto the corners of each cell
+        out[:, :, 0] = vertices[:-1, :-1]
+        out[:, :, 1] = vertices[:-1, 1:]
+        out[:, :, 2] = vertices[1:, 1:]
+        out[:, :, 3] = vertices[1:, :-1]
+        #
+        return out
 
     def threshold_data(self, min_value=None, max_value=None, repl=np.nan):
         r"""
@@ -232,6 +321,24 @@ class DataField(object):
         #
         if max_value is not None:
             self._data_map[self._data_map >= max_value] = repl
+        #
+        self.clear_cache()
+
+    def save(self, fname, fmt=None, overwrite=False, **kwargs):
+        r"""
+        Saves the data map under the desired filename. The format is one of
+        txt, npy, npz or raw and is determined from the file extension if
+        not given. Additional keyword arguments are passed on to
+        map_io.save_data_map.
+        """
+        #
+        # checking if file exists
+        if not overwrite and os.path.exists(fname):
+            msg = 'Error - there is already a file at ' + fname + '.'
+            msg += ' Specify "overwrite=True" to replace it'
+            raise FileExistsError(msg)
+        #
+        save_data_map(fname, self._data_map, fmt=fmt, **kwargs)
 
     def export_vtk(self,
                    filename=None,
@@ -292,9 +399,9 @@ class DataField(object):
         #
         # setting up y coordinate map
         y_coords = self._cell_to_point_data(y_values, self.nx, self.nz)
-        y_coords = y_coords * voxel_size
+        y_coords *= voxel_size
         y_offsets = self._cell_to_point_data(y_offsets, self.nx, self.nz)
-        y_offsets = y_offsets * voxel_size
+        y_offsets *= voxel_size
         #
         # writing points to VTK file
         fmt = '{:14.6E} {:14.6E} {:14.6E}\n'
@@ -354,7 +461,10 @@ class DataField(object):
 class FractureImageStack(np.ndarray):
     r"""
     Reads a 3-D image stack of the binary fracture data and stores it as
-    a scipy ndarray.
+    a scipy ndarray. Image files are read one frame at a time into a
+    preallocated array, iter_frames and reduce_frames can be used to work
+    with stacks too large to load at once. Uncompressed TIFF and raw stacks
+    can be opened without reading them using memmap.
     """
 
     def __new__(cls, image, dtype=bool, *args, **kwargs):
@@ -363,20 +473,12 @@ class FractureImageStack(np.ndarray):
         """
         #
         # either reads the image data from a file or image is a scipy array
-        try:
-            image = Image.open(image)
-            logger.debug('loaded image from file or file like object')
-            image_data = []
-            for frame in range(image.n_frames):
-                image.seek(frame)
-                frame = np.array(image, dtype=dtype).transpose()
-                image_data.append(frame)
-            #
-            # stacking frames into a single 3 dimensional array
-            image_data = sp.stack(image_data, axis=2)
-        except AttributeError:
+        if isinstance(image, (np.ndarray, list, tuple)):
             logger.debug('initialized image from data array')
             image_data = np.array(image, ndmin=3, dtype=dtype)
+        else:
+            image_data = cls.from_image_file(image, dtype=dtype)
+            logger.debug('loaded image from file or file like object')
         #
         # returning a conversion of regular ndarray into my sybclass
         return sp.asarray(image_data).view(cls)
@@ -391,10 +493,182 @@ class FractureImageStack(np.ndarray):
     ny = property(lambda self: self.shape[1])
     nz = property(lambda self: self.shape[2])
 
+    def __invert__(self):
+        r"""
+        Swaps the fracture and rock voxels, non-bool stacks such as memory
+        maps of raw pixel values return a bool stack that is True where the
+        pixels are zero.
+        """
+        if self.dtype == bool:
+            return super().__invert__()
+        return np.equal(self.view(np.ndarray), 0).view(type(self))
+
+    @staticmethod
+    def iter_frames(image, dtype=bool):
+        r"""
+        Yields each frame of a multi-frame image as an (nx, ny) array, only
+        a single frame is held in memory at a time. The image can be a
+        filename, a file like object, an open PIL image, a 3-D array or a
+        PackedImageStack. Uncompressed TIFF files are read directly from a
+        memory map instead of being decoded by PIL.
+        """
+        image, shape = FractureImageStack._open_image(image)
+        if not isinstance(image, Image.Image):
+            for frame in range(shape[2]):
+                yield np.asarray(image[:, :, frame], dtype=dtype)
+            return
+        #
+        for frame in range(image.n_frames):
+            image.seek(frame)
+            yield np.array(image, dtype=dtype).transpose()
+
+    @staticmethod
+    def _open_image(image):
+        r"""
+        Returns a 3-D array, PackedImageStack or open PIL image for the
+        image along with its (nx, ny, nz) shape. Filenames of uncompressed
+        TIFF stacks are memory mapped and other files opened with PIL.
+        """
+        if isinstance(image, (np.ndarray, PackedImageStack)):
+            return image, image.shape
+        #
+        if isinstance(image, str):
+            try:
+                image = memmap_tiff(image)
+                return image, image.shape
+            except ValueError:
+                pass
+        #
+        if not isinstance(image, Image.Image):
+            image = Image.open(image)
+        return image, image.size + (image.n_frames,)
+
+    @classmethod
+    def from_image_file(cls, image, dtype=bool, out=None):
+        r"""
+        Reads a multi-frame image by filling a preallocated (nx, ny, nz)
+        array one frame at a time, so loading only needs the memory of the
+        final array. An existing array, e.g. a memory map, can be supplied
+        as out to be filled instead. The image can be anything accepted by
+        iter_frames.
+        """
+        image, shape = cls._open_image(image)
+        #
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape:
+            msg = 'out has shape {} but the image has shape {}'
+            raise ValueError(msg.format(out.shape, shape))
+        #
+        for i, frame in enumerate(cls.iter_frames(image, dtype=dtype)):
+            out[:, :, i] = frame
+        #
+        return out.view(cls)
+
+    @classmethod
+    def memmap(cls, fname, shape=None, dtype=sp.uint8, offset=0, mode='r'):
+        r"""
+        Memory maps an uncompressed TIFF stack, or a headerless raw volume
+        of the given (nx, ny, nz) shape and dtype, without reading any data.
+        Frames are paged in as they are accessed. Voxels hold the raw pixel
+        values so fracture voxels are any nonzero value, iter_frames,
+        reduce_frames and extract_maps convert each frame to bool and
+        inverting the stack returns a bool stack of the zero pixels. See
+        apmapflow.image_io for the supported files, the mode is passed to
+        np.memmap.
+        """
+        if shape is None:
+            data = memmap_tiff(fname, mode=mode)
+        else:
+            data = memmap_raw(fname, shape, dtype=dtype, offset=offset,
+                              mode=mode)
+        #
+        return data.view(cls)
+
+    @classmethod
+    def reduce_frames(cls, image, func, dtype=bool):
+        r"""
+        Applies func to each (nx, ny) frame of a multi-frame image and
+        returns the results stacked as rows, e.g. summing along axis 1 of
+        each frame gives the aperture map without loading the whole stack.
+        """
+        return np.stack([func(frame) for frame in
+                         cls.iter_frames(image, dtype=dtype)])
+
+    @classmethod
+    def extract_maps(cls, image, invert=False, no_data_fill=0):
+        r"""
+        Reads the image one frame at a time and returns a dictionary of the
+        2-D maps of each X-Z column, only a single frame and the maps are
+        held in memory:
+            aperture - number of fracture voxels
+            offset - lowest fracture voxel, no_data_fill when there are none
+            top - highest fracture voxel, NaN when there are none
+            mid - mid-surface between the lowest and highest voxels
+            bifurcations - number of additional disconnected runs of fracture
+            voxels, i.e. 0 when all voxels in the column are contiguous
+        The aperture and offset maps match create_aperture_map and
+        create_offset_map. The image can be anything accepted by iter_frames.
+        """
+        image, shape = cls._open_image(image)
+        shape = (shape[2], shape[0])
+        #
+        maps = {
+            'aperture': np.zeros(shape, dtype=int),
+            'offset': np.zeros(shape, dtype=float),
+            'top': np.zeros(shape, dtype=float),
+            'mid': np.zeros(shape, dtype=float),
+            'bifurcations': np.zeros(shape, dtype=int)
+        }
+        for z_ind, frame in enumerate(cls.iter_frames(image, dtype=bool)):
+            if invert:
+                frame = ~frame
+            cls._frame_maps(frame, maps, z_ind, no_data_fill)
+        #
+        return maps
+
+    @staticmethod
+    def _frame_maps(frame, maps, z_ind, no_data_fill=0):
+        r"""
+        Fills row z_ind of each map in extract_maps from a single frame
+        """
+        ny = frame.shape[1]
+        aperture = np.count_nonzero(frame, axis=1)
+        empty = aperture == 0
+        #
+        # argmax returns the first True value along each column
+        bottom = np.argmax(frame, axis=1).astype(float)
+        top = ny - 1 - np.argmax(frame[:, ::-1], axis=1).astype(float)
+        bottom[empty] = np.nan
+        top[empty] = np.nan
+        #
+        # counting the start of each run of fracture voxels
+        starts = np.count_nonzero(frame[:, 1:] & ~frame[:, :-1], axis=1)
+        starts += frame[:, 0]
+        #
+        maps['aperture'][z_ind] = aperture
+        maps['offset'][z_ind] = np.where(empty, no_data_fill, bottom)
+        maps['top'][z_ind] = top
+        maps['mid'][z_ind] = (bottom + top) / 2.0
+        maps['bifurcations'][z_ind] = np.maximum(starts - 1, 0)
+
     def create_aperture_map(self, axis=1, dtype=int):
-        r""" Flattens the 3-D image data along the specified axis using
-        scipy.sum and returns a 2-D ndarray of the summed data"""
-        return sp.sum(self, axis=axis, dtype=dtype).view(sp.ndarray).T
+        r""" Flattens the 3-D image data along the specified axis by counting
+        the fracture (nonzero) voxels and returns a 2-D ndarray of the counts.
+        The stack is counted in blocks so non-bool stacks are never converted
+        all at once"""
+        axis = axis % self.ndim
+        block_axis = 1 if axis == 0 else 0
+        shape = [size for i, size in enumerate(self.shape) if i != axis]
+        aper_map = sp.empty(shape, dtype=dtype)
+        for block in self._row_blocks(axis=block_axis):
+            index = [slice(None)] * self.ndim
+            index[block_axis] = block
+            data = self[tuple(index)].view(np.ndarray)
+            del index[axis]
+            aper_map[tuple(index)] = np.count_nonzero(data, axis=axis)
+        #
+        return aper_map.T
 
     def create_offset_map(self, no_data_fill=0):
         r"""
@@ -403,25 +677,32 @@ class FractureImageStack(np.ndarray):
         Parameters:
             no_data_fill (numeric) - a value to use as the offset when a
             column has no fracture voxels, sp.nan or sp.inf can be used.
-        
-        **updated versions of scipy no longer have these functions, use numpy
+
+        The stack is processed in contiguous blocks of X rows, argmax of the
+        fracture mask along the y axis gives the first fracture voxel of
+        each column so no voxel coordinates are generated.
         """
-        # getting coordinates of all fracture voxels
-        x_c, y_c, z_c = self.get_fracture_voxels(coordinates=True)
-        #
-        # recreating 3-D array with y coordinate as data values
-        data = sp.ones(self.shape, dtype=sp.uint16)*sp.iinfo(sp.int16).max
-        data[x_c, y_c, z_c] = y_c
-        del x_c, y_c, z_c
-        #
-        # generating offset map from data
         offset_map = sp.zeros((self.nx, self.nz), dtype=float)
-        for z_ind in range(self.nz):
-            offset_map[:, z_ind] = sp.amin(data[:, :, z_ind], axis=1)
-            offset_map[:, z_ind][offset_map[:, z_ind] > self.ny] = no_data_fill
+        for rows in self._row_blocks():
+            mask = self[rows].view(np.ndarray)
+            if mask.dtype != bool:
+                mask = mask != 0
+            offsets = offset_map[rows]
+            offsets[...] = np.argmax(mask, axis=1)
+            offsets[~np.any(mask, axis=1)] = no_data_fill
         #
         return offset_map.T
 
+    def _row_blocks(self, block_size=2**24, axis=0):
+        r"""
+        Yields slices of an axis, x by default, covering about block_size
+        voxels each
+        """
+        length = self.shape[axis]
+        step = max(block_size // max(self.size // max(length, 1), 1), 1)
+        for start in range(0, length, step):
+            yield slice(start, min(start + step, length))
+
     def get_fracture_voxels(self, coordinates=False):
         r"""
         Returns a vector or vectors containing all fracture voxels in
@@ -442,6 +723,14 @@ class FractureImageStack(np.ndarray):
     def save_image_stack(fname, image_data, overwrite=False):
         r""" Saves a multi-frame image using supplied image data,
         using Image.save from the PIL library"""
+        frames = (image_data[:, :, frame] for frame in
+                  range(image_data.shape[2]))
+        FractureImageStack.save_frames(fname, frames, overwrite=overwrite)
+
+    @staticmethod
+    def save_frames(fname, frames, overwrite=False):
+        r""" Saves a multi-frame image from an iterable of (nx, ny) frames
+        so only a single frame needs to be in memory"""
         #
         # checking if file exists
         if not overwrite and os.path.exists(fname):
@@ -449,11 +738,11 @@ class FractureImageStack(np.ndarray):
             msg += ' Specify "overwrite=True" to replace it'
             raise FileExistsError(msg)
         #
-        # generating an array from each z-axis slice
+        # generating an image from each z-axis slice
         with open(fname, 'w+b') as fp:
             with AppendingTiffWriter(fp) as tf:
-                for frame in range(image_data.shape[2]):
-                    frame = Image.fromarray(image_data[:, :, frame].T)
+                for frame in frames:
+                    frame = Image.fromarray(frame.T)
                     frame.save(tf, format='TIFF', filename=fname)
                     tf.newFrame()
 
@@ -470,6 +759,301 @@ class FractureImageStack(np.ndarray):
         self.save_image_stack(fname, img_data, overwrite=overwrite)
 
 
+class PackedImageStack(object):
+    r"""
+    Stores a binary 3-D image stack with each voxel as a single bit, using
+    an eighth of the memory of a FractureImageStack. Each X-Y frame is
+    packed along the y axis, so the aperture of an X-Z column is the count
+    of the set bits in its bytes and no unpacking is required. Frames are
+    unpacked on the fly when the stack is indexed with integers and
+    slices, e.g. stack[:, :, 10] returns the bool array of frame 10.
+    Indexing with three integer arrays returns the value of each voxel.
+
+    Parameters
+    ----------
+    frames : ndarray
+        uint8 array of shape (nz, nx, ceil(ny / 8)) holding the packed frames
+    ny : int
+        size of the y axis before packing
+    """
+    # number of set bits in each possible byte value
+    _POPCOUNT = np.array([bin(i).count('1') for i in range(256)],
+                         dtype=np.uint8)
+
+    def __init__(self, frames, ny):
+        super().__init__()
+        self.frames = frames
+        self.ny = int(ny)
+        self.nz, self.nx = frames.shape[0:2]
+        #
+        # setting the type of integer that fits the flattened array index
+        size = self.nx * self.ny * self.nz
+        itype = sp.uint32 if (size < sp.iinfo(sp.uint32).max) else sp.uint
+        self.index_int_type = itype
+
+    shape = property(lambda self: (self.nx, self.ny, self.nz))
+    nbytes = property(lambda self: self.frames.nbytes)
+
+    @classmethod
+    def from_array(cls, image_data):
+        r"""
+        Packs a 3-D array of (nx, ny, nz) voxels, fracture voxels are truthy
+        """
+        frames = cls._allocate(image_data.shape)
+        for z_ind, frame in enumerate(
+                FractureImageStack.iter_frames(image_data, dtype=bool)):
+            frames[z_ind] = np.packbits(frame, axis=1)
+        #
+        return cls(frames, image_data.shape[1])
+
+    @classmethod
+    def from_image_file(cls, image, invert=False):
+        r"""
+        Reads a multi-frame image one frame at a time, packing each frame as
+        it is read so loading only needs the memory of the packed stack.
+        """
+        image, shape = FractureImageStack._open_image(image)
+        #
+        frames = cls._allocate(shape)
+        for z_ind, frame in enumerate(FractureImageStack.iter_frames(image)):
+            if invert:
+                frame = ~frame
+            frames[z_ind] = np.packbits(frame, axis=1)
+        #
+        return cls(frames, shape[1])
+
+    @classmethod
+    def from_voxels(cls, voxels, shape):
+        r"""
+        Creates a stack of the given (nx, ny, nz) shape where the voxels at
+        the flattened indices are set
+        """
+        frames = cls._allocate(shape)
+        x_c, y_c, z_c = sp.unravel_index(voxels, shape)
+        bits = (0x80 >> (y_c % 8)).astype(np.uint8)
+        np.bitwise_or.at(frames, (z_c, x_c, y_c // 8), bits)
+        #
+        return cls(frames, shape[1])
+
+    @staticmethod
+    def _allocate(shape):
+        r"""
+        Returns an empty array of packed frames for an (nx, ny, nz) shape
+        """
+        nx, ny, nz = shape
+        return np.zeros((nz, nx, (ny + 7) // 8), dtype=np.uint8)
+
+    def __getitem__(self, key):
+        r"""
+        Unpacks the voxels selected by integers and slices, or returns the
+        value of each voxel when indexed by three integer arrays
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            ind = [k is Ellipsis for k in key].index(True)
+            fill = (slice(None),) * (4 - len(key))
+            key = key[:ind] + fill + key[ind+1:]
+        key = key + (slice(None),) * (3 - len(key))
+        key_x, key_y, key_z = key
+        #
+        if all(isinstance(k, (np.ndarray, list)) for k in key):
+            x_c, y_c, z_c = [np.asarray(k, dtype=int) for k in key]
+            y_c = np.where(y_c < 0, y_c + self.ny, y_c)
+            bytes_ = self.frames[z_c, x_c, y_c // 8]
+            return ((bytes_ >> (7 - y_c % 8)) & 1).astype(bool)
+        #
+        for k in key:
+            if not isinstance(k, (int, np.integer, slice)):
+                msg = 'only integers, slices or three integer arrays are '
+                msg += 'valid indices'
+                raise IndexError(msg)
+        #
+        # packed data is indexed as (z, x) with the packed y axis last
+        packed = self.frames[key_z, key_x]
+        data = np.unpackbits(packed, axis=-1, count=self.ny).astype(bool)
+        data = data[..., key_y]
+        #
+        # moving the z axis from first to last to return x, y, z order
+        if isinstance(key_z, slice):
+            data = np.moveaxis(data, 0, -1)
+        #
+        return data
+
+    def __invert__(self):
+        r"""
+        Returns a new stack with every voxel flipped
+        """
+        frames = np.invert(self.frames)
+        pad = frames.shape[2] * 8 - self.ny
+        if pad:
+            frames[:, :, -1] &= (0xFF << pad) & 0xFF
+        #
+        return type(self)(frames, self.ny)
+
+    def iter_frames(self):
+        r"""
+        Yields each unpacked (nx, ny) frame of the stack
+        """
+        for z_ind in range(self.nz):
+            yield self[:, :, z_ind]
+
+    def unpack(self):
+        r"""
+        Returns the full stack as a boolean FractureImageStack
+        """
+        image_data = np.empty(self.shape, dtype=bool)
+        for z_ind, frame in enumerate(self.iter_frames()):
+            image_data[:, :, z_ind] = frame
+        #
+        return image_data.view(FractureImageStack)
+
+    def create_aperture_map(self, dtype=int):
+        r"""
+        Returns the 2-D map of the number of fracture voxels in each X-Z
+        column, counting the set bits of the packed frames
+        """
+        aper_map = np.zeros((self.nz, self.nx), dtype=dtype)
+        for z_ind, frame in enumerate(self.frames):
+            aper_map[z_ind] = self._POPCOUNT[frame].sum(axis=1, dtype=dtype)
+        #
+        return aper_map
+
+    def create_offset_map(self, no_data_fill=0):
+        r"""
+        Creates an offset map by storing the lowest voxel in each X-Z
+        column, no_data_fill is used for columns with no fracture voxels
+        """
+        offset_map = np.zeros((self.nz, self.nx), dtype=float)
+        for z_ind, frame in enumerate(self.iter_frames()):
+            offset_map[z_ind] = np.argmax(frame, axis=1)
+            offset_map[z_ind][~frame.any(axis=1)] = no_data_fill
+        #
+        return offset_map
+
+    def get_fracture_voxels(self, coordinates=False):
+        r"""
+        Returns the sorted flattened indices of the fracture voxels or their
+        X, Y and Z coordinates, matching FractureImageStack
+        """
+        itype = self.index_int_type
+        voxels = []
+        for z_ind, frame in enumerate(self.iter_frames()):
+            x_c, y_c = np.nonzero(frame)
+            locs = (x_c.astype(itype) * self.ny + y_c) * self.nz + z_ind
+            voxels.append(locs.astype(itype))
+        voxels = np.sort(np.concatenate(voxels))
+        logger.debug('{} non-zero voxels in image'.format(voxels.size))
+        #
+        if coordinates:
+            return sp.unravel_index(voxels, self.shape)
+        else:
+            return voxels
+
+    def save(self, fname, overwrite=False):
+        r"""
+        Saves the stack as a multiframe 8 bit grey scale tiff, frames are
+        unpacked one at a time
+        """
+        frames = (frame.astype(np.uint8) * 255 for frame in self.iter_frames())
+        FractureImageStack.save_frames(fname, frames, overwrite=overwrite)
+
+
+class PercentileEngine(object):
+    r"""
+    Calculates percentiles of a dataset using a single sorted copy of the
+    data which is reused for every query. The percentile is defined as the
+    first value in the sorted data at or above perc percent of the values.
+    The inverse, the percentile rank of a value, is the fraction of the data
+    below it. Data is sorted when the first set of percentiles or ranks is
+    requested, single queries on unsorted data avoid the sort entirely.
+
+    Parameters
+    ----------
+    data : array_like
+        dataset to calculate percentiles of, it is never modified.
+    presorted : bool, optional
+        set to True if the data is already sorted in ascending order.
+    """
+    def __init__(self, data, presorted=False):
+        super().__init__()
+        self._data = np.ravel(data)
+        self._sorted = presorted
+
+    @property
+    def num_vals(self):
+        r"""returns the number of values in the dataset"""
+        return self._data.size
+
+    @property
+    def sorted_data(self):
+        r"""returns the sorted data, sorting it on first access"""
+        if not self._sorted:
+            self._data = np.sort(self._data)
+            self._sorted = True
+        return self._data
+
+    @staticmethod
+    def indices(percs, num_vals):
+        r"""
+        Returns the index of each percentile in a sorted dataset of num_vals
+        values. The index is the smallest i where i/num_vals*100 >= perc or
+        the last index if no such value exists.
+        """
+        percs = np.asarray(percs, dtype=float)
+        shape = percs.shape
+        percs = np.atleast_1d(percs)
+        tot_vals = float(num_vals)
+        #
+        # estimating the index and then correcting for round off
+        inds = np.ceil(percs / 100.0 * tot_vals)
+        inds = np.clip(np.nan_to_num(inds, nan=tot_vals), 0, tot_vals)
+        inds = inds.astype(np.int64)
+        lower = (inds > 0) & ((inds - 1) / tot_vals * 100.0 >= percs)
+        inds[lower] -= 1
+        upper = (inds < num_vals) & (inds / tot_vals * 100.0 < percs)
+        inds[upper] += 1
+        #
+        return np.minimum(inds, num_vals - 1).reshape(shape)
+
+    def percentiles(self, percs):
+        r"""
+        Returns an array with the value of each percentile in percs
+        """
+        inds = self.indices(percs, self.num_vals)
+        return self.sorted_data[inds]
+
+    def percentile(self, perc):
+        r"""
+        Returns the value of a single percentile
+        """
+        index = self.indices(perc, self.num_vals)
+        if self._sorted:
+            return self._data[index]
+        # avoiding a full sort of the data for a single value
+        return np.partition(self._data, index)[index]
+
+    def ranks(self, values, last=False):
+        r"""
+        Returns an array with the fraction of the data that is less than each
+        value. If last is True values equal to each value are also counted,
+        i.e. the rank of the last occurrence instead of the first.
+        """
+        side = 'right' if last else 'left'
+        counts = np.searchsorted(self.sorted_data, values, side=side)
+        return counts / float(self.num_vals)
+
+    def rank(self, value, last=False):
+        r"""
+        Returns the fraction of the data less than (or equal to if last is
+        True) a single value
+        """
+        if self._sorted:
+            return self.ranks(value, last=last)
+        # counting is faster than sorting for a single value
+        mask = self._data <= value if last else self._data < value
+        return np.count_nonzero(mask) / float(self.num_vals)
+
 #
 ########################################################################
 #  Basic functions
@@ -502,12 +1086,23 @@ def set_main_logger_level(level_name):
         main_logger.setLevel(level_name)
 
 
-def files_from_directory(directory='.', pattern='.', deep=True):
+def files_from_directory(directory='.', pattern='.', deep=True, workers=1,
+                         index_file=None):
     r"""
     Allows the user to get a list of files in the supplied directory
     matching a regex pattern. If deep is set to True then any
     sub-directories found will also be searched. A pre-compiled pattern
-    can be supplied instead of a string.
+    can be supplied instead of a string. Hidden files and directories are
+    skipped.
+
+    Directories on the same level are scanned concurrently when workers is
+    greater than one. If an index_file is supplied the contents of each
+    directory are stored in it as JSON keyed by the directory's
+    modification time, so later scans only re-read directories that have
+    changed. Entries of deleted directories and of directories under the
+    searched one that were not visited are removed when the index is saved.
+    Symbolic links to directories are followed but each directory is only
+    searched once, so links pointing back up the tree do not cause a loop.
     """
     #
     # setting up pattern
@@ -521,97 +1116,246 @@ def files_from_directory(directory='.', pattern='.', deep=True):
     except (ValueError, TypeError):
         logger.info('Using user compiled pattern: %s', pattern)
     #
-    # initializing
-    dirs = [directory]
+    index = _load_directory_index(index_file)
+    scan_directory = partial(_scan_directory, index=index)
+    #
+    # searching the tree one level at a time to keep a breadth first order
+    root = os.path.realpath(directory)
+    dirs = [root]
     files = []
-    while dirs:
-        #
-        directory = dirs.pop(0)
-        cmd_arr = ['ls', directory]
-        ls = subprocess.Popen(cmd_arr,
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE,
-                              universal_newlines=True)
-        std_out, std_err = ls.communicate()
-        content_arr = std_out.split('\n')
-        content_arr = [c.strip() for c in content_arr if c.strip()]
-        #
-        for path in content_arr:
-            pth = os.path.join(directory, path)
-            pth = os.path.realpath(pth)
-            if os.path.isdir(pth) and deep:
-                dirs.append(str(pth))
-            elif os.path.isfile(pth) and pattern.search(pth):
-                files.append(pth)
+    visited = {root}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        while dirs:
+            level = dirs
+            dirs = []
+            for sub_dirs, dir_files in executor.map(scan_directory, level):
+                if deep:
+                    # sub-directories are real paths so links are resolved
+                    sub_dirs = [pth for pth in sub_dirs if pth not in visited]
+                    visited.update(sub_dirs)
+                    dirs += sub_dirs
+                files += [pth for pth in dir_files if pattern.search(pth)]
+    #
+    if index_file is not None:
+        _prune_directory_index(index, root, visited, deep)
+        _save_directory_index(index_file, index)
     #
     return files
 
 
-def load_infile_list(infile_list, delim='auto'):
+def _scan_directory(directory, index=None):
+    r"""
+    Returns sorted lists of the sub-directories and files in a directory
+    as real paths. The directory is only read if its entry in the index is
+    missing or out of date.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+        if index is not None and directory in index:
+            entry = index[directory]
+            if entry[0] == mtime:
+                return entry[1], entry[2]
+        #
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+    except OSError as err:
+        logger.warning('Unable to read directory: %s', err)
+        return [], []
+    #
+    dirs = []
+    files = []
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            if entry.is_dir():
+                dirs.append(os.path.realpath(entry.path))
+            elif entry.is_file():
+                files.append(os.path.realpath(entry.path))
+        except OSError:
+            continue
+    #
+    if index is not None:
+        index[directory] = [mtime, dirs, files]
+    #
+    return dirs, files
+
+
+def _load_directory_index(index_file):
+    r"""
+    Reads a directory index written by files_from_directory
+    """
+    if index_file is None:
+        return None
+    #
+    try:
+        with open(index_file) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        logger.debug('Creating new directory index: %s', index_file)
+        return {}
+
+
+def _prune_directory_index(index, root, visited, deep):
+    r"""
+    Removes index entries that were not visited by a scan of root and are
+    either below root, for a deep scan, or no longer exist. Entries of other
+    directory trees sharing the index are kept.
+    """
+    root_prefix = os.path.join(root, '')
+    for directory in list(index):
+        if directory in visited:
+            continue
+        if deep and directory.startswith(root_prefix):
+            del index[directory]
+        elif not os.path.isdir(directory):
+            del index[directory]
+
+
+def _save_directory_index(index_file, index):
+    r"""
+    Writes the directory index to a temporary file and then moves it into
+    place so an interrupted write never leaves a partial index.
+    """
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump(index, file)
+    os.replace(tmp_file, index_file)
+
+
+def parallel_map(func, items, workers=1, max_pending=None):
     r"""
-    Function to generate a list of DataField objects from a list of input files
+    Generator that applies func to each item and yields the results in the
+    order of the items. When workers is greater than one the calls are made
+    in a pool of worker processes, so func must be picklable, and at most
+    max_pending results (default: 2 * workers) are held at any time. A
+    value of None uses one worker per CPU, the threads used to parse text
+    maps are divided between the workers. Errors are logged along with the
+    item that caused them and then re-raised.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    #
+    if workers <= 1:
+        for item in items:
+            try:
+                result = func(item)
+            except Exception:
+                logger.error('Error processing: %s', item)
+                raise
+            yield result
+        return
+    #
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=set_num_workers,
+                                   initargs=(workers,))
+    with executor:
+        try:
+            for item in items:
+                pending.append((item, executor.submit(func, item)))
+                if len(pending) >= max_pending:
+                    yield _pop_result(pending)
+            while pending:
+                yield _pop_result(pending)
+        finally:
+            for item, future in pending:
+                future.cancel()
+
+
+def _pop_result(pending):
+    r"""
+    Waits for and returns the result of the oldest pending future
+    """
+    item, future = pending.popleft()
+    try:
+        return future.result()
+    except Exception:
+        logger.error('Error processing: %s', item)
+        raise
+
+
+def load_infile_list(infile_list, delim='auto', num_threads=None, workers=1):
+    r"""
+    Function to generate a list of DataField objects from a list of input
+    files, num_threads sets the number of threads used to parse each file,
+    see load_data_map.
+    Setting workers greater than one parses files in a pool of processes.
     """
     field_list = []
     #
     # loading and parsing each input file
-    for infile in infile_list:
-        #
-        # constructing object
-        field = DataField(infile, delim=delim)
+    load_field = partial(_load_field, delim=delim, num_threads=num_threads)
+    for field in parallel_map(load_field, infile_list, workers=workers):
         logger.info('Finished reading file: '+field.infile)
-        #
         field_list.append(field)
     #
     return field_list
 
 
-def calc_percentile(perc, data, sort=True):
+def iter_infile_list(infile_list, delim='auto', num_threads=None, prefetch=1):
     r"""
-    Calculates the desired percentile of a dataset.
+    Generator variant of load_infile_list that yields each DataField as it
+    is loaded. Up to prefetch files are read ahead on a background thread
+    while the current field is in use, so at most prefetch + 1 fields are
+    held by the generator and consumer at any time. Setting prefetch to 0
+    loads each file when it is requested.
     """
-    tot_vals = float(len(data))
-    num_vals = 0.0
-    sorted_data = list(data)
-    if sort:
-        sorted_data.sort()
-    #
-    # stepping through list
-    index = 0
-    for i in range(len(sorted_data)):
-        index = i
-        if (num_vals/tot_vals*100.0) >= perc:
-            break
-        else:
-            num_vals += 1
-    #
+    load_field = partial(_load_field, delim=delim, num_threads=num_threads)
+    if prefetch <= 0:
+        for field in parallel_map(load_field, infile_list):
+            logger.info('Finished reading file: '+field.infile)
+            yield field
+        return
     #
-    return sorted_data[index]
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            for infile in infile_list:
+                pending.append((infile, executor.submit(load_field, infile)))
+                if len(pending) > prefetch:
+                    field = _pop_result(pending)
+                    logger.info('Finished reading file: '+field.infile)
+                    yield field
+            while pending:
+                field = _pop_result(pending)
+                logger.info('Finished reading file: '+field.infile)
+                yield field
+        finally:
+            for infile, future in pending:
+                future.cancel()
+
+
+def _load_field(infile, delim='auto', num_threads=None):
+    r"""
+    Module level DataField constructor that can be used by worker processes
+    """
+    return DataField(infile, delim=delim, num_threads=num_threads)
+
+
+def calc_percentile(perc, data, sort=True):
+    r"""
+    Calculates the desired percentile of a dataset, which is the first value
+    at or above the percentile. If sort is False the data must already be
+    sorted, otherwise a single value is selected using a partial sort.
+    """
+    engine = PercentileEngine(data, presorted=not sort)
+    return engine.percentile(perc)
 
 
 def calc_percentile_num(num, data, last=False, sort=True):
     r"""
     Calculates the percentile of a provided number in the dataset.
     If last is set to true then the last occurance of the number
-    is taken instead of the first.
+    is taken instead of the first. An array of numbers can be supplied to
+    calculate all of their percentiles with a single sort of the data.
+    If sort is False the data must already be sorted.
     """
-    tot_vals = float(len(data))
-    num_vals = 0.0
-    sorted_data = list(data)
-    if sort:
-        sorted_data.sort()
-    #
-    # stepping through list
-    for i in range(len(sorted_data)):
-        if last is True and data[i] > num:
-            break
-        elif last is False and data[i] >= num:
-            break
-        else:
-            num_vals += 1
-    #
-    perc = num_vals/tot_vals
-    #
-    return perc
+    engine = PercentileEngine(data, presorted=not sort)
+    if np.ndim(num) > 0:
+        return engine.ranks(num, last=last)
+    return engine.rank(num, last=last)
 
 
 def get_data_vect(data_map, direction, start_id=1):
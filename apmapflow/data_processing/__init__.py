@@ -19,7 +19,11 @@ Data Processing
     data_processing/histogram.rst
     data_processing/histogram_range.rst
     data_processing/histogram_logscale.rst
+    data_processing/histogram_aggregate.rst
     data_processing/profile.rst
+    data_processing/pipeline.rst
+    data_processing/quantile_sketch.rst
+    data_processing/result_cache.rst
 
 """
 #
@@ -28,4 +32,8 @@ from .eval_channels import EvalChannels
 from .histogram import Histogram
 from .histogram_range import HistogramRange
 from .histogram_logscale import HistogramLogscale
+from .histogram_aggregate import HistogramAggregate
 from .profile import Profile
+from .pipeline import ProcessingPipeline
+from .quantile_sketch import QuantileSketch
+from .result_cache import enable_result_cache, disable_result_cache
@@ -10,8 +10,10 @@ Base Processor
 | Last Modifed: 2016/10/25
 
 """
+import io
 import os
-from .. import _get_logger
+from .. import _get_logger, PercentileEngine
+from .result_cache import get_result_cache
 logger = _get_logger(__name__)
 
 
@@ -20,6 +22,10 @@ class BaseProcessor(object):
     Only required parameter is a data field object, initializes properties
     defined by subclassses.
     """
+    # attributes set by _process_data that are stored in the result cache
+    _cached_attrs = ('processed_data',)
+    # incremented when the processed results change to invalidate the cache
+    _cache_version = 1
 
     def __init__(self, field):
         # initializing properties
@@ -32,6 +38,9 @@ class BaseProcessor(object):
         self.outfile_content = None
         self.output_key = None
         self.processed_data = None
+        # set by fields that must be processed tile-by-tile
+        self.tiled_field = None
+        self._percentile_engine = None
 
         # copying field data
         field.copy_data(self)
@@ -46,6 +55,21 @@ class BaseProcessor(object):
         msg += 'data processing class'
         raise NotImplementedError(msg)
 
+    @property
+    def percentile_engine(self):
+        r"""
+        returns a PercentileEngine for the data vector, it is created on
+        first access unless one was shared with the processor
+        """
+        if self._percentile_engine is None:
+            self._percentile_engine = PercentileEngine(self.data_vector)
+        return self._percentile_engine
+
+    @percentile_engine.setter
+    def percentile_engine(self, engine):
+        r"""sets the engine, allowing processors to share sorted data"""
+        self._percentile_engine = engine
+
     def setup(self, **kwargs):
         r"""
         Sets or resets arguments
@@ -54,14 +78,31 @@ class BaseProcessor(object):
 
     def process(self, **kwargs):
         r"""
-        Calls the subclassed routine process_data to create outfile content
+        Calls the subclassed routine process_data to create outfile content.
+        When the result cache is enabled a stored result for the same data
+        map and arguments is loaded instead, see result_cache.
         """
         if not self.args:
             msg = 'No arguments have been set, use setup(**kwargs) method'
             logger.error(msg)
             return
         #
+        # keyword arguments to process_data are not part of the cache key
+        cache = get_result_cache() if not kwargs else None
+        key = cache.key(self) if cache is not None else None
+        if key is not None:
+            state = cache.load(key)
+            if state is not None:
+                logger.debug('loaded cached result for: %s', self.infile)
+                for attr, value in state.items():
+                    setattr(self, attr, value)
+                return
+        #
         self._process_data(**kwargs)
+        #
+        if key is not None and self.processed_data:
+            state = {attr: getattr(self, attr) for attr in self._cached_attrs}
+            cache.store(key, state)
 
     def _process_data(self, **kwargs):
         r"""
@@ -82,7 +123,28 @@ class BaseProcessor(object):
         #
         self._output_data(**kwargs)
 
-    def _output_data(self, filename=None, delim=','):
+    def _output_data(self, filename=None, delim=',', **kwargs):
+        r"""
+        Sets the outfile name and creates the outfile content by writing the
+        output to an in memory text buffer
+        """
+        if filename is None:
+            filename = self._output_filename()
+        self.outfile_name = filename
+        #
+        buffer = io.StringIO()
+        self._write_output(buffer, delim=delim)
+        self.outfile_content = buffer.getvalue()
+
+    def _output_filename(self):
+        r"""
+        Not implemented
+        """
+        msg = 'This method must be implemented by a specific '
+        msg += 'data processing class'
+        raise NotImplementedError(msg)
+
+    def _write_output(self, stream, delim=','):
         r"""
         Not implemented
         """
@@ -116,6 +178,27 @@ class BaseProcessor(object):
         print(self.outfile_content)
         print('')
 
+    def write_output(self, path=os.path.realpath(os.curdir), filename=None,
+                     delim=','):
+        r"""
+        Writes the data processor's output directly to its outfile without
+        storing it in outfile_content, keeping large outputs out of memory
+        """
+        if not self.processed_data:
+            msg = 'No data has been processed. Run process() method'
+            logger.error(msg)
+            return
+        #
+        if filename is None:
+            filename = self._output_filename()
+        self.outfile_name = filename
+        #
+        filename = os.path.join(path, self.outfile_name)
+        with open(filename, 'w') as f:
+            self._write_output(f, delim=delim)
+        #
+        logger.info('Output saved as: ' + filename)
+
     def write_data(self, path=os.path.realpath(os.curdir)):
         r"""
         Writes the data processor's data to its outfile
@@ -9,6 +9,7 @@ Evaluate Channelization
 | Last Modifed: 2016/10/25
 
 """
+import scipy as sp
 from .. import _get_logger
 from .base_processor import BaseProcessor
 logger = _get_logger(__name__)
@@ -17,11 +18,12 @@ logger = _get_logger(__name__)
 class EvalChannels(BaseProcessor):
     r"""
     Evaluates channelization in flow data based on the number and widths
-    of channels. More work needs to be done on this class to make it
-    not dependent on a specfic direction.
+    of channels. The z axis evaluates each row of the map and the x axis
+    each column.
     kwargs include:
         thresh - minimum numeric value considered to be part of a flow channel
         axis - (x or z) specifies which axis to export along
+        array_output - stores results as flat arrays instead of per row lists
     """
     def __init__(self, field, **kwargs):
         super().__init__(field)
@@ -49,95 +51,177 @@ class EvalChannels(BaseProcessor):
     def _process_data(self, **kwargs):
         r"""
         Examines the dataset along one axis to determine the number and
-        width of channels.
+        width of channels. Channels are runs of values above the threshold
+        found using run-length encoding of each row (z axis) or column
+        (x axis) of the map. Channel bounds are flattened indices of the
+        data map. Tiled fields are processed one tile of rows at a time.
         """
         #
-        direction = self.args['axis']
+        direction = self.args['axis'].lower()
         min_val = self.args['thresh']
         #
-        if (direction.lower() == 'x'):
-            span = self.nx
-            step = self.nz
-        elif (direction.lower() == 'z'):
-            span = self.nz
-            step = self.nx
-        else:
+        if direction not in ('x', 'z'):
             logger.error('invalid direction supplied, can only be x or z')
             return
         #
+        if self.tiled_field is not None:
+            bounds, offsets = self.find_tiled_channels(self.tiled_field,
+                                                       min_val, direction)
+        else:
+            data_map = sp.reshape(self.data_vector, (self.nz, self.nx))
+            bounds, offsets = self.find_channels(data_map, min_val, direction)
+        widths = bounds[:, 1] - bounds[:, 0]
+        if direction == 'x':
+            widths //= self.nx
+        widths += 1
+        #
+        num_channels = sp.diff(offsets)
+        avg_channel_width = sp.zeros(num_channels.size)
+        if widths.size:
+            lines = sp.repeat(sp.arange(num_channels.size), num_channels)
+            sums = sp.bincount(lines, weights=widths,
+                               minlength=num_channels.size)
+            nonzero = num_channels > 0
+            avg_channel_width[nonzero] = sums[nonzero] / num_channels[nonzero]
+        #
         self.processed_data = dict()
+        if self.args.get('array_output', False):
+            self.processed_data['chan_indicies'] = bounds
+            self.processed_data['chan_widths'] = widths
+            self.processed_data['chan_row_offsets'] = offsets
+            self.processed_data['chans_per_row'] = num_channels
+            self.processed_data['avg_chan_width_per_row'] = avg_channel_width
+            return
+        #
+        # splitting the flat channel arrays into per row lists
+        bounds = [tuple(bnd) for bnd in bounds.tolist()]
+        widths = widths.tolist()
         channels = []
-        num_channels = []
         channel_widths = []
-        avg_channel_width = []
-        st = 0
-        for i in range(span):
-            channels.append([])
-            channel_widths.append([])
-            bounds = [-1, -1]
-            en = st + step
-            for j in range(st, en, 1):
-                if (self.data_vector[j] > min_val):
-                    bounds[0] = (j if bounds[0] < 0 else bounds[0])
-                else:
-                    if (bounds[0] > 0):
-                        bounds[1] = j-1
-                        # adding to channel list and then resetting bounds
-                        channels[i].append((bounds[0], bounds[1]))
-                        channel_widths[i].append(bounds[1] - bounds[0] + 1)
-                        bounds = [-1, -1]
-            # adding end point if channel butts up against edge of fracture
-            if (bounds[0] > 0):
-                bounds[1] = j
-                # adding to channel list and then resetting bounds
-                channels[i].append((bounds[0], bounds[1]))
-                bounds = [-1, -1]
-            # calculating average channel width
-            avg = 0
-            for chan in channel_widths[i]:
-                avg += chan
-            n = len(channel_widths[i]) if len(channel_widths[i]) > 0 else 1.0
-            avg = avg / n
-            num_channels.append(len(channels[i]))
-            avg_channel_width.append(avg)
-            st = en
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            channels.append(bounds[start:stop])
+            channel_widths.append(widths[start:stop])
         #
         # putting data into storage dict
         self.processed_data['chan_indicies_per_row'] = channels
-        self.processed_data['chans_per_row'] = num_channels
+        self.processed_data['chans_per_row'] = num_channels.tolist()
         self.processed_data['chan_widths_per_row'] = channel_widths
-        self.processed_data['avg_chan_width_per_row'] = avg_channel_width
+        self.processed_data['avg_chan_width_per_row'] = avg_channel_width.tolist()
 
-    def _output_data(self, filename=None, delim=',', **kwargs):
+    @staticmethod
+    def find_channels(data_map, min_val, direction):
         r"""
-        creates the output content for channelization
+        Returns an (N, 2) array of the first and last flattened index of each
+        channel and an array of offsets where the channels of line i are
+        bounds[offsets[i]:offsets[i+1]]. Lines are the rows of the map for
+        the z direction and the columns for the x direction.
         """
+        nz, nx = data_map.shape
+        mask = data_map > min_val
+        if direction == 'x':
+            mask = mask.T
+        #
+        # padding each line so every channel has a start and an end
+        num_lines, line_len = mask.shape
+        padded = sp.zeros((num_lines, line_len + 2), dtype=sp.int8)
+        padded[:, 1:-1] = mask
+        steps = sp.diff(padded, axis=1)
+        lines, starts = sp.nonzero(steps == 1)
+        ends = sp.nonzero(steps == -1)[1] - 1
         #
-        if filename is None:
-            filename = self.outfile_name
+        # converting line positions to flattened indices of the data map
+        if direction == 'x':
+            bounds = sp.stack([starts * nx + lines, ends * nx + lines], axis=1)
+        else:
+            bounds = sp.stack([lines * nx + starts, lines * nx + ends], axis=1)
+        #
+        offsets = sp.zeros(num_lines + 1, dtype=int)
+        offsets[1:] = sp.cumsum(sp.bincount(lines, minlength=num_lines))
+        #
+        return bounds.astype(int), offsets
+
+    @staticmethod
+    def find_tiled_channels(field, min_val, direction):
+        r"""
+        Tile-by-tile version of find_channels for a TiledDataField, only a
+        single tile of the map is held in memory. Channels along the x
+        direction can span several tiles so the last row of each tile is
+        carried over to find the channels crossing the tile boundary.
+        """
+        nx = field.nx
+        if direction == 'z':
+            bounds = [sp.zeros((0, 2), dtype=int)]
+            counts = []
+            for rows, tile in field.iter_tiles():
+                tile_bounds, offsets = EvalChannels.find_channels(tile, min_val,
+                                                                  direction)
+                bounds.append(tile_bounds + rows.start * nx)
+                counts.append(sp.diff(offsets))
+            bounds = sp.concatenate(bounds)
+            counts = sp.concatenate(counts)
+        else:
+            starts = [sp.zeros(0, dtype=int)]
+            ends = [sp.zeros(0, dtype=int)]
+            last_row = sp.zeros((1, nx), dtype=sp.int8)
+            for rows, tile in field.iter_tiles():
+                mask = (tile > min_val).astype(sp.int8)
+                steps = sp.diff(sp.concatenate([last_row, mask]), axis=0)
+                lines, cols = sp.nonzero(steps == 1)
+                starts.append((rows.start + lines) * nx + cols)
+                lines, cols = sp.nonzero(steps == -1)
+                ends.append((rows.start + lines - 1) * nx + cols)
+                last_row = mask[-1:]
             #
-            # getting index before the extension
-            ldot = filename.rfind('.')
+            # closing the channels that reach the last row of the map
+            cols = sp.nonzero(last_row[0])[0]
+            ends.append((field.nz - 1) * nx + cols)
             #
-            # naming ouput file
-            dir_ = self.args['axis'].upper()
-            filename = filename[:ldot]+'-channel_data-'+dir_+'-axis'+filename[ldot:]
-        self.outfile_name = filename
+            # channels do not overlap so sorting the starts and ends of each
+            # column into row order pairs them up
+            starts = sp.concatenate(starts)
+            ends = sp.concatenate(ends)
+            starts = starts[sp.lexsort((starts // nx, starts % nx))]
+            ends = ends[sp.lexsort((ends // nx, ends % nx))]
+            bounds = sp.stack([starts, ends], axis=1)
+            counts = sp.bincount(starts % nx, minlength=nx)
+        #
+        offsets = sp.zeros(counts.size + 1, dtype=int)
+        offsets[1:] = sp.cumsum(counts)
+        #
+        return bounds.astype(int), offsets
+
+    def _output_filename(self):
+        r"""
+        Returns the name of the output file for channelization
+        """
+        filename = self.outfile_name
         #
-        # outputting data
-        content = 'Channelization data from file: '+self.infile+'\n'
-        content += (self.args['axis']+'-index'+delim+'Number of Channels' +
-                    delim+'Average Width'+delim+'Channel Widths\n')
+        # getting index before the extension
+        ldot = filename.rfind('.')
+        #
+        # naming ouput file
+        dir_ = self.args['axis'].upper()
+        return filename[:ldot]+'-channel_data-'+dir_+'-axis'+filename[ldot:]
+
+    def _write_output(self, stream, delim=','):
+        r"""
+        Writes the output content for channelization to the stream
+        """
+        stream.write('Channelization data from file: '+self.infile+'\n')
+        stream.write(self.args['axis']+'-index'+delim+'Number of Channels' +
+                     delim+'Average Width'+delim+'Channel Widths\n')
         #
         num_channels = list(self.processed_data['chans_per_row'])
         avg_width = list(self.processed_data['avg_chan_width_per_row'])
-        widths = list(self.processed_data['chan_widths_per_row'])
+        if 'chan_row_offsets' in self.processed_data:
+            offsets = self.processed_data['chan_row_offsets']
+            widths = self.processed_data['chan_widths'].tolist()
+            widths = [widths[st:en] for st, en in zip(offsets[:-1], offsets[1:])]
+        else:
+            widths = list(self.processed_data['chan_widths_per_row'])
+        #
+        row = '{0:4d}'+delim+'{1:3d}'+delim+'{2:0.3}'+delim+'({3})\n'
         for i in range(len(num_channels)):
-            chans = [str(x) for x in widths[i]]
-            chans = '('+', '.join(chans)+')'
-            row = '{0:4d}'+delim+'{1:3d}'+delim+'{2:0.3}'+delim+'{3}'
-            row = row.format(i, num_channels[i], avg_width[i], chans)
-            content += row+'\n'
-        content += '\n'
-        #
-        self.outfile_content = content
+            chans = ', '.join([str(x) for x in widths[i]])
+            stream.write(row.format(i, num_channels[i], avg_width[i], chans))
+        stream.write('\n')
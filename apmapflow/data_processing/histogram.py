@@ -11,7 +11,7 @@ Histogram
 
 """
 import scipy as sp
-from .. import _get_logger, calc_percentile
+from .. import _get_logger
 from .base_processor import BaseProcessor
 logger = _get_logger(__name__)
 
@@ -25,6 +25,8 @@ class Histogram(BaseProcessor):
     kwargs include:
         num_bins - integer value for the total number of bins
     """
+    _cached_attrs = ('processed_data', 'bins')
+
     def __init__(self, field, **kwargs):
         super().__init__(field)
         self.args.update(kwargs)
@@ -51,19 +53,23 @@ class Histogram(BaseProcessor):
         r"""
         This defines the bins for a regular histogram
         """
-        self.data_vector.sort()
         num_bins = self.args['num_bins']
-        min_val = calc_percentile(1.0, self.data_vector, False)
-        max_val = calc_percentile(99.0, self.data_vector, False)
+        if self.tiled_field is not None:
+            min_val, max_val = self.tiled_field.percentiles([1.0, 99.0])
+            data_min, data_max = self.tiled_field.data_range()
+        else:
+            engine = self.percentile_engine
+            min_val, max_val = engine.percentiles([1.0, 99.0])
+            data_min, data_max = engine.sorted_data[[0, -1]]
         #
         # creating initial bins
         low = list(sp.linspace(min_val, max_val, num_bins))
         high = list(sp.linspace(min_val, max_val, num_bins))[1:]
-        high.append(self.data_vector[-1]*1.0001)
+        high.append(data_max*1.0001)
         #
         # adding lower bin if needed
-        if self.data_vector[0] < min_val:
-            low.insert(0, self.data_vector[0])
+        if data_min < min_val:
+            low.insert(0, data_min)
             high.insert(0, min_val)
         #
         self.bins = [bin_ for bin_ in zip(low, high)]
@@ -80,34 +86,34 @@ class Histogram(BaseProcessor):
         # populating bins
         edges = sp.array(self.bins[0][0])
         edges = sp.append(edges, sp.array(self.bins)[:, 1])
-        data, edges = sp.histogram(self.data_vector, bins=edges)
+        if self.tiled_field is not None:
+            data = self.tiled_field.histogram(edges)
+        else:
+            data, edges = sp.histogram(self.data_vector, bins=edges)
         #
         # storing data
         self.processed_data = []
         for (low, high), count in zip(self.bins, data):
             self.processed_data.append((low, high, count))
 
-    def _output_data(self, filename=None, delim=','):
+    def _output_filename(self):
         r"""
-        Creates the output content for histograms
+        Returns the name of the output file for histograms
         """
+        filename = self.outfile_name
         #
-        if filename is None:
-            filename = self.outfile_name
-            #
-            # getting index before the extension
-            ldot = filename.rfind('.')
-            #
-            # naming ouput file
-            filename = filename[:ldot]+'-'+self.action+filename[ldot:]
-        self.outfile_name = filename
+        # getting index before the extension
+        ldot = filename.rfind('.')
         #
-        # outputting data
-        content = 'Histogram data from file: '+self.infile+'\n'
-        content += 'Low value, High value, # Data Points\n'
+        # naming ouput file
+        return filename[:ldot]+'-'+self.action+filename[ldot:]
+
+    def _write_output(self, stream, delim=','):
+        r"""
+        Writes the output content for histograms to the stream
+        """
+        stream.write('Histogram data from file: '+self.infile+'\n')
+        stream.write('Low value, High value, # Data Points\n')
         fmt_str = '{0}'+delim+'{1}'+delim+'{2}\n'
-        for dat in self.processed_data:
-            content += fmt_str.format(dat[0], dat[1], dat[2])
-        content += '\n'
-        #
-        self.outfile_content = content
+        stream.writelines(fmt_str.format(*dat) for dat in self.processed_data)
+        stream.write('\n')
@@ -0,0 +1,247 @@
+"""
+================================================================================
+Histogram Aggregate
+================================================================================
+| Calculates a histogram for each of a set of data maps using one set of bins
+| and combines them into a single table.
+
+"""
+import io
+import os
+import numpy as np
+from .. import _get_logger, DataField, iter_infile_list
+from .histogram import Histogram
+from .histogram_range import HistogramRange
+from .histogram_logscale import HistogramLogscale
+from .quantile_sketch import QuantileSketch
+logger = _get_logger(__name__)
+
+
+class HistogramAggregate(object):
+    r"""
+    Counts the values of many data maps using a single set of bins and
+    outputs one table with a column for each map and a total column. Bins
+    are either supplied as edges or defined by a histogram class from a
+    QuantileSketch of every map. Maps are counted in a single pass when
+    edges or a filled sketch are supplied, otherwise they are first read
+    once to fill the sketch. Only one map is held in memory at a time.
+
+    Bins defined from the sketch have catch-all outer bins, the first and
+    last edges are extended to the smallest and largest values counted so
+    values beyond the estimated range are never dropped. NaN values are
+    ignored when setting the outer edges.
+
+    Parameters
+    ----------
+    edges : array_like, optional
+        bin edges to use, the other arguments are ignored when supplied
+    bin_class : class, optional
+        Histogram, HistogramRange or HistogramLogscale, its define_bins
+        method is used with the percentiles of the sketch
+    sketch : QuantileSketch, optional
+        sketch of the data maps, e.g. one written by the Percentiles
+        --sketch option. A new sketch is created and filled if omitted.
+    **kwargs :
+        arguments for the bin_class, e.g. num_bins
+    """
+    def __init__(self, edges=None, bin_class=Histogram, sketch=None,
+                 **kwargs):
+        super().__init__()
+        self.bin_class = bin_class
+        self.args = kwargs
+        self.edges = None if edges is None else np.asarray(edges, dtype=float)
+        # k=800 bounds the rank error of the bin limits to ~0.45 percent
+        self.sketch = QuantileSketch(k=800) if sketch is None else sketch
+        self.infiles = []
+        self.counts = []
+        self._extend_edges = False
+        self.outfile_name = 'histogram-aggregate.csv'
+        self.outfile_content = None
+
+    @classmethod
+    def _add_subparser(cls, subparsers, parent):
+        r"""
+        Adds a specific action based sub-parser to the supplied arg_parser
+        instance.
+        """
+        parser = subparsers.add_parser(cls.__name__,
+                                       aliases=['histagg'],
+                                       parents=[parent],
+                                       help=cls.__doc__)
+        #
+        parser.add_argument('num_bins', type=int, nargs='?', default=10,
+                            help='''number of bins to utilze in histogram
+                            (default: %(default)s)''')
+        bin_type = parser.add_mutually_exclusive_group()
+        bin_type.add_argument('-r', '--range', nargs=2, type=float,
+                              help='''bins are evenly spaced between these
+                              percentiles of all the data maps''')
+        bin_type.add_argument('-l', '--logscale', type=float,
+                              dest='scale_fact', metavar='SCALE_FACT',
+                              help='''bins are logarithmically spaced using
+                              this base''')
+        bin_type.add_argument('-e', '--edges', nargs='+', type=float,
+                              help='''bin edges to use instead of defining
+                              them from the data maps''')
+        parser.add_argument('--outfile', default='histogram-aggregate.csv',
+                            help='''name of the combined output file
+                            (default: %(default)s)''')
+        parser.add_argument('--sketch', dest='sketch_file', default=None,
+                            help='''quantile sketch file used to define the
+                            bins so maps are only read once, it is created
+                            from the maps if it does not exist''')
+        parser.set_defaults(func=cls)
+
+    @classmethod
+    def from_args(cls, args):
+        r"""
+        Creates an instance from parsed command line arguments
+        """
+        sketch = None
+        if args.sketch_file and os.path.exists(args.sketch_file):
+            sketch = QuantileSketch.load(args.sketch_file)
+        #
+        if args.range is not None:
+            agg = cls(bin_class=HistogramRange, sketch=sketch,
+                      num_bins=args.num_bins, range=args.range)
+        elif args.scale_fact is not None:
+            agg = cls(bin_class=HistogramLogscale, sketch=sketch,
+                      scale_fact=args.scale_fact)
+        else:
+            agg = cls(edges=args.edges, sketch=sketch, num_bins=args.num_bins)
+        agg.outfile_name = args.outfile
+        #
+        return agg
+
+    def sample_field(self, field):
+        r"""
+        Adds the field's data to the sketch used to define bins
+        """
+        self.sketch.update_field(field)
+
+    def define_bins(self):
+        r"""
+        Defines the bin edges from the sketch using the bin class
+        """
+        if not len(self.sketch):
+            msg = 'No data has been sampled. Run sample_field() method'
+            raise ValueError(msg)
+        #
+        # the bin classes read percentiles and the data range from the
+        # tiled_field when one is set
+        hist = self.bin_class(DataField(np.zeros((1, 1))), **self.args)
+        hist.tiled_field = _SketchStatistics(self.sketch)
+        hist.define_bins()
+        #
+        self.edges = np.array([hist.bins[0][0]] + [b[1] for b in hist.bins])
+        self._extend_edges = True
+
+    def add_field(self, field):
+        r"""
+        Counts the values of a field and adds them as a new column, bins
+        are defined from the sketch first if needed
+        """
+        if self.edges is None:
+            self.define_bins()
+        #
+        data = field.data_vector
+        if self._extend_edges and np.any(np.isfinite(data)):
+            self.edges[0] = np.fmin(self.edges[0], np.nanmin(data))
+            self.edges[-1] = np.fmax(self.edges[-1], np.nanmax(data))
+        counts = np.histogram(data, bins=self.edges)[0]
+        self.infiles.append(field.infile)
+        self.counts.append(counts)
+
+    @property
+    def totals(self):
+        r"""returns the total count in each bin across every map"""
+        return np.sum(self.counts, axis=0)
+
+    def process_files(self, files, **kwargs):
+        r"""
+        Defines bins if needed and then counts the values of each file,
+        files are read in the background while the previous one is
+        processed. The files are only read once unless edges are undefined
+        and the sketch is empty. kwargs are passed onto iter_infile_list.
+        """
+        files = list(files)
+        if self.edges is None:
+            if not len(self.sketch):
+                for field in iter_infile_list(files, **kwargs):
+                    self.sample_field(field)
+            self.define_bins()
+        #
+        for field in iter_infile_list(files, **kwargs):
+            self.add_field(field)
+
+    def gen_output(self, delim=','):
+        r"""
+        Creates the combined output table
+        """
+        if not self.counts:
+            msg = 'No data has been processed. Run add_field() method'
+            logger.error(msg)
+            return
+        #
+        buffer = io.StringIO()
+        self._write_output(buffer, delim=delim)
+        self.outfile_content = buffer.getvalue()
+
+    def _write_output(self, stream, delim=','):
+        r"""
+        Writes the combined table to the stream
+        """
+        names = [os.path.basename(infile or '') for infile in self.infiles]
+        stream.write('Aggregate histogram data from {} files\n'.format(len(names)))
+        stream.write(delim.join(['Low value', 'High value'] + names + ['Total']))
+        stream.write('\n')
+        #
+        counts = np.column_stack(self.counts + [self.totals])
+        for low, high, row in zip(self.edges[:-1], self.edges[1:], counts):
+            row = [str(low), str(high)] + [str(val) for val in row]
+            stream.write(delim.join(row) + '\n')
+        stream.write('\n')
+
+    def print_data(self):
+        r"""
+        Writes the combined table to the screen
+        """
+        if not self.outfile_content:
+            msg = 'No output content. Run gen_output() method'
+            logger.error(msg)
+            return
+        #
+        print(self.outfile_content)
+        print('')
+
+    def write_data(self, path=os.path.realpath(os.curdir)):
+        r"""
+        Writes the combined table to its outfile
+        """
+        if not self.outfile_content:
+            msg = 'No output content. Run gen_output() method'
+            logger.error(msg)
+            return
+        #
+        filename = os.path.join(path, self.outfile_name)
+        with open(filename, 'w') as f:
+            f.write(self.outfile_content)
+        #
+        logger.info('Output saved as: ' + filename)
+
+
+class _SketchStatistics(object):
+    r"""
+    Provides the percentiles and data_range methods of a TiledDataField
+    from a QuantileSketch so the histogram classes can define bins from it
+    """
+    def __init__(self, sketch):
+        self.sketch = sketch
+
+    def percentiles(self, percs):
+        r"""returns the estimated value of each percentile"""
+        return self.sketch.percentiles(percs)
+
+    def data_range(self):
+        r"""returns the smallest and largest values in the sketch"""
+        return tuple(self.sketch.percentiles([0.0, 100.0]))
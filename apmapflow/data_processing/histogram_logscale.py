@@ -48,20 +48,25 @@ class HistogramLogscale(Histogram):
         r"""
         This defines the bins for a logscaled histogram
         """
-        self.data_vector.sort()
+        if self.tiled_field is not None:
+            data_min, data_max = self.tiled_field.data_range()
+        else:
+            # NaN values sort last so they are only included in the maximum
+            data_min = sp.nanmin(self.data_vector)
+            data_max = sp.amax(self.data_vector)
         sf = self.args['scale_fact']
-        num_bins = int(sp.logn(sf, self.data_vector[-1]) + 1)
+        num_bins = int(sp.logn(sf, data_max) + 1)
         #
         # generating initial bins from 1 - sf**num_bins
         low = list(sp.logspace(0, num_bins, num_bins + 1, base=sf))[:-1]
         high = list(sp.logspace(0, num_bins, num_bins + 1, base=sf))[1:]
         #
         # Adding "catch all" bins for anything between 0 - 1 and less than 0
-        if self.data_vector[0] < 1.0:
+        if data_min < 1.0:
             low.insert(0, 0.0)
             high.insert(0, 1.0)
-        if self.data_vector[0] < 0.0:
-            low.insert(0, self.data_vector[0])
+        if data_min < 0.0:
+            low.insert(0, data_min)
             high.insert(0, 0.0)
         #
         self.bins = [bin_ for bin_ in zip(low, high)]
@@ -10,7 +10,6 @@ Range Histogram
 
 """
 import scipy as sp
-from .. import calc_percentile
 from .histogram import Histogram
 
 
@@ -55,13 +54,15 @@ class HistogramRange(Histogram):
         r"""
         This defines the bins for a range histogram
         """
-        self.data_vector.sort()
         num_bins = self.args['num_bins'] + 1
         min_val = self.args['range'][0]
         max_val = self.args['range'][1]
         #
-        min_val = calc_percentile(min_val, self.data_vector, False)
-        max_val = calc_percentile(max_val, self.data_vector, False)
+        if self.tiled_field is not None:
+            min_val, max_val = self.tiled_field.percentiles([min_val, max_val])
+        else:
+            engine = self.percentile_engine
+            min_val, max_val = engine.percentiles([min_val, max_val])
         #
         low = list(sp.linspace(min_val, max_val, num_bins))[:-1]
         high = list(sp.linspace(min_val, max_val, num_bins))[1:]
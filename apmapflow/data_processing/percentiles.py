@@ -10,7 +10,7 @@ Percentile
 
 """
 from collections import OrderedDict
-from .. import calc_percentile
+import os
 from .base_processor import BaseProcessor
 
 
@@ -21,6 +21,11 @@ class Percentiles(BaseProcessor):
        percentiles : list of percentiles to calculate (required)
        key_format : format to write percentile dictionary keys in (optional)
        value_format : format to write percentile values in (optional)
+       sketch : QuantileSketch updated with the data of each map (optional)
+       sketch_file : file to store a QuantileSketch of every map processed
+           in, only used by the ProcessingPipeline (optional)
+       sketch_append : adds the maps to an existing sketch_file instead of
+           replacing it (optional)
 
     """
     def __init__(self, field, **kwargs):
@@ -48,6 +53,17 @@ class Percentiles(BaseProcessor):
         parser.add_argument('--value-format', '-v', default='{}',
                             help='''python format string to write percentile
                             values as (default: %(default)s)''')
+        parser.add_argument('--sketch', dest='sketch_file', default=None,
+                            type=os.path.realpath,
+                            help='''stores a quantile sketch of every map in
+                            this file, replacing any existing sketch, and
+                            outputs the estimated percentiles of all maps in
+                            the sketch''')
+        parser.add_argument('--append', dest='sketch_append',
+                            action='store_true',
+                            help='''adds the maps to the existing --sketch
+                            file instead of replacing it, maps already in the
+                            sketch are counted again (default: %(default)s)''')
         parser.set_defaults(func=cls)
 
     def _process_data(self):
@@ -60,34 +76,43 @@ class Percentiles(BaseProcessor):
         key_fmt = self.args.get('key_format', '{:4.2f}')
         #
         # getting percentiles from data map
-        self.data_vector.sort()
+        if self.tiled_field is not None:
+            values = self.tiled_field.percentiles(perc_list)
+        else:
+            values = self.percentile_engine.percentiles(perc_list)
+        #
+        # adding the data to a sketch of multiple maps
+        sketch = self.args.get('sketch')
+        if sketch is not None:
+            if self.tiled_field is not None:
+                sketch.update_field(self.tiled_field)
+            else:
+                sketch.update(self.data_vector)
+        #
         self.processed_data = OrderedDict()
-        for perc in perc_list:
-            val = calc_percentile(perc, self.data_vector, sort=False)
+        for perc, val in zip(perc_list, values):
             self.processed_data[key_fmt.format(perc)] = val
 
-    def _output_data(self, filename=None, delim=','):
+    def _output_filename(self):
         r"""
-        Creates the output content for percentiles
+        Returns the name of the output file for percentiles
         """
+        filename = self.outfile_name
         #
-        if filename is None:
-            filename = self.outfile_name
-            #
-            # getting index before the extension
-            ldot = filename.rfind('.')
-            #
-            # naming ouput file
-            filename = filename[:ldot]+'-percentiles'+filename[ldot:]
-        self.outfile_name = filename
+        # getting index before the extension
+        ldot = filename.rfind('.')
         #
-        # outputting data
-        content = 'Percentile data from file: '+self.infile+'\n'
-        content += 'percentile'+delim+'value\n'
+        # naming ouput file
+        return filename[:ldot]+'-percentiles'+filename[ldot:]
+
+    def _write_output(self, stream, delim=','):
+        r"""
+        Writes the output content for percentiles to the stream
+        """
+        stream.write('Percentile data from file: '+self.infile+'\n')
+        stream.write('percentile'+delim+'value\n')
         #
         fmt = '{{}}{}{}\n'.format(delim, self.args.get('value_format', '{}'))
-        for perc, value in self.processed_data.items():
-            content += fmt.format(perc, value)
-        content += '\n'
-        #
-        self.outfile_content = content
+        stream.writelines(fmt.format(perc, value) for perc, value in
+                          self.processed_data.items())
+        stream.write('\n')
@@ -0,0 +1,270 @@
+"""
+================================================================================
+Processing Pipeline
+================================================================================
+| Runs several data processors on each data map while only loading the map
+| once.
+
+"""
+import argparse
+from copy import deepcopy
+from functools import partial
+import io
+import os
+import shlex
+from .. import _get_logger, DataField, iter_infile_list, parallel_map
+from .percentiles import Percentiles
+from .eval_channels import EvalChannels
+from .histogram import Histogram
+from .histogram_range import HistogramRange
+from .histogram_logscale import HistogramLogscale
+from .profile import Profile
+from .quantile_sketch import QuantileSketch
+logger = _get_logger(__name__)
+
+# processors that can be used as pipeline actions
+PROCESSORS = [
+    Percentiles, EvalChannels, Histogram,
+    HistogramRange, HistogramLogscale, Profile
+]
+
+
+class ProcessingPipeline(object):
+    r"""
+    Applies a list of data processors to each data map. Every map is loaded
+    once and the processors share its data along with a single percentile
+    engine, so the data vector is sorted at most once per map. Files can be
+    processed in parallel using a pool of worker processes.
+
+    Parameters
+    ----------
+    actions : list, optional
+        list of (processor class, kwargs dict) pairs applied in order
+    """
+    def __init__(self, actions=None):
+        super().__init__()
+        self.actions = []
+        for cls, kwargs in (actions or []):
+            self.add_action(cls, **kwargs)
+
+    @classmethod
+    def _add_subparser(cls, subparsers, parent):
+        r"""
+        Adds a specific action based sub-parser to the supplied arg_parser
+        instance.
+        """
+        parser = subparsers.add_parser('pipeline',
+                                       parents=[parent],
+                                       help=cls.__doc__)
+        #
+        parser.add_argument('-a', '--action', dest='actions', required=True,
+                            action='append', metavar='"COMMAND [ARGS]"',
+                            help='''processor command and its arguments as a
+                            single quoted string, e.g. -a "perc 10 50 90",
+                            can be specified multiple times''')
+        parser.set_defaults(func=cls)
+
+    @classmethod
+    def from_action_strings(cls, action_strings):
+        r"""
+        Creates a pipeline from a list of command line strings using the
+        same syntax as the individual processor commands, e.g. "hist 10".
+        """
+        parser = argparse.ArgumentParser(prog='pipeline action')
+        parent = argparse.ArgumentParser(add_help=False)
+        subparsers = parser.add_subparsers(dest='processor')
+        for proc_cls in PROCESSORS:
+            proc_cls._add_subparser(subparsers, parent)
+        #
+        pipeline = cls()
+        for action in action_strings:
+            args = parser.parse_args(shlex.split(action))
+            kwargs = dict(args.__dict__)
+            proc_cls = kwargs.pop('func')
+            del kwargs['processor']
+            pipeline.add_action(proc_cls, **kwargs)
+        #
+        return pipeline
+
+    def add_action(self, cls, **kwargs):
+        r"""
+        Appends a processor class and the arguments used to set it up
+        """
+        self.actions.append((cls, kwargs))
+
+    def process(self, field):
+        r"""
+        Creates and runs each processor on the field, returning the list of
+        processors in the order of the actions. Actions with a sketch_file
+        argument are given a new QuantileSketch of the field.
+        """
+        processors = []
+        engine = None
+        for cls, kwargs in self.actions:
+            # processors may modify their arguments in place
+            kwargs = deepcopy(kwargs)
+            if kwargs.get('sketch_file'):
+                kwargs['sketch'] = QuantileSketch()
+            processor = cls(field, **kwargs)
+            if engine is None:
+                engine = processor.percentile_engine
+            processor.percentile_engine = engine
+            processor.process()
+            processors.append(processor)
+        #
+        return processors
+
+    def process_file(self, infile, screen=False, write=True):
+        r"""
+        Loads and processes a single file, returning a list of
+        (outfile name, screen content, file content, sketch) tuples for each
+        action, see field_outputs.
+        """
+        return self.field_outputs(DataField(infile), screen, write)
+
+    def field_outputs(self, field, screen=False, write=True, output_dir=None,
+                      overwrite=False):
+        r"""
+        Processes a field, returning a list of (outfile name, screen content,
+        file content, sketch) tuples for each action. The sketch is None
+        unless the action has a sketch_file. If an output_dir is supplied
+        files are streamed directly into it and the file content is None.
+        """
+        outputs = []
+        for processor in self.process(field):
+            outfile_name = processor.outfile_name
+            screen_content = None
+            if screen:
+                processor.gen_output(delim='\t')
+                screen_content = processor.outfile_content
+                processor.outfile_name = outfile_name
+            #
+            file_content = None
+            if write and output_dir is not None:
+                filename = os.path.join(output_dir, processor._output_filename())
+                _check_outfile(filename, overwrite)
+                processor.write_output(path=output_dir, delim=',')
+            elif write:
+                processor.gen_output(delim=',')
+                file_content = processor.outfile_content
+            outputs.append((processor.outfile_name, screen_content,
+                            file_content, processor.args.get('sketch')))
+        #
+        return outputs
+
+    def process_files(self, files, output_dir=None, workers=1,
+                      screen=False, write=True, overwrite=False):
+        r"""
+        Processes each file and prints or writes the results of every action,
+        output is handled in the order of the files. When workers is greater
+        than one files are loaded and processed in a pool of processes, see
+        parallel_map, otherwise the next file is loaded in the background.
+        The sketches of actions with a sketch_file are combined and written
+        to the file, replacing it unless the action has sketch_append set,
+        and the percentiles of every map in it are output at the end.
+        """
+        files = list(files)
+        if output_dir is None:
+            output_dir = os.getcwd()
+        #
+        sketches = {}
+        for i, (cls, kwargs) in enumerate(self.actions):
+            sketch_file = kwargs.get('sketch_file')
+            if not sketch_file:
+                continue
+            if kwargs.get('sketch_append') and os.path.exists(sketch_file):
+                sketches[i] = QuantileSketch.load(sketch_file)
+            else:
+                sketches[i] = QuantileSketch()
+        #
+        if workers is not None and workers <= 1:
+            # the next map is read in the background while this one is processed
+            fields = iter_infile_list(files, prefetch=1)
+            results = (self.field_outputs(f, screen, write, output_dir, overwrite)
+                       for f in fields)
+        else:
+            process_file = partial(_process_file, self, screen=screen, write=write)
+            results = parallel_map(process_file, files, workers=workers)
+        for infile, outputs in zip(files, results):
+            logger.debug('processed file: %s', infile)
+            self._output_results(outputs, output_dir, overwrite)
+            for i, sketch in sketches.items():
+                sketch.merge(outputs[i][3])
+        #
+        for i, sketch in sketches.items():
+            kwargs = self.actions[i][1]
+            sketch.save(kwargs['sketch_file'])
+            output = _sketch_output(sketch, kwargs, screen, write)
+            self._output_results([output], output_dir, overwrite)
+
+    @staticmethod
+    def _output_results(outputs, output_dir, overwrite):
+        r"""
+        Prints and writes the outputs generated for a single file
+        """
+        for outfile_name, screen_content, file_content, _ in outputs:
+            if screen_content is not None:
+                print(screen_content)
+                print('')
+            #
+            if file_content is None:
+                continue
+            filename = os.path.join(output_dir, outfile_name)
+            _check_outfile(filename, overwrite)
+            #
+            with open(filename, 'w') as file:
+                file.write(file_content)
+            logger.info('Output saved as: ' + filename)
+
+
+def _check_outfile(filename, overwrite):
+    r"""
+    Raises an error if the output file exists and can not be overwritten
+    """
+    if os.path.exists(filename) and not overwrite:
+        msg = '{} already exists, use "-f" option to overwrite'
+        raise FileExistsError(msg.format(filename))
+
+
+def _process_file(pipeline, infile, screen=False, write=True):
+    r"""
+    Module level wrapper so files can be processed in worker processes
+    """
+    return pipeline.process_file(infile, screen, write)
+
+
+def _sketch_output(sketch, kwargs, screen=False, write=True):
+    r"""
+    Creates the output tuple for the percentiles of every map in a sketch
+    using the formats of the Percentiles action.
+    """
+    contents = []
+    for delim, output in [('\t', screen), (',', write)]:
+        if not output:
+            contents.append(None)
+            continue
+        buffer = io.StringIO()
+        _write_sketch_output(buffer, sketch, kwargs, delim=delim)
+        contents.append(buffer.getvalue())
+    #
+    outfile_name = os.path.basename(kwargs['sketch_file'])
+    outfile_name = os.path.splitext(outfile_name)[0] + '-percentiles.csv'
+    return (outfile_name, contents[0], contents[1], None)
+
+
+def _write_sketch_output(stream, sketch, kwargs, delim=','):
+    r"""
+    Writes the percentiles of a sketch to the stream in the same layout as
+    Percentiles._write_output
+    """
+    msg = 'Percentile data from sketch: {} ({} values, rank error: {:0.3%})\n'
+    stream.write(msg.format(kwargs['sketch_file'], sketch.num_vals,
+                            sketch.rank_error()))
+    stream.write('percentile'+delim+'value\n')
+    #
+    perc_list = sorted(kwargs['percentiles'])
+    key_fmt = kwargs.get('key_format', '{:4.2f}')
+    fmt = '{{}}{}{}\n'.format(delim, kwargs.get('value_format', '{}'))
+    stream.writelines(fmt.format(key_fmt.format(perc), value) for perc, value
+                      in zip(perc_list, sketch.percentiles(perc_list)))
+    stream.write('\n')
@@ -2,7 +2,7 @@
 ================================================================================
 Profile
 ================================================================================
-| Outputs a set of data profiles along either the X or Z axis
+| Outputs a set of data profiles along the X and/or Z axis
 
 | Written By: Matthew Stadelman
 | Date Written: 2016/03/07
@@ -10,7 +10,9 @@ Profile
 
 """
 from collections import OrderedDict
-from .. import _get_logger, get_data_vect
+import io
+import numpy as np
+from .. import _get_logger
 from .base_processor import BaseProcessor
 logger = _get_logger(__name__)
 
@@ -21,7 +23,11 @@ class Profile(BaseProcessor):
     along a specified axis. Locations are given as percentages from the
     bottom or left edge of the 2-D data map
         locations  -  list of numbers, ex: [10, 25, 50, 75, 90]
-        axis   - (x or z) specifies which axis to export along
+        axis   - (x, z or both) specifies which axis to export along
+        band   - number of rows or columns on each side of a location to
+                 average the profile over (optional)
+        text_fmt - printf style format to write values in, by default the
+                   shortest representation of each value is used (optional)
     """
     def __init__(self, field, **kwargs):
         super().__init__(field)
@@ -40,64 +46,129 @@ class Profile(BaseProcessor):
                                        parents=[parent],
                                        help=cls.__doc__)
         #
-        parser.add_argument('axis', choices=['x', 'z'],
-                            help='x or z for the corresponding axis')
+        parser.add_argument('axis', choices=['x', 'z', 'both'],
+                            help='x, z or both for the corresponding axis')
         parser.add_argument('locations', nargs='+', type=float,
                             help='location as percent distance from axis')
+        parser.add_argument('--band', type=int, default=0,
+                            help='''averages each profile over this many rows
+                            or columns on either side (default: %(default)s)''')
+        parser.add_argument('--text-fmt', default=None,
+                            help='''printf style format to write values in,
+                            e.g. %%.6e, fixed formats are faster to write than
+                            the default shortest representation''')
         parser.set_defaults(func=cls)
 
     def _process_data(self, **kwargs):
         r"""
-        Takes a list of percentiles specified in **kwargs and generates
-        the corresponding set of values.
+        Takes a list of locations specified in self.args and extracts the
+        profile at each one. Profiles along the x axis are rows of the map
+        and profiles along the z axis are columns.
         """
         #
-        axis = self.args['axis']
+        axis = self.args['axis'].lower()
         locs = self.args['locations']
         locs.sort()
         #
-        if axis.lower() == 'x':
-            # first row is bottom of fracture
-            inds = [(int(l/100.0*self.nz) + 1) for l in locs]
-        elif axis.lower() == 'z':
-            # first column is left side of fracture
-            inds = [(int(l/100.0*self.nx) + 1) for l in locs]
+        if axis == 'both':
+            axes = ['x', 'z']
+        elif axis in ('x', 'z'):
+            axes = [axis]
         else:
-            msg = 'Invalid axis: "{}" supplied, valid values are x or z'
+            msg = 'Invalid axis: "{}" supplied, valid values are x, z or both'
             logger.error(msg.format(axis))
             self.processed_data = None
             return
         #
-        # getting data vectors
         fmt = '{:4.2f}'
-        self.processed_data = OrderedDict()
-        for loc, row in zip(locs, inds):
-            loc = fmt.format(loc)
-            self.processed_data[loc] = get_data_vect(self.data_map, axis, row)
+        keys = [fmt.format(loc) for loc in locs]
+        band = self.args.get('band', 0)
+        #
+        profiles = OrderedDict()
+        for direction in axes:
+            vectors = self.extract_profiles(self.data_map, direction, locs, band)
+            profiles[direction] = OrderedDict(zip(keys, vectors))
+        #
+        if axis == 'both':
+            self.processed_data = profiles
+        else:
+            self.processed_data = profiles[axis]
 
-    def _output_data(self, filename=None, delim=','):
+    @staticmethod
+    def extract_profiles(data_map, axis, locs, band=0):
         r"""
-        Creates the output content for data profiles
+        Returns a 2-D array with the profile at each location as a row.
+        Locations are a percentage of the map height for the x axis and
+        width for the z axis. When band is greater than zero each profile is
+        the average of the rows or columns within band of the location,
+        ignoring any that fall outside of the map.
         """
+        # profiles along the z axis are the columns of the map
+        lines = data_map if axis == 'x' else data_map.T
+        num_lines = lines.shape[0]
         #
-        if filename is None:
-            filename = self.outfile_name
-            #
-            # getting index before the extension
-            ldot = filename.rfind('.')
-            #
-            # naming ouput file
-            axis = self.args['axis'].upper()
-            filename = filename[:ldot]+'-profiles-'+axis+'-axis'+filename[ldot:]
-        self.outfile_name = filename
+        # first row is the bottom of the fracture and first column the left
+        inds = (np.asarray(locs, dtype=float) / 100.0 * num_lines).astype(int)
+        inds = np.clip(inds, 0, num_lines - 1)
+        if not band:
+            return lines[inds]
         #
-        # outputting data
-        fmt = 'Location: {0}%{1}\n'
-        content = axis+'-axis profile data from file: '+self.infile+'\n'
-        for loc, vector in self.processed_data.items():
-            content += fmt.format(loc, delim)
-            vector = [str(val) for val in vector]
-            content += delim.join(vector)+'\n'
-        content += '\n'
+        offsets = np.arange(-band, band + 1)
+        band_inds = inds[:, np.newaxis] + offsets
+        valid = (band_inds >= 0) & (band_inds < num_lines)
+        band_lines = lines[np.clip(band_inds, 0, num_lines - 1)]
+        band_lines = band_lines * valid[:, :, np.newaxis]
         #
-        self.outfile_content = content
+        return band_lines.sum(axis=1) / valid.sum(axis=1)[:, np.newaxis]
+
+    def _output_filename(self):
+        r"""
+        Returns the name of the output file for data profiles
+        """
+        filename = self.outfile_name
+        #
+        # getting index before the extension
+        ldot = filename.rfind('.')
+        #
+        # naming ouput file
+        return '{}-profiles-{}-axis{}'.format(filename[:ldot], self._axis_label(),
+                                              filename[ldot:])
+
+    def _axis_label(self):
+        r"""
+        Returns the axis used in the output, XZ when both axes are output
+        """
+        axis = self.args['axis'].upper()
+        return 'XZ' if axis == 'BOTH' else axis
+
+    def _write_output(self, stream, delim=','):
+        r"""
+        Writes the output content for data profiles to the stream, the
+        values of each section are formatted with a single call
+        """
+        axis = self._axis_label()
+        if axis == 'XZ':
+            sections = list(self.processed_data.items())
+        else:
+            sections = [(axis, self.processed_data)]
+        #
+        fmt = 'Location: {0}%{1}\n'
+        value_fmt = self.args.get('text_fmt') or '%s'
+        for direction, profiles in sections:
+            stream.write(direction.upper()+'-axis profile data from file: ' +
+                         self.infile+'\n')
+            rows = self._format_rows(list(profiles.values()), delim, value_fmt)
+            for loc, row in zip(profiles.keys(), rows):
+                stream.write(fmt.format(loc, delim) + row + '\n')
+            stream.write('\n')
+
+    @staticmethod
+    def _format_rows(vectors, delim, value_fmt):
+        r"""
+        Formats a list of equal length vectors as delimited lines of text
+        """
+        if not vectors:
+            return []
+        buffer = io.StringIO()
+        np.savetxt(buffer, np.vstack(vectors), fmt=value_fmt, delimiter=delim)
+        return buffer.getvalue().splitlines()
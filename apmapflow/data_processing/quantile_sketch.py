@@ -0,0 +1,188 @@
+"""
+================================================================================
+Quantile Sketch
+================================================================================
+| A mergeable streaming sketch to estimate percentiles of data that does not
+| fit in memory at once, such as every data map of a bulk run.
+
+"""
+import numpy as np
+from .. import _get_logger, PercentileEngine
+logger = _get_logger(__name__)
+
+# values are added to the sketch in chunks of this size to bound memory use
+_CHUNK_SIZE = 2**20
+
+
+class QuantileSketch(object):
+    r"""
+    KLL quantile sketch. Values are stored in a stack of compactors where
+    each value on level h represents 2**h values of the data. A full level
+    is sorted and every other value, starting at a random offset, is
+    promoted to the next level. The sketch uses O(k) memory regardless of
+    the number of values added and sketches can be merged in any order.
+
+    The percentile definition matches calc_percentile and results are exact
+    until more than k values have been added. Beyond that the ranks of all
+    estimated percentiles are within 2.446 / k**0.9433 * n of the true ranks
+    with 99% confidence, 1.65 percentile points for the default k = 200 and
+    0.45 for k = 800. This is the empirical bound of the KLL sketch and is
+    returned by the rank_error method. Estimates are always values that
+    were added to the sketch.
+
+    Parameters
+    ----------
+    k : int, optional
+        capacity of the top compactor, it controls the accuracy
+    seed : int, optional
+        seed of the random number generator used to compact levels
+    """
+    def __init__(self, k=200, seed=None):
+        super().__init__()
+        self.k = int(k)
+        self.num_vals = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.num_vals
+
+    @property
+    def num_retained(self):
+        r"""returns the number of values stored in the sketch"""
+        return sum(level.size for level in self.levels)
+
+    def capacity(self, level):
+        r"""
+        Returns the capacity of a level, capacities shrink geometrically
+        from k at the top level down to a minimum of 8.
+        """
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2.0 / 3.0)**depth)), 8)
+
+    def update(self, values):
+        r"""
+        Adds an array of values to the sketch, NaN values are skipped
+        """
+        values = np.ravel(values)
+        for start in range(0, values.size, _CHUNK_SIZE):
+            chunk = np.array(values[start:start+_CHUNK_SIZE], dtype=float)
+            chunk = chunk[~np.isnan(chunk)]
+            self.levels[0] = np.concatenate([self.levels[0], chunk])
+            self.num_vals += chunk.size
+            self._compress()
+
+    def update_field(self, field):
+        r"""
+        Adds the values of a DataField to the sketch, tiled fields are added
+        tile-by-tile.
+        """
+        tiles = getattr(field, 'iter_tiles', None)
+        if tiles is None:
+            self.update(field.data_vector)
+            return
+        for rows, tile in tiles():
+            self.update(tile)
+
+    def merge(self, other):
+        r"""
+        Adds the contents of another sketch to this one
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for i, level in enumerate(other.levels):
+            self.levels[i] = np.concatenate([self.levels[i], level])
+        self.num_vals += other.num_vals
+        self._compress()
+        #
+        return self
+
+    def _compress(self):
+        r"""
+        Compacts levels that are over capacity until every level fits
+        """
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if items.size <= self.capacity(level):
+                level += 1
+                continue
+            #
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            #
+            # an odd value out is kept on the current level
+            items = np.sort(items)
+            keep = items[:items.size % 2]
+            offset = self._rng.integers(2)
+            promoted = items[keep.size + offset::2]
+            self.levels[level] = keep
+            self.levels[level+1] = np.concatenate([self.levels[level+1],
+                                                   promoted])
+            #
+            # capacities change when a level is added so start over
+            level = 0
+
+    def _weighted_values(self):
+        r"""
+        Returns the sorted values and the cumulative weight of each
+        """
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2**i, dtype=np.int64)
+                                  for i, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='mergesort')
+        return values[order], np.cumsum(weights[order])
+
+    def percentiles(self, percs):
+        r"""
+        Returns the estimated value of each percentile in percs
+        """
+        if not self.num_vals:
+            raise ValueError('No values have been added to the sketch')
+        #
+        values, cum_weights = self._weighted_values()
+        total = cum_weights[-1]
+        inds = PercentileEngine.indices(percs, total)
+        inds = np.searchsorted(cum_weights, inds, side='right')
+        #
+        return values[np.minimum(inds, values.size - 1)]
+
+    def percentile(self, perc):
+        r"""
+        Returns the estimated value of a single percentile
+        """
+        return self.percentiles([perc])[0]
+
+    def rank_error(self):
+        r"""
+        Returns the bound on the normalized rank error of the estimates at
+        99% confidence, it is zero while the sketch is exact.
+        """
+        if len(self.levels) == 1:
+            return 0.0
+        return 2.446 / self.k**0.9433
+
+    def save(self, filename):
+        r"""
+        Writes the sketch to a file in the .npz format
+        """
+        sizes = [level.size for level in self.levels]
+        with open(filename, 'wb') as file:
+            np.savez(file, k=self.k, num_vals=self.num_vals,
+                     sizes=np.array(sizes, dtype=np.int64),
+                     values=np.concatenate(self.levels))
+
+    @classmethod
+    def load(cls, filename, seed=None):
+        r"""
+        Reads a sketch written by the save method
+        """
+        with np.load(filename) as data:
+            sketch = cls(k=int(data['k']), seed=seed)
+            sketch.num_vals = int(data['num_vals'])
+            bounds = np.cumsum(np.concatenate([[0], data['sizes']]))
+            values = data['values']
+            sketch.levels = [values[st:en] for st, en in
+                             zip(bounds[:-1], bounds[1:])]
+        #
+        return sketch
@@ -0,0 +1,172 @@
+"""
+================================================================================
+Result Cache
+================================================================================
+| An optional on-disk cache of processed data. When enabled the results of
+| BaseProcessor.process are stored keyed by the processor class, its
+| arguments and a hash of the data map, so processing an unchanged map again
+| with the same arguments loads the stored result instead.
+
+| The cache can be enabled by calling enable_result_cache or by setting the
+| APM_RESULT_CACHE environment variable to the directory to store results
+| in. The maximum size of the cache in MB can be set with
+| APM_RESULT_CACHE_SIZE, when exceeded the least recently used results are
+| removed. Keys include the _cache_version of each processor class, which
+| must be incremented when its results or _cached_attrs change so stale
+| entries are no longer used. The environment is read the first time the
+| cache is requested.
+
+| Entries are stored with pickle, which can run arbitrary code when an entry
+| is loaded, so the cache directory must only be writable by trusted users.
+
+"""
+from functools import partial
+import hashlib
+import os
+import pickle
+import numpy as np
+from .. import _get_logger
+from ..map_io import FileCache, env_cache_size
+logger = _get_logger(__name__)
+
+# environment variables used to enable the result cache
+CACHE_DIR_ENV = 'APM_RESULT_CACHE'
+CACHE_SIZE_ENV = 'APM_RESULT_CACHE_SIZE'
+
+# version of the stored entries, incremented when their format changes
+CACHE_VERSION = 1
+
+# default maximum size of the cache in MB
+DEFAULT_CACHE_SIZE = 512
+
+# arguments that only control where and how output is written
+IGNORED_ARGS = {
+    'files', 'func', 'processor', 'output_dir', 'jobs', 'verbose', 'force',
+    'no_write', 'screen', 'map_cache', 'result_cache', 'sketch_file',
+    'sketch_append'
+}
+
+
+class ResultCache(FileCache):
+    r"""
+    Stores processed data as pickle files in the cache directory. Entries are
+    keyed by a hash of the processor class, its arguments and the bytes of
+    the data map so the location of the source file does not matter. Least
+    recently used entries are removed first when the cache exceeds max_size.
+    Loading an entry unpickles it, so the cache directory must be trusted.
+
+    Parameters
+    ----------
+    cache_dir : string
+        directory to store results in, it is created if needed.
+    max_size : float, optional
+        maximum size of the cache directory in MB.
+    """
+    SUFFIX = '.pkl'
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        super().__init__(cache_dir, max_size)
+
+    @staticmethod
+    def key(processor):
+        r"""
+        Returns the hash of the processor, its version and data map or None
+        if the result can not be cached. Processors updating a quantile sketch are
+        not cached because the sketch is only updated when data is processed.
+        """
+        if processor.args.get('sketch') is not None:
+            return None
+        #
+        cls = type(processor)
+        args = sorted((k, v) for k, v in processor.args.items()
+                      if k not in IGNORED_ARGS)
+        data_map = processor.data_map
+        header = [CACHE_VERSION, cls.__module__, cls.__name__,
+                  cls._cache_version, cls._cached_attrs, args,
+                  data_map.shape, data_map.dtype.str]
+        #
+        hasher = hashlib.sha1(repr(header).encode('utf-8'))
+        if processor.tiled_field is not None:
+            rows_list = processor.tiled_field.tile_slices()
+        else:
+            rows_list = [slice(None)]
+        for rows in rows_list:
+            hasher.update(np.ascontiguousarray(data_map[rows]).data)
+        #
+        return hasher.hexdigest()
+
+    def entry_path(self, key):
+        r"""
+        Returns the path to the cache entry for the key
+        """
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+    def load(self, key):
+        r"""
+        Returns the dictionary of processor attributes stored for the key or
+        None if the result has not been cached. Entries that can not be read
+        are removed.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as file:
+                state = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            logger.warning('Removing unreadable cache entry %s: %r', path, err)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        #
+        # marking the entry as recently used
+        os.utime(path)
+        #
+        return state
+
+    def store(self, key, state):
+        r"""
+        Stores a dictionary of processor attributes in the cache and removes
+        old entries if the max_size of the cache has been exceeded.
+        """
+        write = partial(pickle.dump, state, protocol=pickle.HIGHEST_PROTOCOL)
+        return self._write_entry(self.entry_path(key), write)
+
+
+def enable_result_cache(cache_dir, max_size=DEFAULT_CACHE_SIZE):
+    r"""
+    Enables caching of processed data in the specified directory and
+    returns the ResultCache instance. max_size is in MB.
+    """
+    global _result_cache, _result_cache_env
+    _result_cache = ResultCache(cache_dir, max_size=max_size)
+    _result_cache_env = False
+    #
+    return _result_cache
+
+
+def disable_result_cache():
+    r"""
+    Disables caching of processed data, existing entries are not removed.
+    """
+    global _result_cache, _result_cache_env
+    _result_cache = None
+    _result_cache_env = False
+
+
+def get_result_cache():
+    r"""
+    Returns the active ResultCache or None if caching is disabled. The
+    cache is enabled from the environment on the first call if defined.
+    """
+    if _result_cache_env and os.environ.get(CACHE_DIR_ENV):
+        max_size = env_cache_size(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE)
+        enable_result_cache(os.environ[CACHE_DIR_ENV], max_size)
+    return _result_cache
+
+
+# the result cache is set up from the environment when first requested
+_result_cache = None
+_result_cache_env = True
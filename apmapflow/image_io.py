@@ -0,0 +1,200 @@
+"""
+================================================================================
+Image IO
+================================================================================
+| Memory-mapped access to 3-D image stacks. Uncompressed multi-page TIFF
+| files and headerless raw volumes are mapped directly as (nx, ny, nz)
+| arrays, so opening a stack does not read any pixel data and only the
+| frames that are accessed are paged into memory.
+
+| The TIFF reader walks the image file directories (IFDs) of classic and
+| BigTIFF files. A stack can be mapped when every page is an uncompressed
+| single channel image of the same size and type stored in contiguous
+| strips, with the same number of bytes between the start of each page.
+| Images where zero is white are rejected because PIL inverts their values.
+| Files written by FractureImageStack.save and most scanner software
+| meet these requirements, other files raise a ValueError and must be
+| decoded with PIL.
+
+|
+
+"""
+import struct
+import numpy as np
+
+# TIFF tags used to locate the pixel data of each page
+TIFF_TAGS = {
+    256: 'width', 257: 'height', 258: 'bits_per_sample',
+    259: 'compression', 262: 'photometric', 273: 'strip_offsets',
+    277: 'samples_per_pixel', 279: 'strip_byte_counts',
+    284: 'planar_config', 322: 'tile_width', 339: 'sample_format'
+}
+
+# struct format of each TIFF field type that can hold the tags above
+TIFF_TYPES = {1: 'B', 3: 'H', 4: 'I', 8: 'h', 9: 'i', 16: 'Q', 17: 'q'}
+
+# numpy dtype kind of each TIFF sample format
+SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+
+def read_tiff_pages(fname):
+    r"""
+    Returns the byte order of a TIFF file and a list of dictionaries holding
+    the tags of each page, only the tags in TIFF_TAGS are read. Values with
+    a count of one are stored as integers and the rest as tuples.
+    """
+    with open(fname, 'rb') as file:
+        header = file.read(16)
+        if header[0:2] not in (b'II', b'MM'):
+            raise ValueError('{} is not a TIFF file'.format(fname))
+        order = '<' if header[0:2] == b'II' else '>'
+        #
+        try:
+            magic = struct.unpack(order + 'H', header[2:4])[0]
+            if magic == 42:
+                fmt = {'count': 'H', 'entry': 'HHI4s', 'offset': 'I'}
+                offset = struct.unpack(order + 'I', header[4:8])[0]
+            elif magic == 43:
+                fmt = {'count': 'Q', 'entry': 'HHQ8s', 'offset': 'Q'}
+                offset = struct.unpack(order + 'Q', header[8:16])[0]
+            else:
+                raise ValueError('{} is not a TIFF file'.format(fname))
+            #
+            pages = []
+            visited = set()
+            while offset and offset not in visited:
+                visited.add(offset)
+                pages.append(_read_ifd(file, offset, order, fmt))
+                offset = _read_struct(file, order + fmt['offset'])[0]
+        except struct.error:
+            raise ValueError('{} has a truncated IFD'.format(fname))
+    #
+    return order, pages
+
+
+def _read_struct(file, fmt, offset=None):
+    r"""
+    Unpacks a struct from the current position or offset of the file
+    """
+    if offset is not None:
+        file.seek(offset)
+    size = struct.calcsize(fmt)
+    return struct.unpack(fmt, file.read(size))
+
+
+def _read_ifd(file, offset, order, fmt):
+    r"""
+    Reads the entries of the IFD at offset, leaving the file positioned at
+    the offset of the next IFD
+    """
+    num_entries = _read_struct(file, order + fmt['count'], offset)[0]
+    entries = [_read_struct(file, order + fmt['entry'])
+               for _ in range(num_entries)]
+    next_offset = file.tell()
+    #
+    tags = {}
+    for tag, field_type, count, value in entries:
+        if tag not in TIFF_TAGS or field_type not in TIFF_TYPES:
+            continue
+        value_fmt = '{}{}{}'.format(order, count, TIFF_TYPES[field_type])
+        if struct.calcsize(value_fmt) > len(value):
+            value_offset = struct.unpack(order + fmt['offset'], value)[0]
+            values = _read_struct(file, value_fmt, value_offset)
+        else:
+            values = struct.unpack_from(value_fmt, value)
+        tags[TIFF_TAGS[tag]] = values[0] if count == 1 else values
+    #
+    file.seek(next_offset)
+    return tags
+
+
+def tiff_stack_layout(fname):
+    r"""
+    Returns the (nx, ny, nz) shape, dtype, offset of the first page and the
+    number of bytes between pages of a TIFF stack that can be memory mapped,
+    a ValueError is raised describing why other files can not be mapped.
+    """
+    order, pages = read_tiff_pages(fname)
+    if not pages:
+        raise ValueError('{} has no pages'.format(fname))
+    #
+    layout = None
+    starts = []
+    for page in pages:
+        if page.get('compression', 1) != 1:
+            raise ValueError('{} is compressed'.format(fname))
+        if 'tile_width' in page or 'strip_offsets' not in page:
+            raise ValueError('{} is not stored in strips'.format(fname))
+        if page.get('samples_per_pixel', 1) != 1:
+            raise ValueError('{} has more than one channel'.format(fname))
+        if page.get('photometric', 1) != 1:
+            msg = '{} is not a black is zero grayscale image'
+            raise ValueError(msg.format(fname))
+        #
+        bits = page.get('bits_per_sample', 1)
+        if bits not in (8, 16, 32, 64):
+            msg = '{} has {} bits per sample'.format(fname, bits)
+            raise ValueError(msg)
+        kind = SAMPLE_KINDS.get(page.get('sample_format', 1))
+        if kind is None:
+            raise ValueError('{} has an unknown sample format'.format(fname))
+        dtype = np.dtype('{}{}{}'.format(order, kind, bits // 8))
+        #
+        page_layout = (page['width'], page['height'], dtype)
+        if layout is None:
+            layout = page_layout
+        elif page_layout != layout:
+            raise ValueError('{} has pages of differing sizes'.format(fname))
+        #
+        # strips of a page must be stored back to back
+        offsets = np.atleast_1d(page['strip_offsets'])
+        counts = np.atleast_1d(page['strip_byte_counts'])
+        if np.any(offsets[1:] != offsets[:-1] + counts[:-1]):
+            raise ValueError('{} has non-contiguous strips'.format(fname))
+        if np.sum(counts) < page['width'] * page['height'] * dtype.itemsize:
+            raise ValueError('{} has truncated pages'.format(fname))
+        starts.append(int(offsets[0]))
+    #
+    strides = np.diff(starts)
+    if strides.size and np.any(strides != strides[0]):
+        raise ValueError('{} pages are not evenly spaced'.format(fname))
+    #
+    nx, ny, dtype = layout
+    page_stride = int(strides[0]) if strides.size else 0
+    return (nx, ny, len(pages)), dtype, starts[0], page_stride
+
+
+def memmap_tiff(fname, mode='r'):
+    r"""
+    Memory maps an uncompressed TIFF stack as an (nx, ny, nz) array of the
+    raw pixel values, see tiff_stack_layout for the supported files. The
+    mode is passed to np.memmap, 'c' allows the array to be modified
+    without changing the file.
+    """
+    shape, dtype, offset, page_stride = tiff_stack_layout(fname)
+    nx, ny, nz = shape
+    page_size = nx * ny * dtype.itemsize
+    #
+    # mapping from the first page through the end of the last one
+    length = page_stride * (nz - 1) + page_size
+    buffer = np.memmap(fname, dtype=np.uint8, mode=mode, offset=offset,
+                       shape=(length,))
+    pages = np.ndarray((nz, ny, nx), dtype=dtype, buffer=buffer,
+                       strides=(page_stride, nx * dtype.itemsize,
+                                dtype.itemsize))
+    #
+    return pages.transpose(2, 1, 0)
+
+
+def memmap_raw(fname, shape, dtype=np.uint8, offset=0, mode='r'):
+    r"""
+    Memory maps a headerless raw volume as an (nx, ny, nz) array. The file
+    is stored as nz frames of ny rows of nx values, the same order as the
+    pages of a TIFF stack. Data starts after offset bytes, e.g. to skip a
+    header.
+    """
+    nx, ny, nz = shape
+    data = np.memmap(fname, dtype=dtype, mode=mode, offset=offset,
+                     shape=(nz, ny, nx))
+    #
+    return data.transpose(2, 1, 0)
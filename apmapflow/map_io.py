@@ -0,0 +1,535 @@
+"""
+================================================================================
+Map IO
+================================================================================
+| Handles reading of 2-D data maps from disk along with an optional binary
+| cache of previously parsed maps. When the cache is enabled a text map is
+| parsed once, stored as a .npy file and then memory-mapped on subsequent
+| reads until the map is modified.
+
+| The cache can be enabled by calling enable_map_cache or by setting the
+| APM_MAP_CACHE environment variable to the directory to store cached maps
+| in. The maximum size of the cache in MB can be set with APM_MAP_CACHE_SIZE,
+| when exceeded the least recently used maps are removed. The environment is
+| read the first time the cache is requested.
+
+| Text maps are parsed with np.loadtxt unless a number of threads is given,
+| in which case read_text_map splits the file into newline aligned chunks
+| and parses them on a thread pool directly into a preallocated array.
+| Files it can not handle are passed off to np.loadtxt. By default it uses
+| one thread per CPU, divided between the worker processes of parallel_map.
+
+| Maps can also be stored in binary form as .npy, .npz or .raw files. The
+| .raw format is a 32 byte header holding the nx, nz and dtype of the map
+| followed by the little-endian data. Both .npy and .raw files are memory
+| mapped when read so no data is copied until it is modified.
+
+|
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import warnings
+import numpy as np
+
+# ap_map_flow imports this module so _get_logger can not be used
+logger = logging.getLogger('APM.mapio')
+
+# environment variables used to enable the map cache
+CACHE_DIR_ENV = 'APM_MAP_CACHE'
+CACHE_SIZE_ENV = 'APM_MAP_CACHE_SIZE'
+
+# default maximum size of the cache in MB
+DEFAULT_CACHE_SIZE = 4096
+
+# size in bytes of the chunks text maps are split into for parsing
+TEXT_CHUNK_SIZE = 2**23
+
+# number of processes parsing maps at once, see set_num_workers
+_num_workers = 1
+
+# supported map formats and their file extensions
+MAP_FORMATS = {'txt': '.txt', 'npy': '.npy', 'npz': '.npz', 'raw': '.raw'}
+
+# raw map header: magic string and version, nx, nz and dtype string
+RAW_MAGIC = b'APMMAP\x01\x00'
+RAW_HEADER = struct.Struct('<8sQQ8s')
+
+
+class FileCache(object):
+    r"""
+    Base class of the on-disk caches. Each entry is a single file with the
+    SUFFIX of the cache in the cache directory. The modification time of an
+    entry marks when it was last used and the least recently used entries
+    are removed first when the cache exceeds max_size. Subclasses define
+    how entries are keyed, loaded and stored.
+
+    Parameters
+    ----------
+    cache_dir : string
+        directory to store entries in, it is created if needed.
+    max_size : float
+        maximum size of the cache directory in MB.
+    """
+    SUFFIX = '.cache'
+
+    def __init__(self, cache_dir, max_size):
+        super().__init__()
+        self.cache_dir = os.path.realpath(cache_dir)
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _write_entry(self, path, write):
+        r"""
+        Calls write with a binary file to create the entry at path and
+        removes old entries if the max_size of the cache has been exceeded.
+        """
+        # writing to a temporary file first so partial entries are never read
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as file:
+            write(file)
+        os.replace(tmp_path, path)
+        #
+        self.evict(keep=path)
+        #
+        return path
+
+    def entries(self):
+        r"""
+        Returns a list of (mtime, size, path) tuples for each cache entry,
+        ordered from least to most recently used.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as dir_entries:
+            for entry in dir_entries:
+                if not entry.name.endswith(self.SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        #
+        entries.sort()
+        return entries
+
+    def evict(self, keep=None):
+        r"""
+        Removes least recently used entries until the cache is no larger than
+        max_size. The entry at the keep path is never removed.
+        """
+        entries = self.entries()
+        cache_size = sum(entry[1] for entry in entries)
+        max_size = self.max_size * 2**20
+        #
+        for mtime, size, path in entries:
+            if cache_size <= max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # memory-mapped entries can not be removed on all platforms
+                continue
+            cache_size -= size
+
+    def clear(self):
+        r"""
+        Removes all entries from the cache
+        """
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class MapCache(FileCache):
+    r"""
+    Stores parsed data maps as .npy files in the cache directory. Entries
+    are keyed by the absolute path, size and modification time of the source
+    file so any change to the source file invalidates the entry. The
+    modification time of an entry is updated each time it is read and the
+    oldest entries are removed first when the cache exceeds max_size.
+
+    Parameters
+    ----------
+    cache_dir : string
+        directory to store cached maps in, it is created if needed.
+    max_size : float, optional
+        maximum size of the cache directory in MB.
+    """
+    SUFFIX = '.npy'
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        super().__init__(cache_dir, max_size)
+
+    def entry_path(self, infile, *args):
+        r"""
+        Returns the path to the cache entry for infile. Any additional
+        arguments affecting how the file is parsed are added to the key.
+        """
+        infile = os.path.realpath(infile)
+        stat = os.stat(infile)
+        key = [infile, stat.st_size, stat.st_mtime_ns] + list(args)
+        key = '|'.join(str(k) for k in key).encode('utf-8')
+        #
+        name = hashlib.sha1(key).hexdigest() + self.SUFFIX
+        return os.path.join(self.cache_dir, name)
+
+    def load(self, infile, *args):
+        r"""
+        Returns a copy-on-write memory map of the cached data map or None if
+        the infile has not been cached.
+        """
+        path = self.entry_path(infile, *args)
+        try:
+            data_map = np.load(path, mmap_mode='c')
+        except (OSError, ValueError):
+            return None
+        #
+        # marking the entry as recently used
+        os.utime(path)
+        #
+        return data_map
+
+    def store(self, infile, data_map, *args):
+        r"""
+        Stores the data map in the cache and removes old entries if the
+        max_size of the cache has been exceeded.
+        """
+        path = self.entry_path(infile, *args)
+        return self._write_entry(path, lambda file: np.save(file, data_map))
+
+
+def enable_map_cache(cache_dir, max_size=DEFAULT_CACHE_SIZE):
+    r"""
+    Enables caching of parsed data maps in the specified directory and
+    returns the MapCache instance. max_size is in MB.
+    """
+    global _map_cache, _map_cache_env
+    _map_cache = MapCache(cache_dir, max_size=max_size)
+    _map_cache_env = False
+    #
+    return _map_cache
+
+
+def disable_map_cache():
+    r"""
+    Disables caching of parsed data maps, existing entries are not removed.
+    """
+    global _map_cache, _map_cache_env
+    _map_cache = None
+    _map_cache_env = False
+
+
+def get_map_cache():
+    r"""
+    Returns the active MapCache or None if caching is disabled. The cache
+    is enabled from the environment on the first call if defined.
+    """
+    if _map_cache_env and os.environ.get(CACHE_DIR_ENV):
+        max_size = env_cache_size(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE)
+        enable_map_cache(os.environ[CACHE_DIR_ENV], max_size)
+    return _map_cache
+
+
+def env_cache_size(name, default):
+    r"""
+    Returns the cache size in MB stored in the named environment variable,
+    the default is returned with a warning if the value is not a number.
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        msg = 'Invalid %s value: %r, using the default of %s MB'
+        logger.warning(msg, name, value, default)
+        return default
+
+
+def sniff_delimiter(infile):
+    r"""
+    Determines the delimiter used in a data map by examining the characters
+    between the first two values in the file. None is returned for maps
+    delimited by whitespace.
+    """
+    with open(infile, 'r') as file:
+        line = file.readline()
+    #
+    pat = r'[-0-9.+eE]+([^-0-9.+eE]+)[-0-9.+eE]+'
+    match = re.search(pat, line)
+    delim = match.group(1).strip()
+    #
+    return None if not delim else delim
+
+
+def _split_text_map(buffer, end, chunk_size):
+    r"""
+    Splits the buffer into newline aligned chunks and returns a list of
+    (start, stop, num_rows) tuples. The end of the final chunk is the
+    last non-whitespace byte of the file.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    chunks = []
+    start = 0
+    while start < end:
+        stop = buffer.find(b'\n', min(start + chunk_size, end), end)
+        stop = end if stop == -1 else stop + 1
+        num_rows = int(np.count_nonzero(data[start:stop] == ord('\n')))
+        if stop == end:
+            num_rows += 1
+        chunks.append((start, stop, num_rows))
+        start = stop
+    #
+    return chunks
+
+
+def set_num_workers(workers):
+    r"""
+    Sets the number of processes sharing the CPUs, which divides the default
+    number of threads used by read_text_map. parallel_map calls this in each
+    of its worker processes.
+    """
+    global _num_workers
+    _num_workers = max(1, int(workers))
+
+
+def default_num_threads():
+    r"""
+    Returns the number of CPUs divided by the number of worker processes,
+    at least one thread is always used.
+    """
+    return max(1, (os.cpu_count() or 1) // _num_workers)
+
+
+def read_text_map(infile, delim=None, num_threads=None,
+                  chunk_size=TEXT_CHUNK_SIZE, outfile=None):
+    r"""
+    Reads a delimited text map in parallel. The file is memory mapped and
+    prescanned to get the number of rows and columns, then each chunk of
+    rows is parsed by a thread and written into the final array. A delim of
+    None or a tab splits values on any whitespace. If the number of values
+    in any chunk is inconsistent with the prescan the file is reread with
+    np.loadtxt so blank lines, comments and errors are handled identically.
+    When an outfile is given the values are parsed directly into a .npy file
+    which is returned as a writable memory map, so maps larger than the
+    available memory can be converted.
+
+    Parameters
+    ----------
+    infile : string
+        path to the map file
+    delim : string, optional
+        value delimiter, None for whitespace delimited files
+    num_threads : int, optional
+        number of threads to parse the file with, see default_num_threads
+    chunk_size : int, optional
+        approximate size in bytes of each chunk of rows
+    outfile : string, optional
+        path of a .npy file to store the parsed map in
+    """
+    def fallback():
+        data_map = np.loadtxt(infile, delimiter=delim)
+        if outfile is not None:
+            with open(outfile, 'wb') as file:
+                np.save(file, data_map)
+            data_map = np.load(outfile, mmap_mode='r+')
+        return data_map
+    #
+    if os.path.getsize(infile) == 0:
+        return fallback()
+    #
+    sep = ' ' if delim in (None, '\t') else delim
+    with open(infile, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    #
+    try:
+        # trailing whitespace is excluded so the row count is exact
+        end = len(buffer)
+        while end > 0 and buffer[end-1:end].isspace():
+            end -= 1
+        if end == 0:
+            return fallback()
+        #
+        line_end = buffer.find(b'\n', 0, end)
+        first_line = buffer[:end if line_end == -1 else line_end]
+        fields = first_line.decode('utf-8').split(None if sep == ' ' else sep)
+        num_cols = len(fields)
+        #
+        chunks = _split_text_map(buffer, end, chunk_size)
+        num_rows = sum(chunk[2] for chunk in chunks)
+        if outfile is None:
+            data_map = np.empty((num_rows, num_cols), dtype=float)
+        else:
+            data_map = np.lib.format.open_memmap(outfile, mode='w+',
+                                                 dtype=float,
+                                                 shape=(num_rows, num_cols))
+
+        def parse_chunk(row, chunk):
+            start, stop, chunk_rows = chunk
+            text = buffer[start:stop]
+            if sep != ' ':
+                text = text.rstrip().replace(b'\n', sep.encode('utf-8'))
+            values = np.fromstring(text, sep=sep)
+            if values.size != chunk_rows * num_cols:
+                return False
+            data_map[row:row+chunk_rows] = values.reshape(chunk_rows, num_cols)
+            return True
+        #
+        rows = np.cumsum([0] + [chunk[2] for chunk in chunks[:-1]])
+        with warnings.catch_warnings():
+            # malformed text is detected by the value count instead
+            warnings.simplefilter('ignore', DeprecationWarning)
+            num_threads = num_threads or default_num_threads()
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                valid = all(executor.map(parse_chunk, rows, chunks))
+    finally:
+        buffer.close()
+    #
+    if not valid:
+        del data_map
+        return fallback()
+    #
+    if outfile is not None:
+        data_map.flush()
+    #
+    # matching the dimensions returned by np.loadtxt
+    return np.squeeze(data_map)
+
+
+def get_map_format(filename):
+    r"""
+    Returns the map format based on the file extension, any extension
+    other than those of the binary formats is treated as a text map.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    for fmt, fmt_ext in MAP_FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    return 'txt'
+
+
+def map_file_name(filename, fmt):
+    r"""
+    Returns filename with its extension replaced by the one used for fmt,
+    text filenames are returned unchanged so .csv and similar are kept.
+    """
+    if fmt not in MAP_FORMATS:
+        msg = 'Invalid map format: {}, valid formats are: {}'
+        raise ValueError(msg.format(fmt, ', '.join(MAP_FORMATS)))
+    #
+    if fmt == 'txt':
+        return filename
+    return os.path.splitext(filename)[0] + MAP_FORMATS[fmt]
+
+
+def read_raw_map(infile, mmap_mode='c'):
+    r"""
+    Returns a memory map of the data stored in a raw map file. The default
+    mmap_mode of 'c' allows the map to be modified without changing the file.
+    """
+    with open(infile, 'rb') as file:
+        header = file.read(RAW_HEADER.size)
+    #
+    if len(header) < RAW_HEADER.size or header[:8] != RAW_MAGIC:
+        raise ValueError('{} is not a valid raw map file'.format(infile))
+    magic, nx, nz, dtype = RAW_HEADER.unpack(header)
+    dtype = np.dtype(dtype.rstrip(b'\x00').decode('ascii'))
+    #
+    return np.memmap(infile, dtype=dtype, mode=mmap_mode,
+                     offset=RAW_HEADER.size, shape=(nz, nx))
+
+
+def write_raw_map(outfile, data_map):
+    r"""
+    Writes a 2-D data map to a raw map file in little-endian byte order
+    """
+    data_map = np.atleast_2d(data_map)
+    if data_map.ndim != 2:
+        msg = 'raw maps must be 2-D, data has {} dimensions'
+        raise ValueError(msg.format(data_map.ndim))
+    dtype = data_map.dtype.newbyteorder('<')
+    #
+    nz, nx = data_map.shape
+    header = RAW_HEADER.pack(RAW_MAGIC, nx, nz, dtype.str.encode('ascii'))
+    with open(outfile, 'wb') as file:
+        file.write(header)
+        np.ascontiguousarray(data_map, dtype=dtype).tofile(file)
+
+
+def save_data_map(outfile, data_map, fmt=None, delim='\t', text_fmt='%.18e'):
+    r"""
+    Writes a data map to outfile in the specified format, if fmt is None
+    it is determined from the file extension. The delim and text_fmt
+    arguments are only used for text maps.
+    """
+    fmt = get_map_format(outfile) if fmt is None else fmt
+    if fmt not in MAP_FORMATS:
+        msg = 'Invalid map format: {}, valid formats are: {}'
+        raise ValueError(msg.format(fmt, ', '.join(MAP_FORMATS)))
+    #
+    # file objects are used so numpy does not alter the extension
+    if fmt == 'txt':
+        np.savetxt(outfile, data_map, fmt=text_fmt, delimiter=delim)
+    elif fmt == 'npy':
+        with open(outfile, 'wb') as file:
+            np.save(file, data_map)
+    elif fmt == 'npz':
+        with open(outfile, 'wb') as file:
+            np.savez_compressed(file, data_map=data_map)
+    else:
+        write_raw_map(outfile, data_map)
+
+
+def load_data_map(infile, delim='auto', use_cache=True, num_threads=None):
+    r"""
+    Reads a 2-D data map from a binary or delimited text file, the format
+    is determined from the file extension. Binary .npy and .raw maps are
+    memory mapped in copy-on-write mode. If the map cache has been enabled
+    and use_cache is True, previously parsed text maps are loaded from the
+    cache. Text maps are parsed with np.loadtxt unless num_threads is given,
+    then read_text_map is used, a value of 0 uses default_num_threads.
+    """
+    fmt = get_map_format(infile)
+    if fmt == 'npy':
+        return np.load(infile, mmap_mode='c')
+    elif fmt == 'npz':
+        with np.load(infile) as arrays:
+            key = 'data_map' if 'data_map' in arrays else arrays.files[0]
+            return arrays[key]
+    elif fmt == 'raw':
+        return read_raw_map(infile)
+    #
+    cache = get_map_cache() if use_cache else None
+    if cache is not None:
+        data_map = cache.load(infile, delim)
+        if data_map is not None:
+            return data_map
+    #
+    file_delim = sniff_delimiter(infile) if delim == 'auto' else delim
+    if num_threads is None:
+        data_map = np.loadtxt(infile, delimiter=file_delim)
+    else:
+        data_map = read_text_map(infile, delim=file_delim,
+                                 num_threads=num_threads)
+    #
+    if cache is not None:
+        cache.store(infile, data_map, delim)
+    #
+    return data_map
+
+
+# the map cache is set up from the environment when first requested
+_map_cache = None
+_map_cache_env = True
@@ -88,7 +88,7 @@ class BlockMeshDict(OpenFoamFile):
         if mesh_params is not None:
             self.mesh_params.update(mesh_params)
         #
-        self.point_data += 1E-6
+        self.point_data = self.point_data + 1E-6
         self.generate_simple_mesh()
 
     def _create_blocks(self, cell_mask):
@@ -283,11 +283,12 @@ class BlockMeshDict(OpenFoamFile):
         #
         # determining cells linked to a masked cell
         cell_mask = sp.where(~sp.ravel(cell_mask))[0]
-        inds = sp.in1d(self._field._cell_interfaces, cell_mask)
-        inds = sp.reshape(inds, (len(self._field._cell_interfaces), 2))
+        cell_interfaces = self._field.cell_interfaces
+        inds = sp.in1d(cell_interfaces, cell_mask)
+        inds = sp.reshape(inds, (len(cell_interfaces), 2))
         inds = inds[:, 0].astype(int) + inds[:, 1].astype(int)
         inds = (inds == 1)
-        links = self._field._cell_interfaces[inds]
+        links = cell_interfaces[inds]
         #
         # adjusting order so masked cells are all on links[:, 1]
         swap = sp.in1d(links[:, 0], cell_mask)
@@ -328,6 +329,7 @@ class BlockMeshDict(OpenFoamFile):
         # only saving the largest cluster
         cs_num, counts = sp.unique(cs_ids, return_counts=True)
         cs_num = cs_num[sp.argsort(counts)][-1]
+        self.data_vector = sp.copy(self.data_vector)
         self.data_vector[sp.where(cs_ids != cs_num)[0]] = 0.0
         self.data_map = sp.reshape(self.data_vector, (self.nz, self.nx))
         #
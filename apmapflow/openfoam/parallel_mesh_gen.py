@@ -280,6 +280,7 @@ class ParallelMeshGen(object):
                 cs_count = sp.zeros(num_cs, dtype=int)
                 for cs_num in cs_ids:
                     cs_count[cs_num] += 1
+                self.data_vector = sp.copy(self.data_vector)
                 self.data_vector[sp.where(cs_ids != sp.argmax(cs_count))[0]] = 0.0
                 self.data_map = sp.reshape(self.data_vector, self.data_map.shape)
             #
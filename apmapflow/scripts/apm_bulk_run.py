@@ -18,7 +18,7 @@ import argparse
 from argparse import RawDescriptionHelpFormatter as RawDesc
 import os
 import yaml
-from apmapflow import _get_logger, set_main_logger_level
+from apmapflow import _get_logger, set_main_logger_level, enable_map_cache
 from apmapflow.run_model import BulkRun, InputFile
 
 
@@ -36,6 +36,11 @@ parser.add_argument('-v', '--verbose', action='store_true',
 parser.add_argument('--start', action='store_true', default=False,
                     help='flag must be supplied to "start" the bulk run')
 
+parser.add_argument('--map-cache', type=os.path.realpath, default=None,
+                    help='''caches parsed data maps in the specified directory
+                    to speed up repeated reads, the APM_MAP_CACHE environment
+                    variable can be used instead''')
+
 parser.add_argument('input_files', nargs='+', type=os.path.realpath,
                     help='1 or more YAML input files to load')
 
@@ -49,6 +54,8 @@ def main():
     namespace = parser.parse_args()
     if namespace.verbose:
         set_main_logger_level('debug')
+    if namespace.map_cache:
+        enable_map_cache(namespace.map_cache)
 
     bulk_run = None
     msg = 'Processing {} run parameter files'
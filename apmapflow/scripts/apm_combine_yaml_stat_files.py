@@ -40,6 +40,14 @@ parser.add_argument('-r', '--recursive', action='store_true',
 parser.add_argument('-p', '--pattern', default='.*yaml',
                     help='Regular expression pattern to select files')
 
+parser.add_argument('-j', '--jobs', type=int, default=1,
+                    help='number of directories to scan concurrently')
+
+parser.add_argument('--index-file', type=os.path.realpath, default=None,
+                    help='''stores the contents of each directory searched in
+                    the file so repeated searches only re-read directories
+                    that have changed''')
+
 parser.add_argument('-o', '--output-dir',
                     type=os.path.realpath, default=os.getcwd(),
                     help='''outputs files to the specified
@@ -73,7 +81,9 @@ def main():
     # finding files
     files = files_from_directory(directory=args.directory,
                                  pattern=args.pattern,
-                                 deep=args.recursive)
+                                 deep=args.recursive,
+                                 workers=args.jobs,
+                                 index_file=args.index_file)
     if not files:
         msg = 'Pattern: {} found no files in searched directory: {}'
         logger.fatal(msg.format(args.pattern, args.directory))
@@ -18,7 +18,7 @@ import os
 import scipy as sp
 from scipy import stats as sp_stats
 from apmapflow import _get_logger, set_main_logger_level
-from apmapflow import FractureImageStack
+from apmapflow import PackedImageStack
 
 # setting up logger
 set_main_logger_level('info')
@@ -143,12 +143,10 @@ def main():
     if args.top:
         traces.append('top')
     #
-    # loading image data
+    # loading image data, voxels are stored as bits and slices unpacked
     logger.info('loading image...')
-    image_data = FractureImageStack(args.image_file)
-    if args.invert:
-        logger.debug('inverting image data')
-        image_data = ~image_data
+    image_data = PackedImageStack.from_image_file(args.image_file,
+                                                  invert=args.invert)
     logger.debug('image dimensions: {} {} {}'.format(*image_data.shape))
     #
     # processing data along each axis
@@ -14,10 +14,12 @@ For usage information run: ``apm_generate_aperture_map -h``
 """
 import argparse
 from argparse import RawDescriptionHelpFormatter as RawDesc
+from functools import partial
 import os
 import scipy as sp
 from apmapflow import _get_logger, set_main_logger_level
 from apmapflow import FractureImageStack
+from apmapflow.map_io import MAP_FORMATS, map_file_name, save_data_map
 
 # setting up logger
 set_main_logger_level('info')
@@ -41,6 +43,11 @@ parser.add_argument('-o', '--output-dir',
 parser.add_argument('-i', '--invert', action='store_true',
                     help='use this flag if your fracture is in black')
 
+parser.add_argument('--output-format', choices=list(MAP_FORMATS), default='txt',
+                    help='''format to save the aperture map in, the file
+                    extension is updated to match binary formats
+                    (default: %(default)s)''')
+
 parser.add_argument('image_file', type=os.path.realpath,
                     help='binary TIF stack image to process')
 
@@ -68,26 +75,33 @@ def main():
     args.aperture_map_name = args.aperture_map_name.format(image_file=image_file)
     #
     map_path = os.path.join(args.output_dir, args.aperture_map_name)
+    map_path = map_file_name(map_path, args.output_format)
     if os.path.exists(map_path) and not args.force:
         msg = '{} already exists, use "-f" option to overwrite'
         raise FileExistsError(msg.format(map_path))
     os.makedirs(os.path.split(map_path)[0], exist_ok=True)
 
-    # loading image data
-    logger.info('loading image...')
-    img_data = FractureImageStack(args.image_file)
-    if args.invert:
-        logger.debug('inverting image data')
-        img_data = ~img_data
-    logger.debug('image dimensions: {} {} {}'.format(*img_data.shape))
-
-    # summing data array down into a 2-D map
-    logger.info('creating 2-D aperture map...')
-    aperture_map = img_data.create_aperture_map()
+    # the full image is only loaded when it is needed for the colored stack
+    if not args.gen_colored_stack:
+        logger.info('creating 2-D aperture map frame by frame...')
+        aperture_map = FractureImageStack.reduce_frames(
+            args.image_file, partial(_frame_aperture, invert=args.invert))
+    else:
+        # loading image data
+        logger.info('loading image...')
+        img_data = FractureImageStack(args.image_file)
+        if args.invert:
+            logger.debug('inverting image data')
+            img_data = ~img_data
+        logger.debug('image dimensions: {} {} {}'.format(*img_data.shape))
+
+        # summing data array down into a 2-D map
+        logger.info('creating 2-D aperture map...')
+        aperture_map = img_data.create_aperture_map()
 
     # saving map
     logger.info('saving aperture map as {}'.format(map_path))
-    sp.savetxt(map_path, aperture_map, fmt='%d', delimiter='\t')
+    save_data_map(map_path, aperture_map, fmt=args.output_format, text_fmt='%d')
 
     # generating colored stack if desired
     if args.gen_colored_stack:
@@ -100,18 +114,26 @@ def main():
         image.save(filename, overwrite=args.force)
 
 
+def _frame_aperture(frame, invert=False):
+    r"""
+    Returns the aperture of each X-Z column in a single frame
+    """
+    if invert:
+        frame = ~frame
+    return sp.sum(frame, axis=1, dtype=int)
+
+
 def gen_colored_image_stack(img_data, aperture_map):
     r"""
     Handles producing a colored image
     """
     # transpose map so it matches image data orientation
-    aperture_map = aperture_map.T
-    aperture_map[aperture_map > 255] = 255
+    colors = sp.minimum(aperture_map.T, 255).astype(sp.uint8)
 
     # color each X-Z column of the image stack according to it's aperture
+    # by broadcasting the colors along the y axis
     logger.debug('creating colored image stack')
-    x_coords, y_coords, z_coords = img_data.get_fracture_voxels(coordinates=True)
-    img_data = sp.zeros(img_data.shape, dtype=sp.uint8)
-    img_data[x_coords, y_coords, z_coords] = aperture_map[x_coords, z_coords]
+    img_data = sp.multiply(img_data.view(sp.ndarray), colors[:, sp.newaxis, :],
+                           dtype=sp.uint8)
     #
     return img_data.view(FractureImageStack)
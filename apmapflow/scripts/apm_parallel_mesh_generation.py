@@ -18,6 +18,7 @@ import argparse
 from argparse import RawDescriptionHelpFormatter as RawDesc
 import os
 from apmapflow import DataField, _get_logger, set_main_logger_level
+from apmapflow import enable_map_cache
 from apmapflow.openfoam import ParallelMeshGen
 
 
@@ -53,6 +54,11 @@ parser.add_argument('-sys', '--system-path',
 parser.add_argument('-np', type=int, default=8,
                     help='number of processors to use in mesh generation')
 
+parser.add_argument('--map-cache', type=os.path.realpath, default=None,
+                    help='''caches parsed data maps in the specified directory
+                    to speed up repeated reads, the APM_MAP_CACHE environment
+                    variable can be used instead''')
+
 parser.add_argument('map_file', type=os.path.realpath,
                     help='aperture map input file to read in')
 
@@ -75,6 +81,9 @@ def main():
     if namespace.verbose:
         set_main_logger_level('debug')
     #
+    if namespace.map_cache:
+        enable_map_cache(namespace.map_cache)
+    #
     # initial mesh parameters
     mesh_params = {
         'convertToMeters': '2.680E-5',
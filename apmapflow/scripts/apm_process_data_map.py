@@ -15,7 +15,8 @@ import argparse
 from argparse import RawDescriptionHelpFormatter as RawDesc
 import os
 import re
-from apmapflow import _get_logger, set_main_logger_level, DataField
+from apmapflow import _get_logger, set_main_logger_level
+from apmapflow import enable_map_cache
 from apmapflow import data_processing
 
 #
@@ -38,6 +39,17 @@ parser.add_argument('-W', '--no-write', action='store_true',
 
 parser.add_argument('-s', '--screen', action='store_true',
                     help="print data to screen (default: %(default)s)")
+
+parser.add_argument('--map-cache', type=os.path.realpath, default=None,
+                    help='''caches parsed data maps in the specified directory
+                    to speed up repeated reads, the APM_MAP_CACHE environment
+                    variable can be used instead''')
+
+parser.add_argument('--result-cache', type=os.path.realpath, default=None,
+                    help='''caches processed data in the specified directory so
+                    unchanged maps are not processed again, the
+                    APM_RESULT_CACHE environment variable can be used
+                    instead''')
 #
 # defining sub-parsers
 subparse_parent = argparse.ArgumentParser(add_help=False)
@@ -48,6 +60,10 @@ subparse_parent.add_argument('-o', '--output-dir',
                              type=os.path.realpath, default=os.getcwd(),
                              help='''outputs files to the specified
                              directory, sub-directories are created as needed''')
+subparse_parent.add_argument('-j', '--jobs', type=int, default=1,
+                             help='''number of worker processes used to load
+                             and process files, 0 uses one per CPU
+                             (default: %(default)s)''')
 subparsers = parser.add_subparsers(dest='processor',
                                    title='Data Processing Commands',
                                    metavar='{command}')
@@ -73,30 +89,70 @@ def main():
     if args.verbose:
         set_main_logger_level('debug')
     #
-    process_files(args)
+    if args.map_cache:
+        enable_map_cache(args.map_cache)
+    #
+    if args.result_cache:
+        data_processing.enable_result_cache(args.result_cache)
+    #
+    if args.func is data_processing.ProcessingPipeline:
+        process_pipeline(args)
+    elif args.func is data_processing.HistogramAggregate:
+        process_aggregate(args)
+    else:
+        process_files(args)
+
+
+def process_pipeline(args):
+    r"""
+    Runs every action of the pipeline on each input map, loading each map
+    only once
+    """
+    pipeline = args.func.from_action_strings(args.actions)
+    _run_pipeline(pipeline, args)
+
+
+def process_aggregate(args):
+    r"""
+    Combines the histograms of every input map into a single table that
+    uses one set of bins
+    """
+    agg = args.func.from_args(args)
+    filename = os.path.join(args.output_dir, agg.outfile_name)
+    if not args.no_write and os.path.exists(filename) and not args.force:
+        msg = '{} already exists, use "-f" option to overwrite'
+        raise FileExistsError(msg.format(filename))
+    #
+    agg.process_files(args.files)
+    if args.sketch_file and not os.path.exists(args.sketch_file):
+        if len(agg.sketch):
+            agg.sketch.save(args.sketch_file)
+    #
+    if args.screen:
+        agg.gen_output(delim='\t')
+        agg.print_data()
+    #
+    if not args.no_write:
+        agg.gen_output(delim=',')
+        agg.write_data(path=args.output_dir)
 
 
 def process_files(args):
     r"""
     Handles processing of the input maps based on the supplied arguments
     """
-    for file in args.files:
-        field = DataField(file)
-        processor = args.func(field, **args.__dict__)
-        processor.process()
-
-        # printing data to screen if -s flag
-        if args.screen:
-            processor.gen_output(delim='\t')
-            processor.print_data()
-
-        # writing data if -W was not used
-        if not args.no_write:
-            processor.gen_output(delim=',')
-            #
-            filename = os.path.join(args.output_dir, processor.outfile_name)
-            if os.path.exists(filename) and not args.force:
-                msg = '{} already exists, use "-f" option to overwrite'
-                raise FileExistsError(msg.format(filename))
-            #
-            processor.write_data(path=args.output_dir)
+    # the file list is left out since it is sent to every worker process
+    kwargs = {k: v for k, v in args.__dict__.items() if k != 'files'}
+    pipeline = data_processing.ProcessingPipeline([(args.func, kwargs)])
+    _run_pipeline(pipeline, args)
+
+
+def _run_pipeline(pipeline, args):
+    r"""
+    Processes the input files with the pipeline, printing and writing
+    output based on the supplied arguments
+    """
+    workers = args.jobs if args.jobs > 0 else None
+    pipeline.process_files(args.files, output_dir=args.output_dir,
+                           workers=workers, screen=args.screen,
+                           write=not args.no_write, overwrite=args.force)
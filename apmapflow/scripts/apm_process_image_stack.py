@@ -27,6 +27,8 @@ from scipy.sparse import csgraph
 from scipy.interpolate import griddata
 from apmapflow import _get_logger, set_main_logger_level
 from apmapflow import DataField, calc_percentile, FractureImageStack
+from apmapflow import PackedImageStack
+from apmapflow.map_io import MAP_FORMATS, map_file_name, save_data_map
 
 
 # setting up logger
@@ -68,6 +70,11 @@ parser.add_argument('--img-stack-name', default=None,
 parser.add_argument('--gen-cluster-img', action='store_true',
                     help='generates a tiff image colored by cluster number')
 
+parser.add_argument('--output-format', choices=list(MAP_FORMATS), default='txt',
+                    help='''format to save the aperture and offset maps in,
+                    the file extension is updated to match binary formats
+                    (default: %(default)s)''')
+
 parser.add_argument('--no-aper-map', action='store_true',
                     help='do not generate aperture map')
 
@@ -85,7 +92,9 @@ parser.add_argument('image_file', type=os.path.realpath,
 def main():
     r"""
     Driver program to load an image and generate maps. Memory
-    requirements when processing a large TIFF stack can be very high.
+    requirements when processing a large TIFF stack can be very high
+    when clusters are removed, otherwise the maps are generated reading
+    a single frame at a time.
     """
     # parsing commandline args
     args = parser.parse_args()
@@ -105,7 +114,9 @@ def main():
         args.img_stack_name = img_basename + '-processed.tif'
     #
     aper_map_file = os.path.join(args.output_dir, args.aper_map_name)
+    aper_map_file = map_file_name(aper_map_file, args.output_format)
     offset_map_file = os.path.join(args.output_dir, args.offset_map_name)
+    offset_map_file = map_file_name(offset_map_file, args.output_format)
     img_stack_file = os.path.join(args.output_dir, args.img_stack_name)
     #
     # checking paths
@@ -124,12 +135,20 @@ def main():
             msg = '{} already exists, use "-f" option to overwrite'
             raise FileExistsError(msg.format(img_stack_file))
     #
-    # loading image data
+    # without cluster removal the maps are built one frame at a time
+    if not args.num_clusters:
+        logger.info('creating maps frame by frame...')
+        maps = FractureImageStack.extract_maps(args.image_file,
+                                               invert=args.invert,
+                                               no_data_fill=sp.nan)
+        save_maps(args, maps['aperture'], maps['offset'],
+                  aper_map_file, offset_map_file)
+        return
+    #
+    # loading image data, voxels are stored as bits to reduce memory use
     logger.info('loading image...')
-    img_data = FractureImageStack(args.image_file)
-    if args.invert:
-        logger.debug('inverting image data')
-        img_data = ~img_data
+    img_data = PackedImageStack.from_image_file(args.image_file,
+                                                invert=args.invert)
     logger.debug('image dimensions: {} {} {}'.format(*img_data.shape))
     #
     # processing image stack based on connectivity
@@ -142,26 +161,38 @@ def main():
         img_data = process_image(img_data, args.num_clusters, **kwargs)
 
     #
-    # outputing aperture map
+    # outputing maps
+    aper_map = None
     if not args.no_aper_map:
         aper_map = img_data.create_aperture_map()
+    offset_map = None
+    if not args.no_offset_map:
+        offset_map = img_data.create_offset_map(no_data_fill=sp.nan)
+    save_maps(args, aper_map, offset_map, aper_map_file, offset_map_file)
+    del aper_map, offset_map
+    #
+    # saving image data
+    if not args.no_img_stack:
+        logger.info('saving copy of processed image data')
+        img_data.save(img_stack_file, overwrite=args.force)
+
+
+def save_maps(args, aper_map, offset_map, aper_map_file, offset_map_file):
+    r"""
+    Saves the aperture map and the smoothed offset map unless disabled
+    """
+    if not args.no_aper_map:
         logger.info('saving aperture map file')
-        sp.savetxt(aper_map_file, aper_map, fmt='%d', delimiter='\t')
-        del aper_map
+        save_data_map(aper_map_file, aper_map, fmt=args.output_format,
+                      text_fmt='%d')
     #
-    # outputing offset map
     if not args.no_offset_map:
-        offset_map = calculate_offset_map(img_data)
+        offset_map = smooth_offset_map(offset_map)
         #
         # saving map
         logger.info('saving offset map file')
-        sp.savetxt(offset_map_file, offset_map, fmt='%f', delimiter='\t')
-        del offset_map
-    #
-    # saving image data
-    if args.num_clusters and not args.no_img_stack:
-        logger.info('saving copy of processed image data')
-        img_data.save(img_stack_file, overwrite=args.force)
+        save_data_map(offset_map_file, offset_map, fmt=args.output_format,
+                      text_fmt='%f')
 
 
 def process_image(img_data, num_clusters, **kwargs):
@@ -184,14 +215,7 @@ def process_image(img_data, num_clusters, **kwargs):
     # reconstructing 3-D array
     logger.info('reconstructing processed data back into 3-D array')
     #
-    img_data = sp.zeros(img_dims, dtype=bool)
-    x_coords, y_coords, z_coords = sp.unravel_index(nonzero_locs, img_dims)
-    #
-    del nonzero_locs
-    img_data[x_coords, y_coords, z_coords] = True
-    del x_coords, y_coords, z_coords
-    #
-    return img_data.view(FractureImageStack)
+    return PackedImageStack.from_voxels(nonzero_locs, img_dims)
 
 
 def calculate_offset_map(img_data):
@@ -202,6 +226,14 @@ def calculate_offset_map(img_data):
     logger.info('creating initial offset map')
     offset_map = img_data.create_offset_map(no_data_fill=sp.nan)
     #
+    return smooth_offset_map(offset_map)
+
+
+def smooth_offset_map(offset_map):
+    r"""
+    Interpolates the missing (NaN) values of an offset map and filters out
+    steep gradients
+    """
     logger.info('interpolating missing data due to zero aperture zones')
     offset_map = patch_holes(offset_map)
     offset_map = filter_high_gradients(offset_map)
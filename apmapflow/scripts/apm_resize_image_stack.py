@@ -15,6 +15,7 @@ For usage information run: ``apm_resize_image_stack -h``
 import argparse
 from argparse import RawDescriptionHelpFormatter as RawDesc
 import os
+import scipy as sp
 from apmapflow import _get_logger, set_main_logger_level
 from apmapflow import FractureImageStack
 
@@ -90,10 +91,19 @@ def resize_image(image_file, invert):
         image = ~image
     logger.debug('image dimensions: {} {} {}'.format(*image.shape))
     #
-    x_coords, y_coords, z_coords = image.get_fracture_voxels(coordinates=True)
-    y_min = max(0, y_coords.min() - 10)
-    y_max = min(image.ny, y_coords.max() + 10)
+    y_min, y_max = fracture_extent(image)
+    y_min = max(0, y_min - 10)
+    y_max = min(image.ny, y_max + 10)
     image = image[:, y_min:y_max, :]
     logger.debug(' new image dimensions: {} {} {}'.format(*image.shape))
     #
     return image
+
+
+def fracture_extent(image):
+    r"""
+    Returns the first and last y index containing fracture voxels, the
+    fracture is projected onto the y axis instead of finding every voxel
+    """
+    y_coords = sp.flatnonzero(sp.any(image.view(sp.ndarray), axis=(0, 2)))
+    return y_coords.min(), y_coords.max()
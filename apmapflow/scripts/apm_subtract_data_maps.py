@@ -18,6 +18,9 @@ from argparse import RawDescriptionHelpFormatter as RawDesc
 import os
 import scipy as sp
 from apmapflow import _get_logger, set_main_logger_level, DataField
+from apmapflow import iter_infile_list
+from apmapflow import enable_map_cache
+from apmapflow.map_io import MAP_FORMATS, map_file_name, save_data_map
 from apmapflow.data_processing import Percentiles
 
 
@@ -49,6 +52,15 @@ parser.add_argument('-on', '--post-normalize', action='store_true',
 parser.add_argument('-abs', '--post-abs', action='store_true',
                     help="takes the absolute value of the map after subtraction")
 
+parser.add_argument('--map-cache', type=os.path.realpath, default=None,
+                    help='''caches parsed data maps in the specified directory
+                    to speed up repeated reads, the APM_MAP_CACHE environment
+                    variable can be used instead''')
+
+parser.add_argument('--output-format', choices=list(MAP_FORMATS), default='txt',
+                    help='''format to save data maps in, the file extension is
+                    updated to match binary formats (default: %(default)s)''')
+
 parser.add_argument('map_file', type=os.path.realpath,
                     help='corresponding aperture map for data maps')
 
@@ -75,58 +87,57 @@ def main():
     if args.verbose:
         set_main_logger_level('debug')
     #
+    if args.map_cache:
+        enable_map_cache(args.map_cache)
+    #
     # testing output map path
-    if os.path.exists(args.out_name) and not args.force:
+    filename = os.path.join(args.output_dir, args.out_name)
+    filename = map_file_name(filename, args.output_format)
+    if os.path.exists(filename) and not args.force:
         msg = '{} already exists, use "-f" option to overwrite'
-        raise FileExistsError(msg.format(args.out_name))
+        raise FileExistsError(msg.format(filename))
     #
-    aper_map, data_map1, data_map2 = prepare_maps(args)
-    result = process_maps(aper_map, data_map1, data_map2, args)
+    data_map1, data_map2 = prepare_maps(args)
+    result = process_maps(data_map1, data_map2, args)
     #
     # writing out resultant data map
-    filename = os.path.join(args.output_dir, args.out_name)
-    sp.savetxt(filename, result.data_map, delimiter='\t')
+    save_data_map(filename, result.data_map, fmt=args.output_format)
 
 
 def prepare_maps(args):
     r"""
     loads the aperture map and data maps and then masks zero aperture zones
-    as well as performs pre-subtraction normalization if desired.
+    as well as performs pre-subtraction normalization if desired. The second
+    data map is read in the background while the first is processed.
     """
     #
-    # loading files
+    # only the zero aperture zones of the aperture map are needed
     aper_map = DataField(args.map_file)
-    data_map1 = DataField(args.data_file1)
-    data_map2 = DataField(args.data_file2)
+    zero_aper = aper_map.data_map == 0
+    del aper_map
     #
-    # generating percentiles of each data field
+    data_maps = []
     msg = 'Percentiles of data map: '
-    logger.info(msg + os.path.basename(args.data_file1))
-    output_percentile_set(data_map1, args)
-    #
-    logger.info(msg + os.path.basename(args.data_file2))
-    output_percentile_set(data_map2, args)
-    #
-    # masking zero aperture zones
-    data_map1 = data_map1.data_vector
-    data_map2 = data_map2.data_vector
-    data_map1[sp.where(aper_map.data_vector == 0)] = 0
-    data_map2[sp.where(aper_map.data_vector == 0)] = 0
-    #
-    # normalizing data maps if desired
-    if args.pre_normalize:
-        data_map1 = data_map1 / sp.amax(sp.absolute(data_map1))
-        data_map2 = data_map1 / sp.amax(sp.absolute(data_map2))
-    #
-    # reshaping data maps back into 2-D arrays
-    data_map1 = sp.reshape(data_map1, aper_map.data_map.shape)
-    data_map2 = sp.reshape(data_map2, aper_map.data_map.shape)
-    #
-    #
-    return aper_map, data_map1, data_map2
-
-
-def process_maps(aper_map, data_map1, data_map2, args):
+    for field in iter_infile_list([args.data_file1, args.data_file2]):
+        #
+        # generating percentiles of each data field
+        logger.info(msg + os.path.basename(field.infile))
+        output_percentile_set(field, args)
+        #
+        # masking zero aperture zones
+        data_map = field.data_map
+        data_map[zero_aper] = 0
+        #
+        # normalizing data maps if desired
+        if args.pre_normalize:
+            data_map = data_map / sp.amax(sp.absolute(data_map))
+        #
+        data_maps.append(data_map)
+    #
+    return data_maps
+
+
+def process_maps(data_map1, data_map2, args):
     r"""
     subtracts the data maps and then calculates percentiles of the result
     before outputting a final map to file.
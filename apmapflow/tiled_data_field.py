@@ -0,0 +1,299 @@
+"""
+================================================================================
+Tiled Data Field
+================================================================================
+| A memory-mapped variant of the DataField class for maps larger than the
+| available memory. The map is only ever read in bands of rows (tiles) and
+| statistics used by the data processors are calculated tile-by-tile.
+
+|
+
+"""
+import math
+import os
+import tempfile
+import weakref
+import numpy as np
+from .ap_map_flow import DataField, PercentileEngine, _get_logger
+from .map_io import get_map_cache, get_map_format, load_data_map
+from .map_io import read_text_map, sniff_delimiter
+logger = _get_logger(__name__)
+
+# default memory budget for a single tile in MB
+DEFAULT_TILE_MEMORY = 64
+
+# number of bits of the sort key resolved on each pass of a selection
+_RADIX_BITS = 16
+
+
+def _sort_keys(values):
+    r"""
+    Maps values onto unsigned 64 bit integers that sort in the same order
+    as the values themselves.
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.int64)
+    keys = bits ^ ((bits >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))
+    return keys.view(np.uint64) ^ np.uint64(1 << 63)
+
+
+def _key_to_value(key):
+    r"""
+    Inverts _sort_keys for a single key
+    """
+    key = np.array([key], dtype=np.uint64) ^ np.uint64(1 << 63)
+    bits = key.view(np.int64)
+    bits = bits ^ ((bits >> 63) & np.int64(0x7FFFFFFFFFFFFFFF))
+    return bits.view(np.float64)[0]
+
+
+class TiledDataField(DataField):
+    r"""
+    DataField backed by a memory map that is processed in tiles of rows to
+    keep memory use bounded. Binary .npy and .raw maps are mapped directly.
+    Text maps are first parsed into a .npy file stored in the map cache if
+    it is enabled, otherwise in a temporary file removed along with the
+    field. The file is written in the cache directory or temp_dir so it is
+    never held in a memory backed temporary filesystem. The data_map,
+    data_vector, nx and nz properties are the same as a DataField but
+    derived data such as point data and the adjacency matrix are still
+    created in memory.
+
+    Parameters
+    ----------
+    field_data : string or ndarray
+        path to a map file or an existing (memory mapped) array
+    tile_size : int, optional
+        number of rows in each tile, by default it is set by tile_memory
+    tile_memory : float, optional
+        approximate memory budget in MB for processing a single tile
+    temp_dir : string, optional
+        directory to convert text maps in when the map cache is disabled,
+        by default the directory of the map file
+    """
+    def __init__(self, field_data, tile_size=None,
+                 tile_memory=DEFAULT_TILE_MEMORY, temp_dir=None, **kwargs):
+        self.tile_memory = tile_memory
+        self.temp_dir = temp_dir
+        self._tile_size = tile_size
+        super().__init__(field_data, **kwargs)
+
+    @property
+    def tile_size(self):
+        r"""returns the number of rows in each tile"""
+        if self._tile_size is not None:
+            return self._tile_size
+        # a tile, its sort keys and temporaries need ~32 bytes per value
+        row_size = max(self.nx, 1) * 32
+        return max(int(self.tile_memory * 2**20 // row_size), 1)
+
+    @tile_size.setter
+    def tile_size(self, tile_size):
+        r"""sets the number of rows in each tile"""
+        self._tile_size = tile_size
+
+    @property
+    def num_tiles(self):
+        r"""returns the number of tiles in the map"""
+        return int(math.ceil(self.nz / float(self.tile_size)))
+
+    def _init_from_file(self, infile, delim, num_threads=None):
+        r"""
+        Memory maps binary files directly and converts text files to a .npy
+        file that is then memory mapped.
+        """
+        self.infile = infile
+        if get_map_format(infile) != 'txt':
+            data_map = load_data_map(infile)
+            self._init_from_data(data_map, copy=False)
+            return
+        #
+        cache = get_map_cache()
+        if cache is not None:
+            data_map = cache.load(infile, delim)
+            if data_map is not None:
+                self._init_from_data(data_map, copy=False)
+                return
+        #
+        # converting on the same filesystem as the cache so it can be moved
+        if cache is not None:
+            temp_dir = cache.cache_dir
+        elif self.temp_dir is not None:
+            temp_dir = self.temp_dir
+        else:
+            temp_dir = os.path.dirname(os.path.abspath(infile))
+        #
+        file_delim = sniff_delimiter(infile) if delim == 'auto' else delim
+        fd, npy_file = tempfile.mkstemp(suffix='.tmp', prefix='apm-tiled-',
+                                        dir=temp_dir)
+        os.close(fd)
+        logger.debug('converting %s to %s', infile, npy_file)
+        try:
+            data_map = read_text_map(infile, delim=file_delim,
+                                     num_threads=num_threads, outfile=npy_file)
+            #
+            if cache is not None:
+                del data_map
+                path = cache.entry_path(infile, delim)
+                os.replace(npy_file, path)
+                cache.evict(keep=path)
+                data_map = cache.load(infile, delim)
+            else:
+                # the temporary file is removed when the field is destroyed
+                weakref.finalize(self, _remove_file, npy_file)
+                npy_file = None
+        finally:
+            if npy_file is not None:
+                _remove_file(npy_file)
+        #
+        self._init_from_data(data_map, copy=False)
+
+    def _init_from_data(self, data_map, copy=True):
+        r"""
+        Stores the supplied array, memory maps are never copied so they are
+        used directly and modified by threshold_data if writable.
+        """
+        data_map = np.asanyarray(data_map)
+        if data_map.ndim != 2:
+            msg = 'A 2-D data map is required, data has {} dimensions'
+            raise ValueError(msg.format(data_map.ndim))
+        if copy and not isinstance(data_map, np.memmap):
+            data_map = np.copy(data_map)
+        self._data_map = data_map
+
+    def tile_slices(self):
+        r"""
+        Yields the row slice of each tile in the map
+        """
+        tile_size = self.tile_size
+        for start in range(0, self.nz, tile_size):
+            yield slice(start, min(start + tile_size, self.nz))
+
+    def iter_tiles(self):
+        r"""
+        Yields (row_slice, tile) pairs where the tile is an in memory copy of
+        the rows in the slice.
+        """
+        for rows in self.tile_slices():
+            yield rows, np.array(self._data_map[rows])
+
+    def copy_data(self, obj):
+        r"""
+        Copies read only views of the data onto another object along with a
+        reference to the field so processors can work tile-by-tile.
+        """
+        super().copy_data(obj)
+        obj.tiled_field = self
+
+    def threshold_data(self, min_value=None, max_value=None, repl=np.nan):
+        r"""
+        Thresholds the data map tile-by-tile, values outside of the range are
+        set to the replacement value.
+        """
+        for rows in self.tile_slices():
+            tile = self._data_map[rows]
+            if min_value is not None:
+                tile[tile <= min_value] = repl
+            if max_value is not None:
+                tile[tile >= max_value] = repl
+        #
+        self.clear_cache()
+
+    def data_range(self):
+        r"""
+        Returns the smallest and largest values of the map, NaN values sort
+        last so any NaN is returned as the maximum.
+        """
+        min_val = np.inf
+        max_val = -np.inf
+        for rows, tile in self.iter_tiles():
+            min_val = np.fmin(min_val, np.nanmin(tile))
+            max_val = np.maximum(max_val, np.max(tile))
+        #
+        dtype = self._data_map.dtype.type
+        return dtype(min_val), dtype(max_val)
+
+    def histogram(self, edges):
+        r"""
+        Returns the number of values in each bin defined by edges using the
+        same conventions as np.histogram.
+        """
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for rows, tile in self.iter_tiles():
+            counts += np.histogram(tile, bins=edges)[0]
+        #
+        return counts
+
+    def percentiles(self, perc_list, collect_size=2**20):
+        r"""
+        Returns the value of each percentile in perc_list, matching the
+        result of calc_percentile on the full dataset. Values are selected
+        exactly with a radix select on sortable integer keys, each pass over
+        the tiles resolves another 16 bits of the key until few enough
+        values remain to be collected and partitioned in memory.
+        """
+        num_vals = self.nx * self.nz
+        ranks = PercentileEngine.indices(perc_list, num_vals).tolist()
+        #
+        # each selection is a [rank, key prefix, bits resolved, result] list
+        selections = [[rank, 0, 0, None] for rank in ranks]
+        mask = np.uint64(2**_RADIX_BITS - 1)
+        active = selections
+        while active:
+            counts = [np.zeros(2**_RADIX_BITS, dtype=np.int64) for sel in active]
+            for rows, tile in self.iter_tiles():
+                keys = _sort_keys(tile.ravel())
+                for sel, sel_counts in zip(active, counts):
+                    sel_keys = self._match_prefix(keys, sel)
+                    shift = 64 - sel[2] - _RADIX_BITS
+                    digits = (sel_keys >> np.uint64(shift)) & mask
+                    digits = digits.astype(np.intp)
+                    sel_counts += np.bincount(digits, minlength=2**_RADIX_BITS)
+            #
+            # descending into the bucket containing each rank
+            for sel, sel_counts in zip(active, counts):
+                cumulative = np.cumsum(sel_counts)
+                digit = int(np.searchsorted(cumulative, sel[0], side='right'))
+                sel[0] -= int(cumulative[digit - 1]) if digit > 0 else 0
+                sel[1] = (sel[1] << _RADIX_BITS) | digit
+                sel[2] += _RADIX_BITS
+                if sel[2] == 64:
+                    sel[3] = _key_to_value(sel[1])
+                elif sel_counts[digit] <= collect_size:
+                    sel[3] = self._collect_selection(sel)
+            active = [sel for sel in active if sel[3] is None]
+        #
+        dtype = self._data_map.dtype.type
+        return [dtype(sel[3]) for sel in selections]
+
+    @staticmethod
+    def _match_prefix(keys, sel):
+        r"""
+        Returns the keys sharing the resolved prefix of the selection
+        """
+        if sel[2] == 0:
+            return keys
+        return keys[(keys >> np.uint64(64 - sel[2])) == np.uint64(sel[1])]
+
+    def _collect_selection(self, sel):
+        r"""
+        Gathers the values sharing the selection's key prefix and returns the
+        value at the remaining rank.
+        """
+        values = []
+        for rows, tile in self.iter_tiles():
+            tile = tile.ravel()
+            mask = (_sort_keys(tile) >> np.uint64(64 - sel[2])) == np.uint64(sel[1])
+            values.append(tile[mask])
+        values = np.concatenate(values)
+        #
+        return np.partition(values, sel[0])[sel[0]]
+
+
+def _remove_file(path):
+    r"""
+    Removes a temporary file if it still exists
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+r"""
+Description: Times core apmapflow routines on synthetic data maps of
+increasing size. Where a routine was rewritten for speed the original
+implementation is kept here so both can be compared directly. The legacy
+versions are skipped for map sizes above --legacy-max because they can take
+several minutes and many GB of RAM on the larger maps.
+"""
+#
+import argparse
+from argparse import RawDescriptionHelpFormatter as RawDesc
+import os
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from apmapflow import _get_logger, set_main_logger_level, DataField
+from apmapflow import PercentileEngine, calc_percentile_num
+from apmapflow import FractureImageStack
+from apmapflow.map_io import read_text_map
+from apmapflow.scripts.apm_generate_aperture_map import gen_colored_image_stack
+from apmapflow.scripts.apm_resize_image_stack import fracture_extent
+
+#
+# fetching logger
+logger = _get_logger('apmapflow.Scripts')
+TRACE_MEMORY = False
+#
+# setting up the argument parser
+parser = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=RawDesc)
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help="prints debug messages (default: %(default)s)")
+parser.add_argument('-m', '--trace-memory', action='store_true',
+                    help="""records peak memory use, this slows down
+                    the legacy code significantly (default: %(default)s)""")
+parser.add_argument('--legacy-max', type=int, default=4000,
+                    help="""largest map size to run legacy code on
+                    (default: %(default)s)""")
+subparsers = parser.add_subparsers(dest='benchmark',
+                                   title='Benchmarks',
+                                   metavar='{benchmark}')
+#
+parser_ = subparsers.add_parser('interfaces',
+                                help='DataField cell interface construction')
+parser_.add_argument('sizes', nargs='*', type=int, default=[1000, 4000, 8000],
+                     help='edge length of the square maps to test')
+#
+parser_ = subparsers.add_parser('point-data',
+                                help='DataField cell to point data averaging')
+parser_.add_argument('sizes', nargs='*', type=int, default=[500, 1000, 4000],
+                     help='edge length of the square maps to test')
+parser_.add_argument('--float32', action='store_true',
+                     help='creates single precision point data')
+#
+parser_ = subparsers.add_parser('percentiles',
+                                help='list based vs PercentileEngine percentiles')
+parser_.add_argument('sizes', nargs='*', type=int, default=[100, 1000, 4000],
+                     help='edge length of the square maps to test')
+parser_.add_argument('-p', '--percentiles', nargs='+', type=float,
+                     default=[0, 1, 5, 10, 25, 50, 75, 90, 95, 99, 100],
+                     help='percentiles to calculate')
+#
+parser_ = subparsers.add_parser('ranks',
+                                help='list based vs batch percentile ranks')
+parser_.add_argument('sizes', nargs='*', type=int, default=[100, 300, 1000],
+                     help='edge length of the square maps to test')
+parser_.add_argument('-n', '--num-values', type=int, default=1000,
+                     help='number of values to rank (default: %(default)s)')
+#
+parser_ = subparsers.add_parser('text-reader',
+                                help='chunked text map reader vs np.loadtxt')
+parser_.add_argument('sizes', nargs='*', type=int, default=[1000, 3200, 4000],
+                     help='edge length of the square maps to test')
+parser_.add_argument('-t', '--threads', type=int,
+                     help='number of parsing threads (default: CPU count)')
+parser_.add_argument('-d', '--delim', default='\t',
+                     help='delimiter to write the test maps with')
+#
+parser_ = subparsers.add_parser('image-stack',
+                                help='coordinate based vs free image stack maps')
+parser_.add_argument('sizes', nargs='*', type=int, default=[250, 500, 1000],
+                     help='x and z edge length of the image stacks to test')
+parser_.add_argument('--ny', type=int, default=600,
+                     help='y axis length of the image stacks (default: %(default)s)')
+parser_.add_argument('--aperture', type=int, default=20,
+                     help='mean fracture aperture in voxels (default: %(default)s)')
+
+
+def main():
+    r"""
+    Parses command line arguments and runs the requested benchmark
+    """
+    args = parser.parse_args()
+    if args.verbose:
+        set_main_logger_level('debug')
+    #
+    global TRACE_MEMORY
+    TRACE_MEMORY = args.trace_memory
+    #
+    if args.benchmark is None:
+        parser.print_help()
+        return
+    #
+    BENCHMARKS[args.benchmark](args)
+
+
+def timed(func, *args, **kwargs):
+    r"""
+    Calls func and returns the elapsed time in seconds and peak memory in MB
+    traced while it was running along with the function's return value.
+    Memory is only traced if the trace-memory flag was set.
+    """
+    peak = None
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    #
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    #
+    if TRACE_MEMORY:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    #
+    return (elapsed, peak), result
+
+
+def print_table(title, rows):
+    r"""
+    Outputs a set of (size, legacy, current) timing rows, legacy can be
+    None if it was not run.
+    """
+    def fmt_result(result):
+        if result is None:
+            return '-', '-'
+        mem = '-' if result[1] is None else '{:0.1f}'.format(result[1])
+        return '{:0.3f}'.format(result[0]), mem
+    #
+    fmt = '{:>8}  {:>12}  {:>12}  {:>12}  {:>12}  {:>8}'
+    print('\n' + title)
+    print(fmt.format('size', 'legacy (s)', 'legacy (MB)',
+                     'current (s)', 'current (MB)', 'speedup'))
+    for size, legacy, current in rows:
+        speedup = '-'
+        if legacy is not None:
+            speedup = '{:0.1f}x'.format(legacy[0]/max(current[0], 1e-9))
+        print(fmt.format(size, *fmt_result(legacy), *fmt_result(current),
+                         speedup))
+    print('')
+
+#
+########################################################################
+#  Legacy implementations
+########################################################################
+
+
+def legacy_cell_interfaces(nx, nz):
+    r"""
+    Loop based cell interface construction used prior to vectorization
+    """
+    cell_interfaces = []
+    for iz in range(nx-1, (nz-1)*nx, nx):
+        cell_interfaces.append([iz, iz+nx])
+    #
+    for iz in range(0, nz-1):
+        for ix in range(0, nx-1):
+            ib = iz*nx + ix
+            cell_interfaces.append([ib, ib+1])
+            cell_interfaces.append([ib, ib+nx])
+    #
+    for ix in range((nz-1)*nx, nz*nx-1):
+        cell_interfaces.append([ix, ix+1])
+    #
+    return np.array(cell_interfaces, ndmin=2, dtype=int)
+
+
+def legacy_cell_to_point_data(data_map, nx, nz):
+    r"""
+    Loop based cell to point data averaging used prior to vectorization
+    """
+    point_data = np.zeros((nz+1, nx+1, 4))
+    #
+    point_data[0, 0, 0] = data_map[0, 0]
+    point_data[0, -1, 1] = data_map[0, -1]
+    point_data[-1, -1, 2] = data_map[-1, -1]
+    point_data[-1, 0, 3] = data_map[-1, 0]
+    #
+    for iz in range(nz):
+        for ix in range(nx):
+            val = np.average(data_map[iz:iz+2, ix:ix+2])
+            point_data[iz, ix, 2] = val
+            point_data[iz+1, ix+1, 0] = val
+            point_data[iz+1, ix, 1] = val
+            point_data[iz, ix+1, 3] = val
+    #
+    for iz in range(nz):
+        val = np.average(data_map[iz:iz+2, 0])
+        point_data[iz, 0, 3] = val
+        point_data[iz+1, 0, 0] = val
+        #
+        val = np.average(data_map[iz:iz+2, -1])
+        point_data[iz, -1, 2] = val
+        point_data[iz+1, -1, 1] = val
+    #
+    for ix in range(nx):
+        val = np.average(data_map[0, ix:ix+2])
+        point_data[0, ix, 1] = val
+        point_data[0, ix+1, 0] = val
+        #
+        val = np.average(data_map[-1, ix:ix+2])
+        point_data[-1, ix, 2] = val
+        point_data[-1, ix+1, 3] = val
+    #
+    return point_data[0:nz, 0:nx, :]
+
+
+def legacy_calc_percentile(perc, data, sort=True):
+    r"""
+    List based percentile calculation used prior to the PercentileEngine
+    """
+    tot_vals = float(len(data))
+    num_vals = 0.0
+    sorted_data = list(data)
+    if sort:
+        sorted_data.sort()
+    #
+    index = 0
+    for i in range(len(sorted_data)):
+        index = i
+        if (num_vals/tot_vals*100.0) >= perc:
+            break
+        else:
+            num_vals += 1
+    #
+    return sorted_data[index]
+
+
+def legacy_calc_percentile_num(num, data, last=False, sort=True):
+    r"""
+    List based percentile rank calculation used prior to the
+    PercentileEngine, the data must be presorted for correct results.
+    """
+    tot_vals = float(len(data))
+    num_vals = 0.0
+    sorted_data = list(data)
+    if sort:
+        sorted_data.sort()
+    #
+    for i in range(len(sorted_data)):
+        if last is True and data[i] > num:
+            break
+        elif last is False and data[i] >= num:
+            break
+        else:
+            num_vals += 1
+    #
+    return num_vals/tot_vals
+
+
+def legacy_create_offset_map(image, no_data_fill=0):
+    r"""
+    Offset map built from the fracture voxel coordinates and a full uint16
+    copy of the stack, used prior to the argmax based version
+    """
+    x_c, y_c, z_c = image.get_fracture_voxels(coordinates=True)
+    data = np.ones(image.shape, dtype=np.uint16)*np.iinfo(np.int16).max
+    data[x_c, y_c, z_c] = y_c
+    del x_c, y_c, z_c
+    #
+    offset_map = np.zeros((image.nx, image.nz), dtype=float)
+    for z_ind in range(image.nz):
+        offset_map[:, z_ind] = np.amin(data[:, :, z_ind], axis=1)
+        offset_map[:, z_ind][offset_map[:, z_ind] > image.ny] = no_data_fill
+    #
+    return offset_map.T
+
+
+def legacy_colored_image_stack(image, aperture_map):
+    r"""
+    Colors each fracture voxel by its aperture using voxel coordinates
+    """
+    aperture_map = np.minimum(aperture_map.T, 255)
+    x_c, y_c, z_c = image.get_fracture_voxels(coordinates=True)
+    colored = np.zeros(image.shape, dtype=np.uint8)
+    colored[x_c, y_c, z_c] = aperture_map[x_c, z_c]
+    #
+    return colored
+
+
+def legacy_fracture_extent(image):
+    r"""
+    Y axis extent of the fracture from the voxel coordinates
+    """
+    y_c = image.get_fracture_voxels(coordinates=True)[1]
+    return y_c.min(), y_c.max()
+
+#
+########################################################################
+#  Benchmarks
+########################################################################
+
+
+def bench_cell_interfaces(args):
+    r"""
+    Compares loop and array based construction of DataField cell interfaces
+    """
+    rows = []
+    for size in args.sizes:
+        logger.info('timing cell interfaces for a %dx%d map', size, size)
+        field = DataField(np.ones((size, size)))
+        current, _ = timed(field._define_cell_interfaces)
+        #
+        legacy = test = None
+        if size <= args.legacy_max:
+            legacy, test = timed(legacy_cell_interfaces, size, size)
+            if not np.array_equal(test, field._cell_interfaces):
+                raise ValueError('cell interface ordering does not match')
+        del field, test
+        #
+        rows.append((size, legacy, current))
+    #
+    print_table('DataField._define_cell_interfaces', rows)
+
+
+def bench_cell_to_point_data(args):
+    r"""
+    Compares loop and array based averaging of cell data onto vertices
+    """
+    dtype = np.float32 if args.float32 else float
+    rows = []
+    for size in args.sizes:
+        logger.info('timing point data for a %dx%d map', size, size)
+        data_map = np.random.random_sample((size, size))
+        current, point_data = timed(DataField._cell_to_point_data,
+                                    data_map, size, size, dtype=dtype)
+        #
+        legacy = test = None
+        if size <= args.legacy_max:
+            legacy, test = timed(legacy_cell_to_point_data,
+                                 data_map, size, size)
+            if not np.allclose(test, point_data, rtol=1e-6):
+                raise ValueError('point data values do not match')
+        del data_map, point_data, test
+        #
+        rows.append((size, legacy, current))
+    #
+    print_table('DataField._cell_to_point_data', rows)
+
+
+def bench_percentiles(args):
+    r"""
+    Compares sorting a list once and stepping through it for each
+    percentile against a single PercentileEngine query
+    """
+    def legacy_percentiles(data, percs):
+        data = sorted(data)
+        return [legacy_calc_percentile(perc, data, False) for perc in percs]
+
+    def engine_percentiles(data, percs):
+        return PercentileEngine(data).percentiles(percs)
+    #
+    rows = []
+    for size in args.sizes:
+        logger.info('timing percentiles for a %dx%d map', size, size)
+        data = np.random.random_sample(size * size)
+        current, values = timed(engine_percentiles, data, args.percentiles)
+        #
+        legacy = test = None
+        if size <= args.legacy_max:
+            legacy, test = timed(legacy_percentiles, data, args.percentiles)
+            if not np.array_equal(test, values):
+                raise ValueError('percentile values do not match')
+        del data, values, test
+        #
+        rows.append((size, legacy, current))
+    #
+    print_table('PercentileEngine.percentiles', rows)
+
+
+def bench_percentile_ranks(args):
+    r"""
+    Compares ranking values one at a time against a single batch query
+    """
+    def legacy_ranks(data, values):
+        data = sorted(data)
+        return [legacy_calc_percentile_num(val, data, sort=False)
+                for val in values]
+    #
+    rows = []
+    for size in args.sizes:
+        logger.info('timing percentile ranks for a %dx%d map', size, size)
+        data = np.random.random_sample(size * size)
+        values = np.linspace(0, 1, args.num_values)
+        current, ranks = timed(calc_percentile_num, values, data)
+        #
+        legacy = test = None
+        if size <= args.legacy_max:
+            legacy, test = timed(legacy_ranks, data, values)
+            if not np.array_equal(test, ranks):
+                raise ValueError('percentile ranks do not match')
+        del data, ranks, test
+        #
+        rows.append((size, legacy, current))
+    #
+    print_table('calc_percentile_num batch', rows)
+
+
+def bench_text_reader(args):
+    r"""
+    Compares np.loadtxt to the chunked text map reader, the legacy column
+    is np.loadtxt which is always run.
+    """
+    delim = None if args.delim == ' ' else args.delim
+    rows = []
+    for size in args.sizes:
+        logger.info('writing a %dx%d text map', size, size)
+        data_map = np.random.random_sample((size, size))
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as file:
+            np.savetxt(file, data_map, delimiter=args.delim)
+        #
+        try:
+            logger.info('timing text map reading')
+            legacy, test = timed(np.loadtxt, file.name, delimiter=delim)
+            del test
+            current, test = timed(read_text_map, file.name, delim=delim,
+                                  num_threads=args.threads)
+            if not np.array_equal(test, data_map):
+                raise ValueError('parsed values do not match')
+            del data_map, test
+        finally:
+            os.remove(file.name)
+        #
+        rows.append((size, legacy, current))
+    #
+    print_table('map_io.read_text_map', rows)
+
+
+def bench_image_stack(args):
+    r"""
+    Compares the coordinate based offset map, colored stack and fracture
+    extent calculations to the argmax, broadcasting and any() projection
+    versions used by the FractureImageStack class and image stack scripts
+    on a synthetic rough fracture.
+    """
+    tables = {'offset': [], 'colored': [], 'extent': []}
+    for size in args.sizes:
+        msg = 'timing image stack maps for a %dx%dx%d stack'
+        logger.info(msg, size, args.ny, size)
+        image = synthetic_fracture(size, args.ny, size, args.aperture)
+        aperture_map = image.create_aperture_map()
+        run_legacy = size <= args.legacy_max
+        #
+        current, offset_map = timed(image.create_offset_map)
+        legacy = test = None
+        if run_legacy:
+            legacy, test = timed(legacy_create_offset_map, image)
+            if not np.array_equal(test, offset_map):
+                raise ValueError('offset maps do not match')
+        del offset_map, test
+        tables['offset'].append((size, legacy, current))
+        #
+        current, colored = timed(gen_colored_image_stack, image, aperture_map)
+        legacy = test = None
+        if run_legacy:
+            legacy, test = timed(legacy_colored_image_stack,
+                                 image, aperture_map)
+            if not np.array_equal(test, colored):
+                raise ValueError('colored image stacks do not match')
+        del colored, test
+        tables['colored'].append((size, legacy, current))
+        #
+        current, extent = timed(fracture_extent, image)
+        legacy = None
+        if run_legacy:
+            legacy, test = timed(legacy_fracture_extent, image)
+            if test != extent:
+                raise ValueError('fracture extents do not match')
+        tables['extent'].append((size, legacy, current))
+        del image
+    #
+    print_table('FractureImageStack.create_offset_map', tables['offset'])
+    print_table('apm_generate_aperture_map colored stack', tables['colored'])
+    print_table('apm_resize_image_stack fracture extent', tables['extent'])
+
+
+def synthetic_fracture(nx, ny, nz, aperture):
+    r"""
+    Creates a binary image stack of a rough fracture with a varying aperture
+    centered in the y axis
+    """
+    x_c = np.arange(nx)[:, np.newaxis]
+    z_c = np.arange(nz)[np.newaxis, :]
+    bottom = ny/2.0 + ny/8.0 * np.sin(x_c / 37.0) * np.cos(z_c / 53.0)
+    top = bottom + aperture * (1 + 0.5 * np.sin((x_c + z_c) / 11.0))
+    #
+    image = np.zeros((nx, ny, nz), dtype=bool)
+    for y_ind in range(ny):
+        image[:, y_ind, :] = (y_ind >= bottom) & (y_ind < top)
+    #
+    return image.view(FractureImageStack)
+
+
+BENCHMARKS = {
+    'interfaces': bench_cell_interfaces,
+    'point-data': bench_cell_to_point_data,
+    'percentiles': bench_percentiles,
+    'ranks': bench_percentile_ranks,
+    'text-reader': bench_text_reader,
+    'image-stack': bench_image_stack
+}
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ Last Modifed: 2017/03/03
 #
 """
 from argparse import Namespace
+import json
 import logging
 import os
 import pytest
@@ -78,6 +79,117 @@ class TestCore:
         with pytest.raises(FileExistsError):
             field.export_vtk()
 
+    def test_data_field_cell_interfaces(self):
+        r"""
+        Checks the ordering of the cell interfaces on a small map
+        """
+        field = apm.DataField(sp.ones((3, 4)))
+        ifaces = [
+            [3, 7], [7, 11],
+            [0, 1], [0, 4], [1, 2], [1, 5], [2, 3], [2, 6],
+            [4, 5], [4, 8], [5, 6], [5, 9], [6, 7], [6, 10],
+            [8, 9], [9, 10], [10, 11]
+        ]
+        assert sp.all(field.cell_interfaces == sp.array(ifaces))
+        #
+        # single row and single column maps
+        field = apm.DataField(sp.ones((1, 3)))
+        assert sp.all(field.cell_interfaces == sp.array([[0, 1], [1, 2]]))
+        field = apm.DataField(sp.ones((3, 1)))
+        assert sp.all(field.cell_interfaces == sp.array([[0, 1], [1, 2]]))
+
+    def test_data_field_point_data(self):
+        r"""
+        Checks averaging of cell data onto the corners of each cell
+        """
+        data_map = sp.arange(12, dtype=float).reshape(3, 4)
+        point_data = apm.DataField._cell_to_point_data(data_map, 4, 3)
+        assert point_data.shape == (3, 4, 4)
+        #
+        # map corners, an edge vertex and an interior vertex
+        assert point_data[0, 0, 0] == 0.0
+        assert point_data[0, -1, 1] == 3.0
+        assert point_data[-1, -1, 2] == 11.0
+        assert point_data[-1, 0, 3] == 8.0
+        assert point_data[0, 1, 1] == 1.5
+        assert point_data[0, 1, 2] == 3.5
+        # vertices shared between cells must have the same value
+        assert sp.all(point_data[:, :-1, 1] == point_data[:, 1:, 0])
+        assert sp.all(point_data[:-1, :, 2] == point_data[1:, :, 1])
+        #
+        # testing out and dtype arguments
+        out = sp.zeros((3, 4, 4), dtype=sp.float32)
+        point_data = apm.DataField._cell_to_point_data(data_map, 4, 3, out=out)
+        assert point_data is out
+        assert point_data[0, 1, 2] == 3.5
+        #
+        point_data = apm.DataField._cell_to_point_data(data_map, 4, 3,
+                                                       dtype=sp.float32)
+        assert point_data.dtype == sp.float32
+        #
+        with pytest.raises(ValueError):
+            apm.DataField._cell_to_point_data(data_map, 4, 3, out=out[:2])
+
+    def test_data_field_cache(self):
+        r"""
+        Checks derived data is created lazily and cleared when the map changes
+        """
+        field = apm.DataField(sp.arange(1, 13, dtype=float).reshape(3, 4))
+        assert field._cell_interfaces is None
+        assert field._point_data is None
+        assert field._adjacency_matrix is None
+        #
+        # properties create and then reuse the data
+        matrix = field.adjacency_matrix
+        assert field._cell_interfaces is not None
+        assert field.create_adjacency_matrix() is matrix
+        point_data = field.point_data
+        assert point_data.shape == (3, 4, 4)
+        assert field.point_data is point_data
+        #
+        # thresholding and reassigning the map clear derived data
+        field.threshold_data(max_value=12, repl=0.0)
+        assert field._adjacency_matrix is None
+        assert field._point_data is None
+        assert field.point_data[-1, -1, 2] == 0.0
+        assert field.adjacency_matrix.nnz < matrix.nnz
+        #
+        field._data_map = sp.ones((2, 2))
+        assert field._cell_interfaces is None
+        assert field.cell_interfaces.shape == (4, 2)
+        assert field.point_data.shape == (2, 2, 4)
+        #
+        # explicitly assigned point data is retained
+        field.point_data = sp.zeros((2, 2, 4))
+        field.threshold_data(min_value=0.5)
+        assert sp.all(field.point_data == 0.0)
+
+    def test_data_field_copy_data(self):
+        r"""
+        Checks data is shared with processors as read only views
+        """
+        data_map = sp.arange(12, 0, -1, dtype=float).reshape(3, 4)
+        field = apm.DataField(data_map)
+        obj = Namespace()
+        field.copy_data(obj)
+        assert obj.point_data is None
+        assert sp.shares_memory(obj.data_map, field.data_map)
+        assert sp.shares_memory(obj.data_vector, field.data_map)
+        with pytest.raises(ValueError):
+            obj.data_vector[0] = 0.0
+        #
+        field.create_point_data()
+        field.copy_data(obj)
+        assert sp.shares_memory(obj.point_data, field.point_data)
+        assert not obj.point_data.flags.writeable
+        #
+        # sorting processors copy the data vector instead of sorting in place
+        pctle = apm.data_processing.Percentiles(field, percentiles=[0, 100])
+        pctle.process()
+        assert pctle.processed_data['0.00'] == 1.0
+        assert sp.all(field.data_map == data_map)
+        assert field.data_map.flags.writeable
+
     def test_fracture_image_stack(self):
         r"""
         Loads and builds an image stack to test its properties
@@ -142,6 +254,127 @@ class TestCore:
         #
         fracture_stack.save(fname, overwrite=True)
 
+    def test_fracture_image_stack_frames(self):
+        r"""
+        Tests reading an image stack one frame at a time
+        """
+        img_data = sp.zeros((20, 7, 9), dtype=bool)
+        img_data[3:15, 2:5, :] = True
+        img_data[0, :, 4] = True
+        fname = os.path.join(TEMP_DIR, 'test-frames.tif')
+        apm.FractureImageStack(img_data).save(fname, overwrite=True)
+        #
+        frames = list(apm.FractureImageStack.iter_frames(fname))
+        assert len(frames) == 9
+        assert sp.all(frames[4] == img_data[:, :, 4])
+        #
+        out = sp.zeros(img_data.shape, dtype=sp.uint8)
+        stack = apm.FractureImageStack.from_image_file(fname, sp.uint8, out=out)
+        assert isinstance(stack, apm.FractureImageStack)
+        assert sp.shares_memory(stack, out)
+        assert sp.all(stack.astype(bool) == img_data)
+        with pytest.raises(ValueError):
+            apm.FractureImageStack.from_image_file(fname, out=out[:-1])
+        #
+        aper_map = apm.FractureImageStack.reduce_frames(
+            fname, lambda frame: sp.sum(frame, axis=1))
+        stack = apm.FractureImageStack(fname)
+        assert sp.all(aper_map == stack.create_aperture_map())
+
+    def test_fracture_image_stack_offset_map(self):
+        r"""
+        Checks the offset map is the lowest fracture voxel of each column
+        """
+        img_data = sp.zeros((4, 6, 3), dtype=sp.uint8)
+        img_data[0, 2:4, 0] = 255
+        img_data[1, 5, :] = 1
+        img_data[3, [1, 4], 2] = 7
+        stack = apm.FractureImageStack(img_data, dtype=sp.uint8)
+        offset_map = stack.create_offset_map(no_data_fill=-1)
+        assert offset_map.shape == (3, 4)
+        assert sp.all(offset_map[:, 1] == 5)
+        assert offset_map[0, 0] == 2 and offset_map[2, 3] == 1
+        assert sp.all(offset_map[:, 2] == -1)
+        #
+        bool_stack = apm.FractureImageStack(img_data)
+        assert sp.all(bool_stack.create_offset_map(-1) == offset_map)
+        offset_map = bool_stack.create_offset_map(no_data_fill=sp.nan)
+        assert sp.isnan(offset_map[1, 0]) and offset_map[0, 0] == 2
+
+    def test_fracture_image_stack_extract_maps(self):
+        r"""
+        Tests generating every 2-D map in a single pass over the frames
+        """
+        img_data = sp.zeros((6, 10, 4), dtype=bool)
+        img_data[:, 2:5, :] = True
+        img_data[1, 7:9, 0] = True
+        img_data[2, :, 1] = False
+        stack = apm.FractureImageStack(img_data)
+        fname = os.path.join(TEMP_DIR, 'test-extract-maps.tif')
+        stack.save(fname, overwrite=True)
+        #
+        for image in [fname, stack]:
+            maps = apm.FractureImageStack.extract_maps(image, no_data_fill=-1)
+            assert sp.all(maps['aperture'] == stack.create_aperture_map())
+            offset_map = stack.create_offset_map(no_data_fill=-1)
+            assert sp.all(maps['offset'] == offset_map)
+        #
+        assert maps['top'][0, 1] == 8
+        assert maps['mid'][0, 1] == 5
+        assert maps['bifurcations'][0, 1] == 1
+        assert sp.count_nonzero(maps['bifurcations']) == 1
+        assert sp.isnan(maps['top'][1, 2]) and sp.isnan(maps['mid'][1, 2])
+        assert maps['aperture'][1, 2] == 0
+        #
+        maps = apm.FractureImageStack.extract_maps(fname, invert=True)
+        assert sp.all(maps['aperture'] == 10 - stack.create_aperture_map())
+
+    def test_packed_image_stack(self):
+        r"""
+        Tests the bit-packed storage of a binary image stack
+        """
+        img_data = sp.zeros((12, 11, 5), dtype=bool)
+        img_data[2:9, 3:6, :] = True
+        img_data[0, 10, 4] = True
+        img_data[5, 8, 1] = True
+        stack = apm.FractureImageStack(img_data)
+        packed = apm.PackedImageStack.from_array(img_data)
+        assert packed.shape == img_data.shape
+        assert packed.nbytes == 12 * 2 * 5
+        #
+        # indexing unpacks the requested voxels
+        assert sp.all(packed[:, :, 1] == img_data[:, :, 1])
+        assert sp.all(packed[5, :, :] == img_data[5, :, :])
+        assert sp.all(packed[1:10:2, -1, 2:] == img_data[1:10:2, -1, 2:])
+        assert packed[0, 10, 4] and not packed[0, 10, 3]
+        assert sp.all(packed[..., 4] == img_data[..., 4])
+        x_c, y_c, z_c = [0, 5, 5, 11], [10, 8, 7, 0], [4, 1, 1, 0]
+        assert list(packed[x_c, y_c, z_c]) == [True, True, False, False]
+        with pytest.raises(IndexError):
+            packed[[0], 1, 2]
+        #
+        assert sp.all(packed.unpack() == img_data)
+        assert sp.all((~packed).unpack() == ~img_data)
+        assert sp.all(packed.create_aperture_map() == stack.create_aperture_map())
+        offset_map = stack.create_offset_map(no_data_fill=-1)
+        assert sp.all(packed.create_offset_map(no_data_fill=-1) == offset_map)
+        voxels = stack.get_fracture_voxels()
+        assert sp.all(packed.get_fracture_voxels() == voxels)
+        coords = packed.get_fracture_voxels(coordinates=True)
+        assert sp.all(sp.ravel_multi_index(coords, img_data.shape) == voxels)
+        #
+        packed = apm.PackedImageStack.from_voxels(voxels, img_data.shape)
+        assert sp.all(packed.unpack() == img_data)
+        #
+        # saving and reading files
+        fname = os.path.join(TEMP_DIR, 'test-packed.tif')
+        packed.save(fname, overwrite=True)
+        assert sp.all(apm.FractureImageStack(fname) == img_data)
+        new_stack = apm.PackedImageStack.from_image_file(fname, invert=True)
+        assert sp.all(new_stack.unpack() == ~img_data)
+        with pytest.raises(FileExistsError):
+            packed.save(fname)
+
     def test_toplevel_logger(self):
         r"""
         Tests the configuation of the top level logger
@@ -179,6 +412,67 @@ class TestCore:
         assert len(files)
         files = apm.files_from_directory('.', re.compile('.'))
         assert len(files)
+        #
+        # building a small tree with hidden entries that are skipped
+        root = os.path.join(TEMP_DIR, 'file-search')
+        for sub_dir in ['a/b', 'c', '.hidden']:
+            os.makedirs(os.path.join(root, sub_dir), exist_ok=True)
+        for fname in ['z.txt', 'a/y.txt', 'a/b/x.txt', 'c/w.csv', '.h.txt',
+                      '.hidden/v.txt']:
+            open(os.path.join(root, fname), 'w').close()
+        expected = [os.path.join(root, f) for f in ['z.txt', 'a/y.txt',
+                                                    'c/w.csv', 'a/b/x.txt']]
+        #
+        assert apm.files_from_directory(root, deep=False) == expected[:1]
+        for workers in [1, 3]:
+            files = apm.files_from_directory(root, workers=workers)
+            assert files == expected
+        #
+        # links back up the tree are only searched once
+        link = os.path.join(root, 'a', 'b', 'loop')
+        if not os.path.lexists(link):
+            os.symlink(root, link)
+        assert apm.files_from_directory(root) == expected
+        os.remove(link)
+        #
+        # unchanged directories are read from the index
+        index_file = os.path.join(TEMP_DIR, 'file-search-index.json')
+        if os.path.exists(index_file):
+            os.remove(index_file)
+        files = apm.files_from_directory(root, index_file=index_file)
+        assert files == expected
+        assert os.path.isfile(index_file)
+        assert apm.files_from_directory(root, index_file=index_file) == expected
+        #
+        # changed directories are read again
+        os.remove(os.path.join(root, 'c', 'w.csv'))
+        open(os.path.join(root, 'c', 'u.txt'), 'w').close()
+        files = apm.files_from_directory(root, index_file=index_file)
+        new_file = os.path.join(root, 'c/u.txt')
+        assert files == expected[:2] + [new_file, expected[3]]
+        os.remove(new_file)
+        #
+        # entries of removed directories are pruned from the index
+        os.makedirs(os.path.join(root, 'd', 'e'), exist_ok=True)
+        apm.files_from_directory(root, index_file=index_file)
+        os.rmdir(os.path.join(root, 'd', 'e'))
+        os.rmdir(os.path.join(root, 'd'))
+        other_dir = os.path.join(FIXTURE_DIR, 'maps')
+        apm.files_from_directory(other_dir, deep=False, index_file=index_file)
+        with open(index_file) as file:
+            index = json.load(file)
+        assert os.path.realpath(os.path.join(root, 'd')) not in index
+        assert os.path.realpath(root) in index
+        #
+        # unvisited directories below the searched one are pruned as well
+        index[os.path.join(os.path.realpath(root), '.hidden')] = [0, [], []]
+        with open(index_file, 'w') as file:
+            json.dump(index, file)
+        apm.files_from_directory(root, index_file=index_file)
+        with open(index_file) as file:
+            index = json.load(file)
+        assert os.path.realpath(other_dir) in index
+        assert len(index) == 5
 
     def test_load_infile_list(self):
         r"""
@@ -190,6 +484,45 @@ class TestCore:
         #
         fields = apm.load_infile_list(infile_list)
         assert fields
+        #
+        # loading in worker processes preserves the order of the files
+        fields = apm.load_infile_list(infile_list, workers=2)
+        assert [field.infile for field in fields] == infile_list
+        assert sp.all(fields[1].data_map == 10)
+
+    def test_iter_infile_list(self):
+        r"""
+        Tests fields are yielded in order with and without prefetching
+        """
+        fname1 = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-01vox.txt')
+        fname2 = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-10vox.txt')
+        infile_list = [fname1, fname2, fname1]
+        #
+        for prefetch in [0, 1, 5]:
+            fields = apm.iter_infile_list(infile_list, prefetch=prefetch)
+            assert not isinstance(fields, list)
+            infiles = [field.infile for field in fields]
+            assert infiles == infile_list
+        #
+        fields = apm.iter_infile_list([fname1, 'missing-map.txt', fname2])
+        assert next(fields).infile == fname1
+        with pytest.raises(FileNotFoundError):
+            next(fields)
+
+    def test_parallel_map(self):
+        r"""
+        Tests results are returned in order and errors are raised
+        """
+        items = list(range(-20, 20))
+        for workers in [1, 2, None]:
+            results = apm.parallel_map(abs, items, workers=workers,
+                                       max_pending=3)
+            assert list(results) == [abs(i) for i in items]
+            #
+            results = apm.parallel_map(abs, [1, 'x', 2], workers=workers)
+            assert next(results) == 1
+            with pytest.raises(TypeError):
+                next(results)
 
     def test_calc_percentile(self):
         r"""
@@ -199,6 +532,34 @@ class TestCore:
         val = apm.calc_percentile(99, data_list)
         assert val == 99
 
+    def test_percentile_engine(self):
+        r"""
+        Checks percentiles match stepping through the sorted data
+        """
+        def percentile_index(perc, num_vals):
+            for i in range(num_vals):
+                if i/float(num_vals)*100.0 >= perc:
+                    return i
+            return num_vals - 1
+        #
+        percs = [-5, 0, 0.1, 1, 33.3, 50, 99, 99.99, 100, 150]
+        for num_vals in [1, 7, 100, 1234]:
+            inds = apm.PercentileEngine.indices(percs, num_vals)
+            assert list(inds) == [percentile_index(p, num_vals) for p in percs]
+        #
+        data = sp.arange(1000, 0, -1) % 97
+        engine = apm.PercentileEngine(data)
+        values = engine.percentiles(percs)
+        inds = apm.PercentileEngine.indices(percs, data.size)
+        assert sp.all(values == sp.sort(data)[inds])
+        assert engine.percentile(50) == values[5]
+        assert sp.all(data == sp.arange(1000, 0, -1) % 97)
+        #
+        # single values are selected without sorting the data
+        engine = apm.PercentileEngine(data)
+        assert engine.percentile(99) == values[6]
+        assert not engine._sorted
+
     def test_calc_percentile_num(self):
         r"""
         Sends a test array to the calc percentile function
@@ -208,6 +569,18 @@ class TestCore:
         assert val*100 == 50
         val = apm.calc_percentile_num(50, data_list, last=True)
         assert val*100 == 51
+        #
+        # unsorted data and batches of values
+        data = sp.array(data_list[::-1] + [50, 50])
+        assert apm.calc_percentile_num(50, data) == 50/102
+        vals = apm.calc_percentile_num([-1, 50, 50.5, 200], data, last=True)
+        assert sp.all(vals == sp.array([0, 53, 53, 102])/102)
+        #
+        engine = apm.PercentileEngine(data)
+        assert engine.rank(50, last=True) == 53/102
+        assert not engine._sorted
+        assert sp.all(engine.ranks([50, 99]) == [50/102, 101/102])
+        assert engine.rank(50) == 50/102
 
     def test_get_data_vect(self):
         r"""
@@ -68,6 +68,15 @@ class TestBaseProcessor:
             base_proc.processed_data = True
             base_proc.gen_output()
         #
+        with pytest.raises(NotImplementedError):
+            base_proc._write_output(None)
+        #
+        base_proc.processed_data = None
+        base_proc.write_output(path=TEMP_DIR)
+        with pytest.raises(NotImplementedError):
+            base_proc.processed_data = True
+            base_proc.write_output(path=TEMP_DIR)
+        #
         #
         base_proc.processed_data = False
         base_proc.copy_processed_data({}, alt_key='test')
@@ -10,6 +10,7 @@ import argparse
 import os
 import pytest
 import scipy as sp
+import apmapflow as apm
 from apmapflow.data_processing.eval_channels import EvalChannels
 
 
@@ -62,6 +63,11 @@ class TestEvalChannels:
             'thresh': 100
         }
         eval_chans._process_data()
+        assert eval_chans.processed_data['chans_per_row'] == [2] * 10
+        assert eval_chans.processed_data['chan_widths_per_row'][0] == [2, 3]
+        chans = eval_chans.processed_data['chan_indicies_per_row']
+        assert chans[1] == [(21, 31), (61, 81)]
+        assert eval_chans.processed_data['avg_chan_width_per_row'][9] == 2.5
         #
         # creating vertical channels
         eval_chans = EvalChannels(data_field_class())
@@ -74,6 +80,28 @@ class TestEvalChannels:
             'thresh': 100
         }
         eval_chans._process_data()
+        assert eval_chans.processed_data['chans_per_row'] == [2] * 10
+        chans = eval_chans.processed_data['chan_indicies_per_row']
+        assert chans[1] == [(12, 13), (16, 18)]
+        #
+        # channels touching the edges of the map
+        eval_chans.data_map[:, 0] = 255
+        eval_chans.data_map[:, 9] = 255
+        eval_chans.data_vector = sp.ravel(eval_chans.data_map)
+        eval_chans._process_data()
+        assert eval_chans.processed_data['chans_per_row'] == [3] * 10
+        assert eval_chans.processed_data['chan_indicies_per_row'][0][0] == (0, 0)
+        assert eval_chans.processed_data['chan_widths_per_row'][9] == [1, 2, 4]
+        #
+        eval_chans.args['array_output'] = True
+        eval_chans._process_data()
+        assert eval_chans.processed_data['chan_indicies'].shape == (30, 2)
+        offsets = eval_chans.processed_data['chan_row_offsets']
+        assert sp.all(offsets == sp.arange(0, 31, 3))
+        avg_width = eval_chans.processed_data['avg_chan_width_per_row']
+        assert sp.all(avg_width == 7.0 / 3.0)
+        eval_chans._output_data()
+        assert '(1, 2, 4)' in eval_chans.outfile_content
         #
         eval_chans.args = {
             'axis': 'y',
@@ -81,6 +109,27 @@ class TestEvalChannels:
         }
         eval_chans._process_data()
 
+    def test_tiled_channels(self):
+        r"""
+        Compares channels found tile-by-tile to those of the full map
+        """
+        data_map = (sp.arange(37 * 23) * 7919 % 101).reshape(37, 23) / 100.0
+        data_map[:, 0] = 0.0
+        for tile_size in [1, 3, 100]:
+            field = apm.TiledDataField(data_map, tile_size=tile_size)
+            for axis in ['x', 'z']:
+                bounds, offsets = EvalChannels.find_channels(data_map, 0.4, axis)
+                tiled = EvalChannels.find_tiled_channels(field, 0.4, axis)
+                assert sp.all(tiled[0] == bounds)
+                assert sp.all(tiled[1] == offsets)
+                #
+                eval_chans = EvalChannels(field, axis=axis, thresh=0.4)
+                eval_chans.process()
+                expected = EvalChannels(apm.DataField(data_map),
+                                        axis=axis, thresh=0.4)
+                expected.process()
+                assert eval_chans.processed_data == expected.processed_data
+
     def test_output_data(self, data_field_class):
         #
         eval_chans = EvalChannels(data_field_class())
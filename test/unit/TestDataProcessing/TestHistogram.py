@@ -95,3 +95,11 @@ class TestHistogram:
         #
         hist._output_data()
         assert hist.outfile_content
+        content = hist.outfile_content
+        #
+        # streamed output matches the generated content
+        hist.outfile_content = None
+        hist.write_output(path=TEMP_DIR)
+        assert hist.outfile_content is None
+        with open(os.path.join(TEMP_DIR, hist.outfile_name)) as f:
+            assert f.read() == content
@@ -0,0 +1,127 @@
+"""
+Handles testing of the HistogramAggregate class
+"""
+import argparse
+import os
+import pytest
+import scipy as sp
+import apmapflow as apm
+from apmapflow.data_processing import Histogram, HistogramLogscale
+from apmapflow.data_processing import HistogramRange, QuantileSketch
+from apmapflow.data_processing.histogram_aggregate import HistogramAggregate
+
+
+class TestHistogramAggregate:
+    r"""
+    Testing each method of the HistogramAggregate class
+    """
+    def test_add_sub_parser(self):
+        parser = argparse.ArgumentParser()
+        parent = argparse.ArgumentParser(add_help=False)
+        subparsers = parser.add_subparsers()
+        HistogramAggregate._add_subparser(subparsers, parent)
+        #
+        args = parser.parse_args('histagg'.split())
+        agg = HistogramAggregate.from_args(args)
+        assert agg.bin_class is Histogram
+        assert agg.args == {'num_bins': 10}
+        assert agg.edges is None
+        #
+        args = parser.parse_args('histagg 5 -r 10 90 --outfile agg.csv'.split())
+        agg = HistogramAggregate.from_args(args)
+        assert agg.bin_class is HistogramRange
+        assert agg.args['range'] == [10.0, 90.0]
+        assert agg.outfile_name == 'agg.csv'
+        #
+        args = parser.parse_args('histagg -l 2'.split())
+        agg = HistogramAggregate.from_args(args)
+        assert agg.bin_class is HistogramLogscale
+        #
+        args = parser.parse_args('histagg -e 0 1 2'.split())
+        assert sp.all(HistogramAggregate.from_args(args).edges == [0, 1, 2])
+        #
+        with pytest.raises(SystemExit):
+            parser.parse_args('histagg -l 2 -e 0 1'.split())
+
+    def test_define_bins(self):
+        r"""
+        Bins match a single histogram of every map while the sketch is exact
+        """
+        data_maps = [sp.arange(100.0).reshape(10, 10),
+                     sp.arange(50.0, 250.0).reshape(10, 20)]
+        agg = HistogramAggregate(num_bins=5)
+        with pytest.raises(ValueError):
+            agg.define_bins()
+        #
+        for data_map in data_maps:
+            agg.sample_field(apm.DataField(data_map))
+        agg.define_bins()
+        #
+        all_data = sp.concatenate([sp.ravel(dmap) for dmap in data_maps])
+        hist = Histogram(apm.DataField(all_data[sp.newaxis, :]), num_bins=5)
+        hist.define_bins()
+        edges = [hist.bins[0][0]] + [bin_[1] for bin_ in hist.bins]
+        assert sp.allclose(agg.edges, edges)
+        #
+        # the outer bins are extended to every value counted
+        agg = HistogramAggregate(sketch=QuantileSketch(k=8, seed=1),
+                                 num_bins=5)
+        for data_map in data_maps:
+            agg.sample_field(apm.DataField(data_map))
+        agg.define_bins()
+        for data_map in data_maps:
+            agg.add_field(apm.DataField(data_map))
+        assert agg.edges[0] == 0.0
+        assert agg.edges[-1] >= 249.0
+        assert sp.sum(agg.totals) == 300
+        #
+        # NaN values do not end up in the outer edges
+        nan_map = sp.arange(100.0).reshape(10, 10)
+        nan_map[0, 0] = sp.nan
+        agg = HistogramAggregate(num_bins=5)
+        agg.sample_field(apm.DataField(nan_map))
+        agg.add_field(apm.DataField(nan_map))
+        assert sp.all(sp.isfinite(agg.edges))
+        assert agg.edges[0] == 1.0
+        assert agg.edges[-1] >= 99.0
+        assert sp.sum(agg.totals) == 99
+
+    def test_process_files(self):
+        fixture_dir = os.path.join(FIXTURE_DIR, 'maps')
+        files = [os.path.join(fixture_dir, 'Fracture1ApertureMap-10avg.txt'),
+                 os.path.join(fixture_dir, 'parallel-plate-10vox.txt')]
+        #
+        agg = HistogramAggregate(edges=[0, 5, 10, 20])
+        agg.gen_output()
+        assert agg.outfile_content is None
+        agg.process_files(files, prefetch=0)
+        #
+        for infile, counts in zip(files, agg.counts):
+            data = apm.DataField(infile).data_vector
+            assert sp.all(counts == sp.histogram(data, bins=agg.edges)[0])
+        assert sp.all(agg.totals == agg.counts[0] + agg.counts[1])
+        #
+        agg.gen_output()
+        lines = agg.outfile_content.split('\n')
+        names = [os.path.basename(f) for f in files]
+        assert lines[1].split(',')[2:] == names + ['Total']
+        assert len(lines) == 2 + 3 + 2
+        #
+        agg.outfile_name = 'histogram-aggregate-test.csv'
+        agg.write_data(path=TEMP_DIR)
+        assert os.path.isfile(os.path.join(TEMP_DIR, agg.outfile_name))
+        #
+        # bins from the data cover every value of every map
+        # files can be any iterable, they are read twice to define the bins
+        agg = HistogramAggregate(bin_class=HistogramLogscale, scale_fact=10)
+        agg.process_files(iter(files))
+        num_vals = sum(apm.DataField(f).data_vector.size for f in files)
+        assert sp.sum(agg.totals) == num_vals
+        #
+        # maps are only read once when the sketch is already filled
+        sketch = agg.sketch
+        agg = HistogramAggregate(bin_class=HistogramLogscale, sketch=sketch,
+                                 scale_fact=10)
+        agg.process_files(iter(files))
+        assert len(agg.counts) == 2
+        assert sp.sum(agg.totals) == num_vals
@@ -9,6 +9,7 @@ Last Modifed: 2016/10/25
 import argparse
 import os
 from apmapflow.data_processing.percentiles import Percentiles
+from apmapflow.data_processing.quantile_sketch import QuantileSketch
 
 
 class TestPercentiles:
@@ -57,6 +58,14 @@ class TestPercentiles:
         #
         assert pctle.processed_data['{:4.2f}'.format(pctle.args['percentiles'][0])] == pctle.data_vector[0]
         assert pctle.processed_data['{:4.2f}'.format(pctle.args['percentiles'][-1])] == pctle.data_vector[-1]
+        #
+        # data is added to a sketch when supplied
+        sketch = QuantileSketch()
+        pctle.args['sketch'] = sketch
+        pctle._process_data()
+        pctle._process_data()
+        assert sketch.num_vals == 2 * pctle.data_vector.size
+        assert sketch.percentile(50) == pctle.processed_data['50.00']
 
     def test_output_data(self, data_field_class):
         r"""
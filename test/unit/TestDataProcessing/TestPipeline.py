@@ -0,0 +1,115 @@
+"""
+Handles testing of the ProcessingPipeline class
+"""
+import argparse
+import os
+import pytest
+from apmapflow.data_processing import Histogram, Percentiles
+from apmapflow.data_processing.pipeline import ProcessingPipeline
+from apmapflow.data_processing.quantile_sketch import QuantileSketch
+
+
+class TestPipeline:
+    r"""
+    Testing each method of the ProcessingPipeline class
+    """
+    def test_add_sub_parser(self):
+        parser = argparse.ArgumentParser()
+        parent = argparse.ArgumentParser(add_help=False)
+        subparsers = parser.add_subparsers()
+        ProcessingPipeline._add_subparser(subparsers, parent)
+        #
+        args = parser.parse_args(['pipeline', '-a', 'perc 10 50', '-a', 'hist 5'])
+        assert args.actions == ['perc 10 50', 'hist 5']
+        assert args.func is ProcessingPipeline
+        #
+        with pytest.raises(SystemExit):
+            parser.parse_args(['pipeline'])
+
+    def test_from_action_strings(self):
+        pipeline = ProcessingPipeline.from_action_strings([
+            'perc 10 50 -k {:3.1f}', 'hist 5', 'histrng 5 -r 10 90'
+        ])
+        assert len(pipeline.actions) == 3
+        cls, kwargs = pipeline.actions[0]
+        assert cls is Percentiles
+        assert kwargs['percentiles'] == [10.0, 50.0]
+        assert kwargs['key_format'] == '{:3.1f}'
+        assert pipeline.actions[1] == (Histogram, {'num_bins': 5})
+        assert pipeline.actions[2][1]['range'] == [10.0, 90.0]
+        #
+        with pytest.raises(SystemExit):
+            ProcessingPipeline.from_action_strings(['perc'])
+
+    def test_process(self, data_field_class):
+        pipeline = ProcessingPipeline([
+            (Percentiles, {'percentiles': [50.0, 10.0]}),
+            (Histogram, {'num_bins': 5})
+        ])
+        field = data_field_class()
+        perc, hist = pipeline.process(field)
+        #
+        # the sorted data is shared between processors
+        assert perc.percentile_engine is hist.percentile_engine
+        assert list(perc.processed_data.values()) == [10, 50]
+        #
+        single = Histogram(field, num_bins=5)
+        single.process()
+        assert hist.processed_data == single.processed_data
+        #
+        # arguments are not shared between files
+        assert pipeline.actions[0][1]['percentiles'] == [50.0, 10.0]
+
+    def test_process_files(self):
+        infile = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-01vox.txt')
+        output_dir = os.path.join(TEMP_DIR, 'pipeline')
+        os.makedirs(output_dir, exist_ok=True)
+        pipeline = ProcessingPipeline.from_action_strings([
+            'perc 10 50 90', 'hist 5'
+        ])
+        #
+        outputs = pipeline.process_file(infile, screen=True)
+        assert outputs[0][0] == 'parallel-plate-01vox-percentiles.txt'
+        assert outputs[0][1].replace('\t', ',') == outputs[0][2]
+        assert outputs[1][0] == 'parallel-plate-01vox-histogram.txt'
+        #
+        # files can be any iterable, including a generator
+        for workers in [1, 2]:
+            pipeline.process_files(iter([infile]), output_dir=output_dir,
+                                   workers=workers, overwrite=True)
+            for outfile_name, _, content, _ in outputs:
+                with open(os.path.join(output_dir, outfile_name)) as file:
+                    assert file.read() == content
+        #
+        with pytest.raises(FileExistsError):
+            pipeline.process_files([infile], output_dir=output_dir)
+
+    def test_sketch_file(self):
+        fixture_dir = os.path.join(FIXTURE_DIR, 'maps')
+        files = [os.path.join(fixture_dir, 'parallel-plate-01vox.txt'),
+                 os.path.join(fixture_dir, 'parallel-plate-10vox.txt')]
+        output_dir = os.path.join(TEMP_DIR, 'pipeline-sketch')
+        os.makedirs(output_dir, exist_ok=True)
+        sketch_file = os.path.join(output_dir, 'maps.sketch')
+        if os.path.exists(sketch_file):
+            os.remove(sketch_file)
+        #
+        action = 'perc 25 75 --sketch {}'.format(sketch_file)
+        pipeline = ProcessingPipeline.from_action_strings([action])
+        for workers in [1, 2]:
+            pipeline.process_files(files, output_dir=output_dir,
+                                   workers=workers, overwrite=True)
+        #
+        # the second run replaces the sketch of the first
+        sketch = QuantileSketch.load(sketch_file)
+        assert sketch.num_vals == 2 * 10000
+        assert list(sketch.percentiles([25, 75])) == [1.0, 10.0]
+        #
+        pipeline = ProcessingPipeline.from_action_strings([action + ' --append'])
+        pipeline.process_files(files[:1], output_dir=output_dir, overwrite=True)
+        sketch = QuantileSketch.load(sketch_file)
+        assert sketch.num_vals == 3 * 10000
+        assert list(sketch.percentiles([25, 75])) == [1.0, 10.0]
+        with open(os.path.join(output_dir, 'maps-percentiles.csv')) as file:
+            content = file.read()
+        assert content.split('\n')[2:4] == ['25.00,1.0', '75.00,10.0']
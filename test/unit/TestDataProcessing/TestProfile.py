@@ -45,6 +45,12 @@ class TestProfile:
         assert args.axis == 'z'
         assert args.locations == [5, 20, 50]
         #
+        cargs = 'prof both 5 --band 2 --text-fmt %.3e'.split()
+        args = parser.parse_args(cargs)
+        assert args.axis == 'both'
+        assert args.band == 2
+        assert args.text_fmt == '%.3e'
+        #
         cargs = 'prof y 5'.split()
         with pytest.raises(SystemExit):
             args = parser.parse_args(cargs)
@@ -67,6 +73,16 @@ class TestProfile:
         assert sp.all(prof.processed_data[fmt.format(50)] == prof.data_map[:, 5])
         assert sp.all(prof.processed_data[fmt.format(100)] == prof.data_map[:, 9])
         #
+        # both axes with profiles averaged over neighboring lines
+        prof.args = {'axis': 'both', 'locations': [0, 50], 'band': 1}
+        prof._process_data()
+        assert list(prof.processed_data.keys()) == ['x', 'z']
+        profiles = prof.processed_data['x']
+        assert sp.all(profiles[fmt.format(0)] == prof.data_map[0:2, :].mean(axis=0))
+        assert sp.all(profiles[fmt.format(50)] == prof.data_map[4:7, :].mean(axis=0))
+        profiles = prof.processed_data['z']
+        assert sp.all(profiles[fmt.format(50)] == prof.data_map[:, 4:7].mean(axis=1))
+        #
         prof.args = {'axis': 'y', 'locations': [0, 50, 100]}
         prof._process_data()
         assert prof.processed_data is None
@@ -90,3 +106,17 @@ class TestProfile:
         #
         prof._output_data(delim='\t')
         assert prof.outfile_content
+        lines = prof.outfile_content.split('\n')
+        assert lines[1] == 'Location: 0.00%\t'
+        assert lines[2] == '\t'.join(str(val) for val in prof.data_map[0, :])
+        #
+        prof.args = {'axis': 'both', 'locations': [50], 'text_fmt': '%.1f'}
+        prof._process_data()
+        prof.outfile_name = 'test-profile.txt'
+        prof._output_data()
+        assert prof.outfile_name == 'test-profile-profiles-XZ-axis.txt'
+        lines = prof.outfile_content.split('\n')
+        assert lines[0].startswith('X-axis profile data')
+        assert lines[2] == ','.join('{:.1f}'.format(v) for v in prof.data_map[5, :])
+        assert lines[4].startswith('Z-axis profile data')
+        assert lines[6] == ','.join('{:.1f}'.format(v) for v in prof.data_map[:, 5])
@@ -0,0 +1,75 @@
+"""
+Handles testing of the QuantileSketch class
+"""
+import os
+import pytest
+import numpy as np
+import apmapflow as apm
+from apmapflow.data_processing.quantile_sketch import QuantileSketch
+
+
+class TestQuantileSketch:
+    r"""
+    Testing each method of the QuantileSketch class
+    """
+    def test_exact(self):
+        r"""
+        Small datasets are stored exactly and match calc_percentile
+        """
+        sketch = QuantileSketch(k=100)
+        with pytest.raises(ValueError):
+            sketch.percentile(50)
+        #
+        data = np.arange(90.0)[::-1]
+        sketch.update(data)
+        assert sketch.rank_error() == 0.0
+        percs = [0, 1, 33.3, 50, 99, 100]
+        for perc, value in zip(percs, sketch.percentiles(percs)):
+            assert value == apm.calc_percentile(perc, data)
+        #
+        # NaN values are not added
+        sketch.update([np.nan, 90.0])
+        assert len(sketch) == 91
+        assert sketch.percentile(100) == 90.0
+
+    def test_accuracy(self):
+        r"""
+        Estimates from merged sketches are within the rank error bound
+        """
+        rng = np.random.default_rng(0)
+        data = rng.lognormal(size=200000)
+        sketch = QuantileSketch(seed=1)
+        for i, part in enumerate(np.array_split(data, 5)):
+            part_sketch = QuantileSketch(seed=i)
+            part_sketch.update(part)
+            sketch.merge(part_sketch)
+        #
+        assert len(sketch) == data.size
+        assert sketch.num_retained < 1000
+        assert 0 < sketch.rank_error() < 0.02
+        #
+        percs = np.linspace(0, 100, 101)
+        ranks = apm.calc_percentile_num(sketch.percentiles(percs), data)
+        assert np.all(np.abs(ranks - percs / 100.0) <= sketch.rank_error())
+
+    def test_update_field(self):
+        data_map = np.arange(1000.0).reshape(40, 25)
+        sketch = QuantileSketch()
+        sketch.update_field(apm.DataField(data_map))
+        sketch.update_field(apm.TiledDataField(data_map, tile_size=7))
+        assert len(sketch) == 2000
+        assert sketch.rank_error() > 0
+
+    def test_save_load(self):
+        sketch = QuantileSketch(k=50, seed=0)
+        sketch.update(np.arange(5000.0))
+        #
+        fname = os.path.join(TEMP_DIR, 'test.sketch')
+        sketch.save(fname)
+        assert os.path.isfile(fname)
+        loaded = QuantileSketch.load(fname)
+        #
+        assert loaded.k == 50
+        assert len(loaded) == len(sketch)
+        percs = [0, 10, 50, 90, 100]
+        assert np.all(loaded.percentiles(percs) == sketch.percentiles(percs))
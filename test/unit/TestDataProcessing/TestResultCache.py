@@ -0,0 +1,132 @@
+"""
+Handles testing of the result cache
+"""
+import os
+import pytest
+import scipy as sp
+import apmapflow as apm
+from apmapflow.data_processing import Histogram, Percentiles, QuantileSketch
+from apmapflow.data_processing import result_cache
+
+
+class TestResultCache:
+    r"""
+    Tests storing and loading processed data from the result cache
+    """
+    def test_key(self, data_field_class):
+        field = data_field_class()
+        hist = Histogram(field, num_bins=5)
+        key = result_cache.ResultCache.key(hist)
+        #
+        # output options and the file location do not change the key
+        hist2 = Histogram(field, num_bins=5, output_dir='.', force=True)
+        hist2.infile = 'other-file.txt'
+        assert result_cache.ResultCache.key(hist2) == key
+        #
+        assert result_cache.ResultCache.key(Histogram(field, num_bins=6)) != key
+        assert result_cache.ResultCache.key(Percentiles(field, num_bins=5)) != key
+        data_map = sp.array(field.data_map)
+        data_map[0, 0] = -1
+        other = Histogram(apm.DataField(data_map), num_bins=5)
+        assert result_cache.ResultCache.key(other) != key
+        #
+        tiled = apm.TiledDataField(field.data_map, tile_size=3)
+        assert result_cache.ResultCache.key(Histogram(tiled, num_bins=5)) == key
+        #
+        # changing the version of a processor invalidates its entries
+
+        class NewHistogram(Histogram):
+            pass
+        NewHistogram.__name__ = Histogram.__name__
+        NewHistogram.__module__ = Histogram.__module__
+        new_hist = NewHistogram(field, num_bins=5)
+        assert result_cache.ResultCache.key(new_hist) == key
+        NewHistogram._cache_version = Histogram._cache_version + 1
+        assert result_cache.ResultCache.key(new_hist) != key
+        #
+        sketch = QuantileSketch()
+        perc = Percentiles(field, percentiles=[50], sketch=sketch)
+        assert result_cache.ResultCache.key(perc) is None
+
+    def test_process(self, data_field_class):
+        r"""
+        Results are loaded from the cache without processing the data
+        """
+        cache_dir = os.path.join(TEMP_DIR, 'result-cache')
+        cache = result_cache.enable_result_cache(cache_dir)
+        cache.clear()
+        try:
+            hist = Histogram(data_field_class(), num_bins=5)
+            hist.process()
+            assert len(cache.entries()) == 1
+            #
+            cached = Histogram(data_field_class(), num_bins=5)
+            cached._process_data = None
+            cached.process()
+            assert cached.processed_data == hist.processed_data
+            assert cached.bins == hist.bins
+            #
+            cached.gen_output()
+            hist.gen_output()
+            assert cached.outfile_content == hist.outfile_content
+            #
+            # keyword arguments bypass the cache
+            with pytest.raises(TypeError):
+                cached.process(preserve_bins=True)
+        finally:
+            result_cache.disable_result_cache()
+        #
+        assert result_cache.get_result_cache() is None
+        cache.clear()
+
+    def test_store_load(self):
+        cache_dir = os.path.join(TEMP_DIR, 'result-cache-evict')
+        cache = result_cache.ResultCache(cache_dir)
+        cache.clear()
+        #
+        assert cache.load('missing') is None
+        state = {'processed_data': sp.arange(10000.0)}
+        path = cache.store('a', state)
+        assert os.path.isfile(path)
+        assert sp.all(cache.load('a')['processed_data'] == sp.arange(10000.0))
+        #
+        # each entry is ~80 KB so the cache can hold two of them
+        cache.max_size = 0.2
+        os.utime(path, ns=(0, 0))
+        cache.store('b', state)
+        cache.store('c', state)
+        assert cache.load('a') is None
+        assert cache.load('b') is not None
+        #
+        with open(cache.entry_path('d'), 'w') as file:
+            file.write('not a pickle')
+        assert cache.load('d') is None
+        assert not os.path.exists(cache.entry_path('d'))
+        #
+        # pickles of classes that no longer exist are treated as a miss
+        with open(cache.entry_path('e'), 'wb') as file:
+            file.write(b'\x80\x04capmapflow.missing_module\nThing\n.')
+        assert cache.load('e') is None
+        assert not os.path.exists(cache.entry_path('e'))
+        cache.clear()
+
+    def test_result_cache_env(self):
+        r"""
+        Tests the cache is enabled from the environment when first requested
+        and invalid sizes fall back to the default
+        """
+        cache_dir = os.path.join(TEMP_DIR, 'result-cache-env')
+        os.environ[result_cache.CACHE_DIR_ENV] = cache_dir
+        os.environ[result_cache.CACHE_SIZE_ENV] = 'not-a-size'
+        try:
+            result_cache._result_cache_env = True
+            cache = result_cache.get_result_cache()
+            assert cache.cache_dir == os.path.realpath(cache_dir)
+            assert cache.max_size == result_cache.DEFAULT_CACHE_SIZE
+            #
+            result_cache.disable_result_cache()
+            assert result_cache.get_result_cache() is None
+        finally:
+            del os.environ[result_cache.CACHE_DIR_ENV]
+            del os.environ[result_cache.CACHE_SIZE_ENV]
+            result_cache.disable_result_cache()
@@ -0,0 +1,117 @@
+"""
+Handles testing of the image_io module
+"""
+import os
+import pytest
+import scipy as sp
+from PIL import Image
+import apmapflow as apm
+import apmapflow.image_io as image_io
+
+
+class TestImageIO:
+    r"""
+    Tests memory mapping of image stacks
+    """
+
+    @staticmethod
+    def _image_data():
+        img_data = sp.zeros((13, 9, 6), dtype=sp.uint8)
+        img_data[2:10, 3:6, :] = 255
+        img_data[0, 8, 5] = 255
+        return img_data
+
+    def test_memmap_tiff(self):
+        r"""
+        Checks uncompressed stacks are mapped and other files rejected
+        """
+        img_data = self._image_data()
+        fname = os.path.join(TEMP_DIR, 'memmap-test.tif')
+        stack = apm.FractureImageStack(img_data, dtype=sp.uint8)
+        stack.save(fname, overwrite=True)
+        #
+        shape, dtype, offset, page_stride = image_io.tiff_stack_layout(fname)
+        assert shape == img_data.shape
+        assert dtype == sp.uint8
+        assert page_stride >= 13 * 9
+        #
+        stack = apm.FractureImageStack.memmap(fname)
+        assert isinstance(stack, apm.FractureImageStack)
+        assert sp.all(stack == img_data)
+        assert not stack.flags.writeable
+        assert sp.all(apm.FractureImageStack(fname) == img_data.astype(bool))
+        #
+        # copy-on-write maps can be modified without changing the file
+        stack = apm.FractureImageStack.memmap(fname, mode='c')
+        stack[0, 0, 0] = 1
+        assert apm.FractureImageStack.memmap(fname)[0, 0, 0] == 0
+        #
+        frames = [Image.fromarray(img_data[:, :, i].T) for i in range(6)]
+        fname = os.path.join(TEMP_DIR, 'memmap-test-lzw.tif')
+        frames[0].save(fname, save_all=True, append_images=frames[1:],
+                       compression='tiff_lzw')
+        with pytest.raises(ValueError):
+            image_io.memmap_tiff(fname)
+        assert sp.all(apm.FractureImageStack(fname) == img_data.astype(bool))
+        #
+        # PIL inverts images where zero is white
+        fname = os.path.join(FIXTURE_DIR, 'binary-fracture-small.tif')
+        with pytest.raises(ValueError):
+            image_io.memmap_tiff(fname)
+        #
+        fname = os.path.join(TEMP_DIR, 'memmap-test.txt')
+        with open(fname, 'w') as file:
+            file.write('not an image')
+        with pytest.raises(ValueError):
+            image_io.memmap_tiff(fname)
+
+    def test_memmap_tiff_16bit(self):
+        img_data = (sp.arange(7 * 5 * 3).reshape(7, 5, 3) * 999)
+        img_data = img_data.astype(sp.uint16)
+        frames = [Image.fromarray(img_data[:, :, i].T.copy()) for i in range(3)]
+        fname = os.path.join(TEMP_DIR, 'memmap-test-16bit.tif')
+        frames[0].save(fname, save_all=True, append_images=frames[1:])
+        #
+        stack = image_io.memmap_tiff(fname)
+        assert stack.dtype == sp.uint16
+        assert sp.all(stack == img_data)
+
+    def test_memmap_raw(self):
+        img_data = self._image_data()
+        fname = os.path.join(TEMP_DIR, 'memmap-test.raw')
+        with open(fname, 'wb') as file:
+            file.write(b'HEADER')
+            file.write(sp.ascontiguousarray(img_data.transpose(2, 1, 0)))
+        #
+        stack = apm.FractureImageStack.memmap(fname, shape=img_data.shape,
+                                              offset=6)
+        assert sp.all(stack == img_data)
+        #
+        maps = apm.FractureImageStack.extract_maps(stack)
+        aper_map = apm.FractureImageStack(img_data).create_aperture_map()
+        assert sp.all(maps['aperture'] == aper_map)
+
+    def test_memmap_maps(self):
+        r"""
+        Checks maps of stacks holding raw pixel values count nonzero voxels
+        """
+        img_data = self._image_data()
+        img_data[5, 7, 2] = 1
+        fname = os.path.join(TEMP_DIR, 'memmap-maps.tif')
+        stack = apm.FractureImageStack(img_data, dtype=sp.uint8)
+        stack.save(fname, overwrite=True)
+        #
+        stack = apm.FractureImageStack.memmap(fname)
+        bool_stack = apm.FractureImageStack(img_data)
+        for axis in [0, 1, 2]:
+            aper_map = stack.create_aperture_map(axis=axis)
+            assert sp.all(aper_map == bool_stack.create_aperture_map(axis=axis))
+        assert stack.create_aperture_map()[2, 5] == 4
+        assert sp.all(stack.create_offset_map() == bool_stack.create_offset_map())
+        #
+        # inverting a stack of pixel values swaps zero and nonzero pixels
+        inverted = ~stack
+        assert inverted.dtype == bool
+        assert sp.all(inverted == ~bool_stack)
+        aper_map = inverted.create_aperture_map()
+        assert sp.all(aper_map == 9 - bool_stack.create_aperture_map())
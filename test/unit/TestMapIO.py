@@ -0,0 +1,222 @@
+"""
+Handles testing of the map_io module
+"""
+import os
+import pytest
+import scipy as sp
+import apmapflow as apm
+import apmapflow.map_io as map_io
+
+
+class TestMapIO:
+    r"""
+    Tests reading of data maps and the binary map cache
+    """
+
+    def test_sniff_delimiter(self):
+        r"""
+        Checks delimiters are determined from the first line of a file
+        """
+        fname = os.path.join(TEMP_DIR, 'sniff-test.txt')
+        for delim, expected in [('\t', None), (' ', None), (',', ',')]:
+            with open(fname, 'w') as file:
+                file.write(delim.join(['1.0', '-2.5e-3', '3']) + '\n')
+            assert map_io.sniff_delimiter(fname) == expected
+
+    def test_read_text_map(self):
+        r"""
+        Compares the chunked reader to loadtxt for each delimiter
+        """
+        data_map = sp.arange(175, dtype=float).reshape(25, 7) / 7.0 - 3.0
+        fname = os.path.join(TEMP_DIR, 'read-text-map.txt')
+        for delim in ['\t', ' ', ',']:
+            sp.savetxt(fname, data_map, delimiter=delim)
+            file_delim = None if delim == ' ' else delim
+            for chunk_size in [1, 100, 2**20]:
+                test_map = map_io.read_text_map(fname, delim=file_delim,
+                                                num_threads=2,
+                                                chunk_size=chunk_size)
+                assert sp.all(test_map == data_map)
+        #
+        # single row maps, blank lines and bad rows match loadtxt
+        for content in ['1,2,3\r\n', '1,2\n\n3,4\n\n', '1,2\n3\n']:
+            with open(fname, 'w') as file:
+                file.write(content)
+            try:
+                expected = sp.loadtxt(fname, delimiter=',')
+            except ValueError:
+                with pytest.raises(ValueError):
+                    map_io.read_text_map(fname, delim=',', chunk_size=1)
+                continue
+            test_map = map_io.read_text_map(fname, delim=',', chunk_size=1)
+            assert test_map.shape == expected.shape
+            assert sp.all(test_map == expected)
+
+    def test_default_num_threads(self):
+        r"""
+        Checks the default thread count is divided between worker processes
+        """
+        num_cpus = os.cpu_count() or 1
+        try:
+            map_io.set_num_workers(2 * num_cpus)
+            assert map_io.default_num_threads() == 1
+            map_io.set_num_workers(1)
+            assert map_io.default_num_threads() == num_cpus
+        finally:
+            map_io.set_num_workers(1)
+
+    def test_binary_formats(self):
+        r"""
+        Tests writing and reading maps in each binary format
+        """
+        assert map_io.get_map_format('map.NPY') == 'npy'
+        assert map_io.get_map_format('map.csv') == 'txt'
+        assert map_io.map_file_name('map.txt', 'raw') == 'map.raw'
+        assert map_io.map_file_name('map.csv', 'txt') == 'map.csv'
+        with pytest.raises(ValueError):
+            map_io.map_file_name('map.txt', 'tif')
+        #
+        data_map = sp.arange(12, dtype=sp.float32).reshape(3, 4)
+        field = apm.DataField(data_map)
+        for fmt in ['txt', 'npy', 'npz', 'raw']:
+            fname = os.path.join(TEMP_DIR, 'binary-map.' + fmt)
+            field.save(fname, overwrite=True)
+            with pytest.raises(FileExistsError):
+                field.save(fname)
+            #
+            test_field = apm.DataField(fname)
+            assert test_field.data_map.shape == (3, 4)
+            assert sp.all(test_field.data_map == data_map)
+            if fmt in ['npy', 'raw']:
+                assert isinstance(test_field.data_map, sp.memmap)
+                assert test_field.data_map.dtype == sp.float32
+        #
+        # memory mapped files are not modified by thresholding
+        test_field.threshold_data(min_value=5)
+        assert sp.all(map_io.load_data_map(fname) == data_map)
+        #
+        # the format argument overrides the extension
+        fname = os.path.join(TEMP_DIR, 'binary-map.dat')
+        map_io.save_data_map(fname, data_map, fmt='raw')
+        assert sp.all(map_io.read_raw_map(fname) == data_map)
+        with pytest.raises(ValueError):
+            map_io.read_raw_map(os.path.join(TEMP_DIR, 'binary-map.txt'))
+
+    def test_map_cache(self):
+        r"""
+        Tests storing, loading and invalidation of cached maps
+        """
+        cache_dir = os.path.join(TEMP_DIR, 'map-cache')
+        cache = map_io.MapCache(cache_dir)
+        cache.clear()
+        #
+        fname = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-01vox.txt')
+        data_map = sp.loadtxt(fname, delimiter='\t')
+        assert cache.load(fname, 'auto') is None
+        #
+        path = cache.store(fname, data_map, 'auto')
+        assert os.path.isfile(path)
+        assert cache.load(fname, ',') is None
+        cached_map = cache.load(fname, 'auto')
+        assert isinstance(cached_map, sp.memmap)
+        assert sp.all(cached_map == data_map)
+        #
+        # cached maps are copy-on-write
+        cached_map[0, 0] = -1
+        assert sp.all(cache.load(fname, 'auto') == data_map)
+        #
+        # modifying the source file invalidates the entry
+        fname = os.path.join(TEMP_DIR, 'cache-test-map.txt')
+        sp.savetxt(fname, data_map, delimiter='\t')
+        cache.store(fname, data_map)
+        with open(fname, 'a') as file:
+            file.write('\n')
+        assert cache.load(fname) is None
+        cache.clear()
+        assert not cache.entries()
+
+    def test_map_cache_env(self):
+        r"""
+        Tests the cache is enabled from the environment when first requested
+        and invalid sizes fall back to the default
+        """
+        cache_dir = os.path.join(TEMP_DIR, 'map-cache-env')
+        os.environ[map_io.CACHE_DIR_ENV] = cache_dir
+        os.environ[map_io.CACHE_SIZE_ENV] = 'not-a-size'
+        try:
+            map_io._map_cache_env = True
+            cache = map_io.get_map_cache()
+            assert cache.cache_dir == os.path.realpath(cache_dir)
+            assert cache.max_size == map_io.DEFAULT_CACHE_SIZE
+            #
+            os.environ[map_io.CACHE_SIZE_ENV] = '10'
+            assert map_io.env_cache_size(map_io.CACHE_SIZE_ENV, 1) == 10.0
+            #
+            # disabling the cache prevents the environment being used again
+            apm.disable_map_cache()
+            assert map_io.get_map_cache() is None
+        finally:
+            del os.environ[map_io.CACHE_DIR_ENV]
+            del os.environ[map_io.CACHE_SIZE_ENV]
+            apm.disable_map_cache()
+
+    def test_map_cache_eviction(self):
+        r"""
+        Tests least recently used entries are removed first
+        """
+        cache_dir = os.path.join(TEMP_DIR, 'map-cache-evict')
+        cache = map_io.MapCache(cache_dir)
+        cache.clear()
+        #
+        # each map is ~80 KB so the cache can hold two of them
+        cache.max_size = 0.2
+        data_map = sp.ones((100, 100))
+        fnames = []
+        for i in range(3):
+            fname = os.path.join(TEMP_DIR, 'evict-test-{}.txt'.format(i))
+            with open(fname, 'w') as file:
+                file.write(str(i))
+            fnames.append(fname)
+        #
+        cache.store(fnames[0], data_map)
+        cache.store(fnames[1], data_map)
+        os.utime(cache.entry_path(fnames[1]), ns=(0, 0))
+        cache.load(fnames[0])
+        cache.store(fnames[2], data_map)
+        #
+        assert len(cache.entries()) == 2
+        assert cache.load(fnames[0]) is not None
+        assert cache.load(fnames[1]) is None
+        assert cache.load(fnames[2]) is not None
+        cache.clear()
+
+    def test_load_data_map(self):
+        r"""
+        Tests loading maps with and without the cache enabled
+        """
+        fname = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-01vox.txt')
+        data_map = map_io.load_data_map(fname)
+        assert data_map.shape == (100, 100)
+        threaded_map = map_io.load_data_map(fname, num_threads=2)
+        assert sp.all(threaded_map == data_map)
+        #
+        cache_dir = os.path.join(TEMP_DIR, 'map-cache-load')
+        cache = apm.enable_map_cache(cache_dir)
+        try:
+            cache.clear()
+            field = apm.DataField(fname)
+            assert len(cache.entries()) == 1
+            field = apm.DataField(fname)
+            assert isinstance(field.data_map, sp.memmap)
+            assert sp.all(field.data_map == data_map)
+            #
+            field.threshold_data(min_value=10)
+            assert sp.all(map_io.load_data_map(fname) == data_map)
+            #
+            data_map = map_io.load_data_map(fname, use_cache=False)
+            assert not isinstance(data_map, sp.memmap)
+            cache.clear()
+        finally:
+            apm.disable_map_cache()
+        #
+        assert map_io.get_map_cache() is None
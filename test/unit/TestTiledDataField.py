@@ -0,0 +1,103 @@
+"""
+Handles testing of the tiled data field module
+"""
+import os
+import pytest
+import scipy as sp
+import apmapflow as apm
+from apmapflow.data_processing import Histogram, Percentiles
+
+
+class TestTiledDataField:
+    r"""
+    Tests the tile-by-tile processing of memory mapped data maps
+    """
+
+    def test_tiled_data_field(self):
+        r"""
+        Loads text and binary maps and checks the tiling properties
+        """
+        fname = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-01vox.txt')
+        field = apm.TiledDataField(fname, tile_size=30)
+        assert isinstance(field.data_map, sp.memmap)
+        assert field.nx == 100
+        assert field.nz == 100
+        assert field.num_tiles == 4
+        assert [rows.stop for rows in field.tile_slices()] == [30, 60, 90, 100]
+        #
+        fname = os.path.join(TEMP_DIR, 'tiled-field.npy')
+        field.save(fname, overwrite=True)
+        field = apm.TiledDataField(fname, tile_memory=0.01)
+        assert field.tile_size == 3
+        assert sp.all(field.data_map == 1)
+        #
+        with pytest.raises(ValueError):
+            apm.TiledDataField(sp.ones(10))
+
+    def test_temporary_files(self):
+        r"""
+        Checks text maps are converted in the temp_dir or cache directory
+        and no temporary files are left behind
+        """
+        fname = os.path.join(FIXTURE_DIR, 'maps', 'parallel-plate-01vox.txt')
+        temp_dir = os.path.join(TEMP_DIR, 'tiled-temp')
+        os.makedirs(temp_dir, exist_ok=True)
+        field = apm.TiledDataField(fname, temp_dir=temp_dir)
+        assert os.path.dirname(field.data_map.filename) == temp_dir
+        del field
+        assert os.listdir(temp_dir) == []
+        #
+        cache = apm.enable_map_cache(os.path.join(TEMP_DIR, 'tiled-cache'))
+        try:
+            cache.clear()
+            field = apm.TiledDataField(fname, temp_dir=temp_dir)
+            assert os.path.dirname(field.data_map.filename) == cache.cache_dir
+            assert len(os.listdir(cache.cache_dir)) == 1
+            del field
+            cache.clear()
+        finally:
+            apm.disable_map_cache()
+        #
+        # a failed conversion removes the temporary file
+        bad_file = os.path.join(temp_dir, 'bad-map.txt')
+        with open(bad_file, 'w') as file:
+            file.write('1,2\n3\n')
+        with pytest.raises(ValueError):
+            apm.TiledDataField(bad_file, delim=',')
+        assert os.listdir(temp_dir) == ['bad-map.txt']
+        os.remove(bad_file)
+
+    def test_tiled_statistics(self):
+        r"""
+        Compares tiled statistics and processors to the in memory versions
+        """
+        data_map = sp.arange(-1000, 1100, dtype=float).reshape(30, 70)
+        data_map = sp.sin(data_map) * 100
+        data_map[0:5, :] = sp.around(data_map[0:5, :])
+        field = apm.TiledDataField(data_map, tile_size=4)
+        #
+        percs = [0, 1, 10, 50, 90, 99, 100]
+        values = [apm.calc_percentile(perc, data_map.ravel()) for perc in percs]
+        assert field.percentiles(percs) == values
+        assert field.percentiles(percs, collect_size=0) == values
+        assert field.data_range() == (data_map.min(), data_map.max())
+        #
+        edges = sp.linspace(-100, 100, 11)
+        counts = sp.histogram(data_map, bins=edges)[0]
+        assert sp.all(field.histogram(edges) == counts)
+        #
+        for cls, kwargs in [(Percentiles, {'percentiles': percs}),
+                            (Histogram, {'num_bins': 10})]:
+            tiled_proc = cls(field, **kwargs)
+            assert tiled_proc.tiled_field is field
+            assert not tiled_proc.data_vector.flags.writeable
+            tiled_proc.process()
+            #
+            proc = cls(apm.DataField(data_map), **kwargs)
+            proc.process()
+            assert tiled_proc.processed_data == proc.processed_data
+        #
+        # in memory arrays are copied before thresholding
+        field.threshold_data(min_value=0, repl=0)
+        assert field.data_range()[0] == 0
+        assert data_map.min() < 0